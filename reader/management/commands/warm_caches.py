@@ -0,0 +1,22 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from sefaria.warmup import warm_caches, read_refs
+
+
+class Command(BaseCommand):
+    help = "Populates the text caches, optionally preloading the most requested refs, and reports the time of each stage."
+    option_list = BaseCommand.option_list + (
+        make_option("--refs", dest="refs", default=None,
+                    help="File of refs, one per line, most requested first"),
+        make_option("--count", dest="count", type="int", default=1000,
+                    help="Number of refs to preload from --refs"),
+    )
+
+    def handle(self, *args, **options):
+        refs = read_refs(options["refs"], options["count"]) if options["refs"] else None
+        timings = warm_caches(refs)
+        for stage, seconds in timings.iteritems():
+            self.stdout.write("{:<20} {:8.2f}s\n".format(stage, seconds))
+        self.stdout.write("{:<20} {:8.2f}s\n".format("total", sum(timings.values())))
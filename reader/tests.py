@@ -66,6 +66,17 @@ class PagesTest(SefariaTestCase):
         response = c.get('/texts')
         self.assertEqual(200, response.status_code)
 
+    def test_text_toc_cached(self):
+        from reader.views import toc_html_cache, _toc_html_key
+        from sefaria.model import VersionState
+        response = c.get('/Genesis')
+        self.assertEqual(200, response.status_code)
+        key = _toc_html_key("Genesis", "toc", "Genesis", 1)
+        self.assertTrue(toc_html_cache.get(key) in response.content.decode("utf-8"))
+
+        VersionState("Genesis").refresh()
+        self.assertNotEqual(key, _toc_html_key("Genesis", "toc", "Genesis", 1))
+
     def test_dashboard(self):
         response = c.get('/dashboard')
         self.assertEqual(200, response.status_code)
@@ -198,6 +209,18 @@ class ApiTest(SefariaTestCase):
         self.assertEqual(data["sections"],    ["2a", 1, 1])
         self.assertEqual(data["toSections"],  ["2a", 1, 1])
 
+    def test_api_get_text_not_modified(self):
+        response = c.get('/api/texts/Genesis.1')
+        etag = response["ETag"]
+        self.assertEqual(304, c.get('/api/texts/Genesis.1', HTTP_IF_NONE_MATCH=etag).status_code)
+        self.assertEqual(200, c.get('/api/texts/Genesis.1?commentary=0', HTTP_IF_NONE_MATCH=etag).status_code)
+
+        from sefaria.model import mark_modified
+        mark_modified(["Genesis"])
+        response = c.get('/api/texts/Genesis.1', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+        self.assertNotEqual(etag, response["ETag"])
+
     def test_api_get_text_range(self):
         response = c.get('/api/texts/Job.5:2-4')
         self.assertEqual(200, response.status_code)
@@ -254,6 +277,19 @@ class ApiTest(SefariaTestCase):
         self.assertTrue(len(data[0]["contents"][0]["contents"]) == 5)
         self.assertTrue(data[-1]["category"] == "Other")
 
+    def test_api_get_toc_compressed(self):
+        import gzip
+        from StringIO import StringIO
+        plain = c.get('/api/index')
+        response = c.get('/api/index', HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual("gzip", response["Content-Encoding"])
+        self.assertEqual(plain.content, gzip.GzipFile(fileobj=StringIO(response.content)).read())
+        self.assertNotEqual(plain["ETag"], response["ETag"])
+        self.assertEqual(304, c.get('/api/index', HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=response["ETag"]).status_code)
+        self.assertEqual(200, c.get('/api/index', HTTP_IF_NONE_MATCH=response["ETag"]).status_code)
+        self.assertFalse(c.get('/api/index', HTTP_ACCEPT_ENCODING="gzip;q=0, deflate").has_header("Content-Encoding"))
+        self.assertEqual("gzip", c.get('/api/index', HTTP_ACCEPT_ENCODING="deflate, *;q=0.5")["Content-Encoding"])
+
     def text_api_get_books(self):
         response = c.get('/api/index/titles/')
         self.assertEqual(200, response.status_code)  
@@ -4,6 +4,7 @@ from sets import Set
 from random import choice
 from pprint import pprint
 import json
+import hashlib
 import dateutil.parser
 
 from bson.json_util import dumps
@@ -14,25 +15,27 @@ from django.contrib.auth.decorators import login_required
 from django.utils.http import urlquote
 from django.utils.encoding import iri_to_uri
 from django.views.decorators.csrf import ensure_csrf_cookie, csrf_exempt, csrf_protect
+from django.views.decorators.http import condition
 from django.contrib.auth.models import User
 from sefaria.client.wrapper import format_object_for_client, format_note_object_for_client, get_notes, get_links
 from sefaria.system.exceptions import InputError, PartialRefInputError, BookNameError
 # noinspection PyUnresolvedReferences
-from sefaria.client.util import jsonResponse
+from sefaria.client.util import jsonResponse, payloadResponse, payload_etag
 from sefaria.history import text_history, get_maximal_collapsed_activity, top_contributors, make_leaderboard, make_leaderboard_condition, text_at_revision
 from sefaria.system.decorators import catch_error_as_json, catch_error_as_http
 from sefaria.workflows import *
 from sefaria.reviews import *
-from sefaria.summaries import get_toc, flatten_toc, get_or_make_summary_node, REORDER_RULES
+from sefaria.summaries import get_toc, get_toc_payload, flatten_toc, get_or_make_summary_node, find_summary_node, REORDER_RULES
 from sefaria.model import *
 from sefaria.sheets import LISTED_SHEETS, get_sheets_for_ref
-from sefaria.utils.users import user_link, user_started_text
+from sefaria.utils.users import user_link, user_started_text, resolve_users
 from sefaria.utils.util import list_depth, text_preview
 from sefaria.utils.hebrew import hebrew_plural, hebrew_term, encode_hebrew_numeral, encode_hebrew_daf, is_hebrew, strip_cantillation
 from sefaria.utils.talmud import section_to_daf, daf_to_section
 from sefaria.datatype.jagged_array import JaggedArray
 import sefaria.utils.calendars
 import sefaria.tracker as tracker
+import sefaria.system.cache as scache
 
 import logging
 logger = logging.getLogger(__name__)
@@ -257,6 +260,27 @@ def edit_text_info(request, title=None, new_title=None):
                              RequestContext(request))
 
 
+toc_html_cache = scache.namespace("toc_html", local_size=200)
+TOC_HTML_CACHE_DURATION = 60 * 60 * 24 * 7
+
+
+def _toc_html_key(title, *params):
+    """
+    Returns a cache key for TOC HTML of the text `title` made with `params`, which changes whenever
+    the text's Index or VersionState does (see :mod:`sefaria.model.modification`), but not with its Links.
+    """
+    state = get_modifications([title])[title]
+    return hashlib.md5(json.dumps([title, state["state_revision"]] + list(params))).hexdigest()
+
+
+def cached_toc_html(oref, zoom=1):
+    """
+    Returns make_toc_html(oref, zoom), cached until the text's Index or VersionState changes.
+    """
+    key = _toc_html_key(oref.index.title, "toc", oref.normal(), zoom)
+    return toc_html_cache.get_or_build(key, lambda: make_toc_html(oref, zoom=zoom), TOC_HTML_CACHE_DURATION)
+
+
 def make_toc_html(oref, zoom=1):
     """
     Returns the HTML of a text's Table of Contents, including any alternate structures.
@@ -279,7 +303,8 @@ def make_toc_html(oref, zoom=1):
         structs        = {default_name: html } # store HTML for each structure
         alts           = index.get_alt_structures().items()
         for alt in alts:
-            structs[alt[0]] = make_alt_toc_html(alt[1])
+            key = _toc_html_key(index.title, "alt", alt[0])
+            structs[alt[0]] = toc_html_cache.get_or_build(key, lambda: make_alt_toc_html(alt[1]), TOC_HTML_CACHE_DURATION)
 
         items  = sorted(structs.items(), key=lambda x: 0 if x[0] == default_struct else 1)
         toggle, tocs = "", ""
@@ -500,15 +525,14 @@ def text_toc(request, oref):
     cats          = index.categories[:] # Make a list of categories which will let us pull a commentary node from TOC
     cats.insert(1, "Commentary")
     cats.append(index.title)
-    toc           = get_toc()
-    commentaries  = get_or_make_summary_node(toc, cats)
+    commentaries  = find_summary_node(get_toc(), cats) or []
 
     if index.is_complex():
         zoom = 1
     else:
         zoom = 0 if index.nodes.depth == 1 else 2 if "Commentary" in index.categories else 1
         zoom = int(request.GET.get("zoom", zoom))
-    toc_html = make_toc_html(oref, zoom=zoom)
+    toc_html = cached_toc_html(oref, zoom=zoom)
 
     if index.is_complex():
         count_strings = False
@@ -578,24 +602,62 @@ def count_and_index(c_oref, c_lang, vtitle, to_count=1, to_index=1):
         }).save()
 
 
+def _texts_api_params(request, lang=None, version=None):
+    """
+    :return: dict of the parameters of a texts API GET request that shape the TextFamily in its response
+    """
+    return {
+        "context":    int(request.GET.get("context", 1)),
+        "commentary": bool(int(request.GET.get("commentary", True))),
+        "pad":        bool(int(request.GET.get("pad", 1))),
+        "version":    version.replace("_", " ") if version else None,
+        "lang":       lang,
+        "alts":       bool(int(request.GET.get("alts", True))),
+        "notes":      bool(int(request.GET.get("notes", 0))),
+    }
+
+
+def _texts_api_validator(request, tref, lang=None, version=None):
+    """
+    Returns (etag, last modified, content key) for a texts API GET request, from the modification state of the texts,
+    links and notes in its response, or (None, None, None) if the response can't be validated that way.
+    Computed once per request.
+    """
+    if not hasattr(request, "_texts_api_validator"):
+        request._texts_api_validator = (None, None, None)
+        if request.method in ("GET", "HEAD") and not request.GET.get("layer") and not int(request.GET.get("sheets", 0)):
+            try:
+                uid = request.user.id if request.user.is_authenticated() else None
+                params = _texts_api_params(request, lang, version)
+                params["callback"] = request.GET.get("callback")
+                request._texts_api_validator = text_family_validator(Ref(tref), params, uid)
+            except Exception as e:
+                logger.warning(u"Couldn't make a validator for texts API request of {}: {}".format(tref, e))
+    return request._texts_api_validator
+
+
 @catch_error_as_json
 @csrf_exempt
+@condition(etag_func=lambda request, *args, **kwargs: _texts_api_validator(request, *args, **kwargs)[0],
+           last_modified_func=lambda request, *args, **kwargs: _texts_api_validator(request, *args, **kwargs)[1])
 def texts_api(request, tref, lang=None, version=None):
     oref = Ref(tref)
     if request.method == "GET":
         cb         = request.GET.get("callback", None)
-        context    = int(request.GET.get("context", 1))
-        commentary = bool(int(request.GET.get("commentary", True)))
-        pad        = bool(int(request.GET.get("pad", 1)))
-        version    = version.replace("_", " ") if version else None
+        params     = _texts_api_params(request, lang, version)
+        context    = params["context"]
+        commentary = params["commentary"]
+        pad        = params["pad"]
+        version    = params["version"]
         layer_name = request.GET.get("layer", None)
-        alts       = bool(int(request.GET.get("alts", True)))
+        alts       = params["alts"]
 
         try:
-            text = TextFamily(oref, version=version, lang=lang, commentary=commentary, context=context, pad=pad, alts=alts).contents()
+            text = text_family_contents(oref, version=version, lang=lang, commentary=commentary, context=context, pad=pad, alts=alts,
+                                        key=getattr(request, "_texts_api_validator", (None, None, None))[2])
         except AttributeError as e:
             oref = oref.default_child_ref()
-            text = TextFamily(oref, version=version, lang=lang, commentary=commentary, context=context, pad=pad, alts=alts).contents()
+            text = text_family_contents(oref, version=version, lang=lang, commentary=commentary, context=context, pad=pad, alts=alts)
 
 
         # Use a padded ref for calculating next and prev
@@ -605,7 +667,7 @@ def texts_api(request, tref, lang=None, version=None):
         text["next"]       = oref.next_section_ref().normal() if oref.next_section_ref() else None
         text["prev"]       = oref.prev_section_ref().normal() if oref.prev_section_ref() else None
         text["commentary"] = text.get("commentary", [])
-        text["notes"]      = get_notes(oref, uid=request.user.id) if int(request.GET.get("notes", 0)) else []
+        text["notes"]      = get_notes(oref, uid=request.user.id) if params["notes"] else []
         text["sheets"]     = get_sheets_for_ref(tref) if int(request.GET.get("sheets", 0)) else []
 
         if layer_name:
@@ -683,9 +745,17 @@ def parashat_hashavua_api(request):
     return jsonResponse(p, callback)
 
 
+def _toc_etag(request):
+    return None if request.GET.get("callback") else payload_etag(request, get_toc_payload())
+
+
 @catch_error_as_json
+@condition(etag_func=_toc_etag)
 def table_of_contents_api(request):
-    return jsonResponse(get_toc(), callback=request.GET.get("callback", None))
+    callback = request.GET.get("callback", None)
+    if callback:
+        return jsonResponse(get_toc(), callback=callback)
+    return payloadResponse(request, get_toc_payload())
 
 
 @catch_error_as_json
@@ -1224,13 +1294,13 @@ def texts_history_api(request, tref, lang=None, version=None):
 
     for group in summary:
         uids = list(summary[group])
+        users = resolve_users(uids)
         names = []
         for uid in uids:
-            try:
-                user = User.objects.get(id=uid)
-                name = "%s %s" % (user.first_name, user.last_name)
-                link = user_link(uid)
-            except User.DoesNotExist:
+            if users[uid]["found"]:
+                name = users[uid]["full_name"]
+                link = users[uid]["link"]
+            else:
                 name = "Someone"
                 link = user_link(-1)
             u = {
@@ -11,4 +11,5 @@ sys.path.insert(0, path + "/sefaria")
 from sefaria.settings import *
 from sefaria.search import index_from_queue
 
-index_from_queue()
+# Pass --continuous to keep polling the queue, rather than exiting once it is empty
+index_from_queue(continuous="--continuous" in sys.argv)
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+Times building the table of contents text by text (the old way) against building it from
+Index records and text states preloaded in bulk.  Nothing is saved.
+Exits with status 1 if the two TOCs differ (also checked by test_preloaded_toc in sefaria/tests/summaries_test.py).
+
+Usage: python scripts/profile_toc.py [repetitions]
+"""
+import sys
+import os
+import time
+
+path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, path)
+sys.path.insert(0, path + "/sefaria")
+
+from sefaria.settings import *
+import sefaria.system.cache as scache
+from sefaria.summaries import build_toc_tree
+
+repetitions = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+
+
+def best_time(preload):
+    times = []
+    for i in range(repetitions):
+        scache.clear_index_cache()
+        start = time.time()
+        toc = build_toc_tree(preload=preload)
+        times.append(time.time() - start)
+    return min(times), toc
+
+text_by_text, old_toc = best_time(False)
+preloaded, new_toc = best_time(True)
+
+print "Text by text: {:.2f}s".format(text_by_text)
+print "Preloaded:    {:.2f}s ({:.1f}x)".format(preloaded, text_by_text / preloaded)
+print "Same TOC:     {}".format(old_toc == new_toc)
+if old_toc != new_toc:
+    sys.exit(1)
@@ -2,13 +2,31 @@
 """
 Update included_refs field on source sheets
 to keep an indexable list of refs that a source sheet includes. 
+
+Usage: update_sheet_ref_index.py [hours] [processes] [--force]
+       update_sheet_ref_index.py --backfill
+
+Sheets whose sources haven't changed are skipped.  --force updates them too, e.g. so that
+refs to texts added to the Library since they were last updated are resolved.
+
+--backfill only sets included_ref_ranges on the sheets that have included_refs without them,
+which the sheets sidebar needs before it can find those sheets.
 """
 import sys
 
-from sefaria.sheets import update_included_refs
+from sefaria.sheets import update_included_refs, backfill_ref_ranges
+
+
+if "--backfill" in sys.argv:
+    print backfill_ref_ranges()
+    sys.exit(0)
 
+force = "--force" in sys.argv
+args = [a for a in sys.argv[1:] if a != "--force"]
+kwargs = {"force": force}
+if len(args) > 0:
+    kwargs["hours"] = int(args[0])
+if len(args) > 1:
+    kwargs["processes"] = int(args[1])
 
-if len(sys.argv) > 1:
-    update_included_refs(hours=int(sys.argv[1]))
-else:
-    update_included_refs()
\ No newline at end of file
+print update_included_refs(**kwargs)
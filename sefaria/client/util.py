@@ -1,5 +1,8 @@
 
 import json
+import gzip
+import hashlib
+from cStringIO import StringIO
 from rauth import OAuth2Service
 from datetime import datetime
 
@@ -28,6 +31,69 @@ def jsonResponse(data, callback=None, status=200):
     return HttpResponse(json.dumps(data), mimetype="application/json", status=status)
 
 
+def make_payload(body):
+    """
+    Returns a dict of the serialized response body `body` (a str), ready to be served many times:
+    "body", its "gzip" compressed form and an "etag" of its content.
+    """
+    buf = StringIO()
+    f = gzip.GzipFile(fileobj=buf, mode="wb", compresslevel=9, mtime=0)
+    f.write(body)
+    f.close()
+    return {
+        "body": body,
+        "gzip": buf.getvalue(),
+        "etag": hashlib.md5(body).hexdigest(),
+    }
+
+
+def accepts_gzip(request):
+    """
+    True if the request's Accept-Encoding header allows gzip, either by name or by "*",
+    with a nonzero q-value (so "gzip;q=0" refuses it).
+    """
+    qvalues = {}
+    for coding in request.META.get("HTTP_ACCEPT_ENCODING", "").split(","):
+        params = coding.split(";")
+        name = params[0].strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params[1:]:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value.strip())
+                except ValueError:
+                    q = 0.0
+        qvalues[name] = q
+    for name in ("gzip", "x-gzip", "*"):
+        if name in qvalues:
+            return qvalues[name] > 0
+    return False
+
+
+def payload_etag(request, payload):
+    """
+    Returns the ETag of the form of `payload` that payloadResponse() serves to `request`.
+    """
+    return payload["etag"] + ("-gzip" if accepts_gzip(request) else "")
+
+
+def payloadResponse(request, payload, mimetype="application/json"):
+    """
+    Serves a payload from make_payload(), compressed if the client accepts gzip.
+    """
+    if accepts_gzip(request):
+        response = HttpResponse(payload["gzip"], mimetype=mimetype)
+        response["Content-Encoding"] = "gzip"
+    else:
+        response = HttpResponse(payload["body"], mimetype=mimetype)
+    response["ETag"] = '"%s"' % payload_etag(request, payload)
+    response["Vary"] = "Accept-Encoding"
+    return response
+
+
 def jsonpResponse(data, callback, status=200):
     if "_id" in data:
         data["_id"] = str(data["_id"])
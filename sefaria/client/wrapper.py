@@ -5,7 +5,7 @@ from sefaria.model import *
 from sefaria.datatype.jagged_array import JaggedTextArray
 from sefaria.summaries import REORDER_RULES
 from sefaria.system.exceptions import InputError
-from sefaria.utils.users import user_link
+from sefaria.utils.users import user_link, resolve_users
 
 
 def format_link_object_for_client(link, with_text, ref, pos=None):
@@ -112,6 +112,7 @@ def get_notes(oref, public=True, uid=None, context=1):
     notes = []
 
     noteset = oref.padded_ref().context_ref(context).noteset(public, uid)
+    resolve_users([note.owner for note in noteset])  # Loads the owners' links in one batch
 
     for note in noteset:
         com = format_note_object_for_client(note)
@@ -30,6 +30,10 @@ DATABASES = {
     }
 }
 
+# sefaria.system.cache.CacheNamespace shares changes and build leases between processes through this cache,
+# which needs atomic add() and incr() to do so, e.g. memcached:
+#     'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache', 'LOCATION': '127.0.0.1:11211'
+# With the file based cache, every change invalidates a whole namespace, and concurrent misses are each built.
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
@@ -69,6 +73,14 @@ SEARCH_HOST = "http://localhost:9200"
 SEARCH_ADMIN = "http://localhost:9200"
 SEARCH_INDEX_ON_SAVE = True # Whether to send texts and source sheet to Search Host for indexing after save
 SEARCH_INDEX_NAME = 'sefaria' # name of the ElasticSearch index to use
+SEARCH_BULK_SIZE = 500 # max number of documents sent in one _bulk request
+SEARCH_BULK_BYTES = 5 * 1024 * 1024 # max size in bytes of one _bulk request
+SEARCH_BACKEND = "elasticsearch" # or "local" for the embedded search engine, which needs no search server
+SEARCH_LOCAL_PATH = "/path/to/search.db" # index file of the "local" search backend
+
+CACHE_METRICS_LOG_INTERVAL = 600 # seconds between the lines of cache metrics logged by each process
+WARMUP_REFS_PATH = None # file of refs, one per line, most requested first, preloaded by sefaria.warmup.post_fork
+WARMUP_REF_COUNT = 0 # number of refs to preload from WARMUP_REFS_PATH
 
 SEFARIA_DATA_PATH = '/path/to/you/data/dir' # used for exporting texts 
 
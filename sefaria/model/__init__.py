@@ -12,12 +12,12 @@ symbols are then accessed directly as, e.g.:
 import abstract
 
 # not sure why we have to do this now - it wasn't previously required
-import history, text, link, note, layer, notification, queue, lock, following, user_profile, version_state, translation_request, lexicon
+import history, text, link, note, layer, notification, queue, lock, following, user_profile, version_state, translation_request, lexicon, modification
 
 from history import History, HistorySet, log_add, log_delete, log_update, log_text
 from schema import deserialize_tree, Term, TermSet, TermScheme, TermSchemeSet, TitledTreeNode, SchemaNode, ArrayMapNode, JaggedArrayNode, NumberedTitledTreeNode
-from text import library, get_index, Index, IndexSet, CommentaryIndex, Version, VersionSet, TextChunk, TextFamily, Ref, merge_texts
-from link import Link, LinkSet, get_link_counts, get_book_link_collection, get_book_category_linkset
+from text import library, get_index, Index, IndexSet, CommentaryIndex, Version, VersionSet, TextChunk, TextFamily, Ref, merge_texts, text_family_contents
+from link import Link, LinkSet, LinkFilter, get_link_counts, get_book_link_collection, get_book_category_linkset
 from note import Note, NoteSet
 from layer import Layer, LayerSet
 from notification import Notification, NotificationSet
@@ -27,6 +27,7 @@ from translation_request import TranslationRequest, TranslationRequestSet
 from following import FollowRelationship, FollowersSet, FolloweesSet
 from user_profile import UserProfile, annotate_user_list
 from version_state import VersionState, VersionStateSet, StateNode, refresh_all_states
+from modification import mark_modified, get_modifications, text_family_validator
 from lexicon import Lexicon, LexiconEntry, LexiconEntrySet, Dictionary, DictionaryEntry, StrongsDictionaryEntry, RashiDictionaryEntry, WordForm
 
 import dependencies
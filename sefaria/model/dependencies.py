@@ -2,7 +2,7 @@
 dependencies.py -- list cross model dependencies and subscribe listeners to changes.
 """
 
-from . import abstract, link, note, history, schema, text, layer, version_state, translation_request
+from . import abstract, link, note, history, schema, text, layer, version_state, translation_request, modification
 
 from abstract import subscribe, cascade
 import sefaria.system.cache as scache
@@ -20,7 +20,7 @@ subscribe(text.process_index_title_change_in_versions,                  text.Ind
 subscribe(version_state.process_index_title_change_in_version_state,    text.Index, "attributeChange", "title")
 
 # Index Delete (start with cache clearing)
-subscribe(scache.process_index_change_in_cache,                         text.Index, "delete")
+subscribe(scache.process_index_delete_in_cache,                         text.Index, "delete")
 subscribe(version_state.process_index_delete_in_version_state,          text.Index, "delete")
 subscribe(link.process_index_delete_in_links,                           text.Index, "delete")
 subscribe(text.process_index_delete_in_versions,                        text.Index, "delete")
@@ -40,6 +40,16 @@ subscribe(cascade(schema.TermSet, "scheme"),                              schema
 # Version Save
 subscribe(translation_request.process_version_state_change_in_translation_requests, version_state.VersionState, "save")
 
+# Modification state, for validating cached texts API responses
+subscribe(modification.process_index_change_in_modifications,          text.Index, "save")
+subscribe(modification.process_version_change_in_modifications,        text.Version, "save")
+subscribe(modification.process_version_change_in_modifications,        text.Version, "delete")
+subscribe(modification.process_link_change_in_modifications,           link.Link, "save")
+subscribe(modification.process_link_change_in_modifications,           link.Link, "delete")
+subscribe(modification.process_note_change_in_modifications,           note.Note, "save")
+subscribe(modification.process_note_change_in_modifications,           note.Note, "delete")
+subscribe(modification.process_version_state_change_in_modifications,  version_state.VersionState, "save")
+
 # todo: notes? reviews?
 # todo: Scheme name change in Index
 # todo: term change in nodes
@@ -3,11 +3,13 @@ link.py
 Writes to MongoDB Collection: links
 """
 
+import time
 import regex as re
 from bson.objectid import ObjectId
 
 from sefaria.system.exceptions import DuplicateRecordError, InputError
 from sefaria.system.database import db
+import sefaria.system.cache as scache
 from . import abstract as abst
 from . import text
 
@@ -89,6 +91,102 @@ class Link(abst.AbstractMongoRecord):
                 # else: # this is a good new link
 
 
+class LinkFilter(object):
+    """
+    A filter on the refs of Links, compiled once from a list of sources and applied to any number of links.
+
+    Sources may name categories, books, or more specific Refs.  Categories are expanded into their books.
+    Whole books are kept in a set of titles; more specific Refs, including the nodes of complex texts, are kept
+    as regexes keyed by their book title, so that each link endpoint costs a few dictionary lookups,
+    rather than a regex match per source.
+
+    The same filter can be pushed down into a Mongo query with :py:meth: `query`:
+
+    ::
+
+        f = LinkFilter(["Rashi on Genesis", "Midrash"])
+        LinkSet({"$and": [{"refs": {"$regex": oref.regex()}}, f.query()]})
+    """
+    def __init__(self, sources):
+        """
+        :param sources: A string or a list of strings, each the name of a category, a book or a Ref
+        """
+        if isinstance(sources, basestring):
+            sources = [sources]
+
+        categories = text.library.get_text_categories()
+        expanded_sources = []
+        for source in sources:
+            expanded_sources += [source] if source not in categories else text.library.get_indexes_in_category(source, include_commentary=False)
+
+        self.books = set()      # titles of sources included in their entirety
+        self.partial = {}       # title -> list of compiled regexes of more specific sources in that title
+        self._regexes = []      # regex strings of all sources, used for query()
+        for source in expanded_sources:
+            oref = text.Ref(source)
+            self._regexes.append(oref.regex())
+            if not oref.sections and oref.index_node.is_root():
+                self.books.add(oref.book)
+            else:
+                self.partial.setdefault(oref.book, []).append(re.compile(oref.regex()))
+
+        # A title that is included whole makes any more specific source in it redundant
+        for title in self.books:
+            self.partial.pop(title, None)
+
+    def _title_of(self, tref):
+        """
+        Returns the title in this filter that the normal ref string 'tref' belongs to, or None.
+        Candidate titles are the prefixes of 'tref' that end before a space or comma.
+        """
+        for i, c in enumerate(tref):
+            if c != u" " and c != u",":
+                continue
+            title = tref[:i]
+            if title in self.books or title in self.partial:
+                rest = tref[i:i + 2]
+                if rest == u", " or (len(rest) == 2 and rest[1].isdigit()):
+                    return title
+        if tref in self.books or tref in self.partial:
+            return tref
+        return None
+
+    def matches_ref(self, tref):
+        """
+        :param tref: The normal string form of a Ref, as stored on Links
+        :return bool: True if 'tref' is within one of the sources of this filter
+        """
+        title = self._title_of(tref)
+        if title is None:
+            return False
+        if title in self.books:
+            return True
+        return any(reg.match(tref) for reg in self.partial[title])
+
+    def matches(self, link):
+        """
+        :param link: A :py:class: `Link` object
+        :return bool: True if either ref of 'link' is within one of the sources of this filter
+        """
+        return self.matches_ref(link.refs[0]) or self.matches_ref(link.refs[1])
+
+    def apply(self, links):
+        """
+        :param links: An iterable of :py:class: `Link` objects, such as a :py:class: `LinkSet`
+        :return: list of Links that match this filter
+        """
+        return [link for link in links if self.matches(link)]
+
+    def query(self):
+        """
+        :return: A Mongo query condition selecting links that match this filter,
+        suitable for combining with other conditions under "$and".
+        """
+        if not self._regexes:
+            return {"refs": {"$in": []}}
+        return {"refs": {"$regex": u"|".join(u"(?:{})".format(r) for r in self._regexes)}}
+
+
 class LinkSet(abst.AbstractMongoSet):
     recordClass = Link
 
@@ -109,25 +207,12 @@ class LinkSet(abst.AbstractMongoSet):
         Filter LinkSet according to 'sources' which may be either
         - a string, naming a text to include
         - an array of strings, naming multiple texts to include
+        - a :py:class: `LinkFilter` compiled from either of the above
 
         ! Returns a list of Links, not a LinkSet
         """
-        if isinstance(sources, basestring):
-            return self.filter([sources])
-
-        # Expand Categories
-        categories  = text.library.get_text_categories()
-        expanded_sources = []
-        for source in sources:
-            expanded_sources += [source] if source not in categories else text.library.get_indexes_in_category(source, include_commentary=False)
-
-        regexes = [text.Ref(source).regex() for source in expanded_sources]
-        filtered = []
-        for source in self:
-            if any([re.match(regex, source.refs[0]) for regex in regexes] + [re.match(regex, source.refs[1]) for regex in regexes]):
-                filtered.append(source)
-
-        return filtered
+        link_filter = sources if isinstance(sources, LinkFilter) else LinkFilter(sources)
+        return link_filter.apply(self)
 
     def refs_from(self, from_ref, as_tuple=False):
         """
@@ -213,11 +298,15 @@ def process_index_delete_in_links(indx, **kwargs):
 #get_link_counts() and get_book_link_collection() are used in Link Explorer.
 #They have some client formatting code in them; it may make sense to move them up to sefaria.client or sefaria.helper
 link_counts = {}
+link_counts_metrics = scache.metrics("link_counts", size=lambda: len(link_counts))
 def get_link_counts(cat1, cat2):
     global link_counts
     key = cat1 + "-" + cat2
     if link_counts.get(key):
+        link_counts_metrics.hit()
         return link_counts[key]
+    link_counts_metrics.miss()
+    start = time.time()
 
     queries = []
     for c in [cat1, cat2]:
@@ -240,6 +329,7 @@ def get_link_counts(cat1, cat2):
                 result.append({"book1": title1.replace(" ","-"), "book2": title2.replace(" ", "-"), "count": links.count()})
 
     link_counts[key] = result
+    link_counts_metrics.built(time.time() - start)
     return result
 
 
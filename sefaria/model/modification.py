@@ -0,0 +1,170 @@
+"""
+modification.py - Records of when the texts, links and notes of each book last changed.
+
+Writes to MongoDB Collection: text_modifications
+
+Each book has a revision counter, bumped whenever its Index, a Version of it, or a Link touching it
+is saved or deleted, a separate counter for its Notes, and a state counter, bumped when its Index is
+saved or its VersionState changes, as when the counts of available text are refreshed.  These serve as validators for conditional requests
+to the texts API (see :func:`text_family_validator`), and version cached renderings of the texts.
+"""
+import hashlib
+import json
+from datetime import datetime
+
+import logging
+logger = logging.getLogger(__name__)
+
+from sefaria.system.database import db
+import sefaria.system.cache as scache
+from sefaria.system.exceptions import InputError
+from text import Ref, library
+
+MODIFICATION_CACHE_DURATION = 60 * 60 * 24
+
+
+def _cache_key(title):
+    return "text_modification:" + hashlib.md5(title.encode("utf-8")).hexdigest()
+
+
+def mark_modified(titles, notes=False, state=False):
+    """
+    Bumps the revision of each book in `titles`, or its notes revision if `notes`, or its state revision if `state`.
+    """
+    now = datetime.now()
+    prefix = "notes_" if notes else "state_" if state else ""
+    for title in set(titles):
+        record = db.text_modifications.find_and_modify(
+            {"title": title},
+            {"$inc": {prefix + "revision": 1}, "$set": {prefix + "modified": now}},
+            upsert=True, new=True, fields={"_id": False})
+        scache.set_cache_elem(_cache_key(title), record, MODIFICATION_CACHE_DURATION)
+
+
+def get_modifications(titles):
+    """
+    :return: dict of title -> {"revision", "modified", "notes_revision", "notes_modified", "state_revision",
+    "state_modified"} for each of `titles`.  Books that have never been marked have revision 0 and modified None.
+    """
+    titles = list(set(titles))
+    keys = {_cache_key(t): t for t in titles}
+    cached = scache.get_cache_elems(keys.keys())
+    states = {keys[k]: v for k, v in cached.iteritems()}
+
+    missing = [t for t in titles if t not in states]
+    if missing:
+        found = {s["title"]: s for s in db.text_modifications.find({"title": {"$in": missing}}, {"_id": False})}
+        for title in missing:
+            state = found.get(title, {"title": title})
+            states[title] = state
+            scache.set_cache_elem(_cache_key(title), state, MODIFICATION_CACHE_DURATION)
+
+    return {t: {
+        "revision": s.get("revision", 0),
+        "modified": s.get("modified"),
+        "notes_revision": s.get("notes_revision", 0),
+        "notes_modified": s.get("notes_modified"),
+        "state_revision": s.get("state_revision", 0),
+        "state_modified": s.get("state_modified"),
+    } for t, s in states.iteritems()}
+
+
+def linked_titles(oref, revision=None):
+    """
+    :return: set of the titles of the books linked to `oref`, whose text TextFamily includes as commentary
+
+    Cached under the revision of the book of `oref`, which every change to a Link touching it bumps.
+
+    :param revision: that revision, if already known
+    """
+    if revision is None:
+        revision = get_modifications([oref.index.title])[oref.index.title]["revision"]
+    key = "linked_titles:" + hashlib.md5(json.dumps([oref.normal(), revision]).encode("utf-8")).hexdigest()
+    titles = scache.get_cache_elem(key)
+    if titles is not None:
+        return titles
+
+    titles = set()
+    for link in db.links.find({"refs": {"$regex": oref.regex()}}, {"refs": True, "_id": False}):
+        for tref in link["refs"]:
+            try:
+                titles.add(Ref(tref).index.title)
+            except InputError:
+                continue
+    scache.set_cache_elem(key, titles, MODIFICATION_CACHE_DURATION)
+    return titles
+
+
+TEXT_FAMILY_PARAMS = ("context", "commentary", "pad", "version", "lang", "alts")
+
+
+def text_family_validator(oref, params, uid=None):
+    """
+    Returns a validator for the TextFamily of `oref` built with `params`, as returned by the texts API,
+    which changes whenever the content of the response may have.
+
+    :param params: dict of the request parameters that shape the response (context, commentary, pad, version, lang, alts, notes)
+    :param uid: the requesting user, whose private notes are included when params["notes"] is set
+    :return: (etag, last modified datetime or None, content key).  The content key depends only on the parameters
+    that shape the TextFamily itself (TEXT_FAMILY_PARAMS), and keys its cached contents
+    (see :func:`sefaria.model.text.text_family_contents`).
+    """
+    context_oref = oref.padded_ref() if params.get("pad", True) else oref
+    for i in range(0, params.get("context", 1)):
+        context_oref = context_oref.context_ref()
+
+    book = oref.index.title
+    states = get_modifications([book])
+    if params.get("commentary", True):
+        linked = linked_titles(context_oref, states[book]["revision"]) - set([book])
+        states.update(get_modifications(linked))
+
+    revisions = sorted([(t, s["revision"]) for t, s in states.iteritems()])
+    modified = [s["modified"] for s in states.itervalues() if s["modified"]]
+    family_params = sorted([(k, v) for k, v in params.items() if k in TEXT_FAMILY_PARAMS])
+    content_key = hashlib.md5(json.dumps([oref.normal(), family_params, revisions], default=unicode).encode("utf-8")).hexdigest()
+
+    other_params = sorted([(k, v) for k, v in params.items() if k not in TEXT_FAMILY_PARAMS])
+    notes = None
+    if params.get("notes"):
+        notes = (states[book]["notes_revision"], uid)
+        if states[book]["notes_modified"]:
+            modified.append(states[book]["notes_modified"])
+
+    etag = hashlib.md5(json.dumps([content_key, other_params, notes], default=unicode).encode("utf-8")).hexdigest()
+    return etag, (max(modified) if modified else None), content_key
+
+
+def _ref_titles(trefs):
+    titles = set()
+    for tref in trefs:
+        try:
+            titles.add(Ref(tref).index.title)
+        except InputError:
+            logger.warning(u"Can't mark modification of unknown ref {}".format(tref))
+    return titles
+
+
+def process_index_change_in_modifications(indx, **kwargs):
+    titles = [indx.title]
+    if indx.is_commentary():  # A commentator's Index shapes each of its "X on Y" texts
+        titles += library.get_commentary_version_titles(indx.title)
+    mark_modified(titles)
+    mark_modified(titles, state=True)  # The text's structure, as shown in its TOC, may have changed
+
+
+def process_version_change_in_modifications(ver, **kwargs):
+    # Texts that include this one as commentary see the change through their linked_titles()
+    mark_modified([ver.title])
+
+
+def process_link_change_in_modifications(link, **kwargs):
+    mark_modified(_ref_titles(link.refs))
+
+
+def process_note_change_in_modifications(note, **kwargs):
+    mark_modified(_ref_titles([note.ref]), notes=True)
+
+
+def process_version_state_change_in_modifications(vstate, **kwargs):
+    mark_modified([vstate.title], state=True)
@@ -15,7 +15,7 @@ from django.template.loader import render_to_string
 
 from . import abstract as abst
 from sefaria.system.database import db
-from sefaria.utils.users import user_name
+from sefaria.utils.users import resolve_users
 
 
 class Notification(abst.AbstractMongoRecord):
@@ -143,7 +143,9 @@ class NotificationSet(abst.AbstractMongoSet):
         """
         Returns a nicely formatted string listing the people who acted in this notifcation set
         """
-        actors = [user_name(id) for id in self.actors_list()]
+        ids = self.actors_list()
+        users = resolve_users(ids)
+        actors = [users[id]["name"] for id in ids]
         top, more = actors[:3], actors[3:]
         if len(more) == 1:
             top[2] = "2 others"
@@ -157,6 +159,7 @@ class NotificationSet(abst.AbstractMongoSet):
         return "[%s]" % ", ".join([n.to_JSON() for n in self])
 
     def to_HTML(self):
+        resolve_users(self.actors_list())  # Loads the links of the actors, used by the templates, in one batch
         html = [n.to_HTML() for n in self]
         return "".join(html)
 
@@ -21,7 +21,8 @@ class IndexQueue(abst.AbstractMongoRecord):
         "ref"
     ]
     optional_attrs = [
-
+        "claimed_by",   # token of the queue worker batch processing this item
+        "claimed_at"    # datetime the item was claimed
     ]
 
     #todo: This is written generically.  Do we want elsewhere?
@@ -29,6 +30,8 @@ class IndexQueue(abst.AbstractMongoRecord):
         duplicate_query = {}
         for attr in self.required_attrs:
             duplicate_query[attr] = getattr(self, attr, None)
+        # An item already claimed by a worker may have been read before this change; don't treat it as a duplicate.
+        duplicate_query["claimed_by"] = None
         if self.__class__().load(duplicate_query):
             logger.warning(u"Aborting save of {}.  Duplicate found: {}".format(self.__class__.__name__, vars(self)))
         else:
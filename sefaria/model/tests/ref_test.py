@@ -544,6 +544,33 @@ class Test_comparisons(object):
         assert Ref("Shabbat 5b:23-29").follows(Ref("Shabbat 5b:10-20"))
         assert not Ref("Shabbat 5b:15-29").follows(Ref("Shabbat 5b:10-20"))
 
+class Test_order_key(object):
+    def test_order(self):
+        refs = [Ref("Genesis 1"), Ref("Genesis 1:2"), Ref("Genesis 1:10"), Ref("Genesis 2:1"), Ref("Exodus 1:1"), Ref("Shabbat 2a")]
+        keys = [r.order_key() for r in refs]
+        assert keys == sorted(keys)
+        assert len(set(keys)) == len(keys)
+
+    def test_batch(self):
+        refs = [Ref("Shabbat 2a"), Ref("Genesis 1:2"), Ref("Rashi on Genesis 1:1:1")]
+        assert library.order_keys(refs) == [r.order_key() for r in refs]
+
+    def test_ranges(self):
+        # A section sorts before the ranges it starts, and those by where they end
+        refs = [Ref("Genesis 1:1"), Ref("Genesis 1:1-3"), Ref("Genesis 1:1-2:4"), Ref("Genesis 1:2")]
+        keys = [(r.order_key(), r.order_key(end=True)) for r in refs]
+        assert keys == sorted(keys)
+        assert len(set(keys)) == len(keys)
+        assert refs[0].order_key() == refs[1].order_key()
+        ids = [r.order_id() for r in refs]
+        assert ids == sorted(ids)
+        assert len(set(ids)) == len(ids)
+
+    def test_fixed_width(self):
+        assert Ref("Genesis 1:1").order_key() < 2 ** 63
+        assert len(Ref("Genesis 1:1").order_id()) == len(Ref("Shabbat 2a").order_id())
+
+
 class Test_Talmud_at_Second_Place(object):
     def test_simple_ref(self):
         assert Ref("Zohar 1.15b.3").sections[1] == 30
@@ -4,6 +4,7 @@ from copy import deepcopy
 import pytest
 
 import sefaria.model as model
+from sefaria.system.exceptions import BookNameError
 
 
 def test_index_title_setter():
@@ -86,6 +87,14 @@ def test_get_index():
     assert r.title == u'Exodus'
 
 
+def test_get_index_reuses_commentary_index():
+    r = model.get_index("Rashi on Exodus")
+    assert model.get_index("Rashi on Ex.") is r
+    assert model.get_index("Rashi on Exodus") is r
+    with pytest.raises(BookNameError):
+        model.get_index("Exodus on Genesis")
+
+
 def test_text_helpers():
     res = model.library.get_commentary_version_titles()
     assert u'Rashbam on Genesis' in res
@@ -233,4 +242,58 @@ def test_version_word_count():
     assert model.Version().load({"title": "Ephod Bad on Pesach Haggadah"}).word_count() > 0
 
     #sets
-    assert model.VersionSet({"title": {"$regex": "Haggadah"}}).word_count() > 200000
\ No newline at end of file
+    assert model.VersionSet({"title": {"$regex": "Haggadah"}}).word_count() > 200000
+
+def test_text_family_contents_cache():
+    oref = model.Ref("Exodus 3")
+    expected = model.TextFamily(oref, commentary=False).contents()
+    first = model.text_family_contents(oref, commentary=False)
+    assert first == expected
+    first["next"] = "changed"
+    second = model.text_family_contents(oref, commentary=False)
+    assert second == expected  # callers get copies
+
+    stats = [r for r in model.text.text_family_cache_report() if r["params"][:3] == ["Exodus 3", 1, False]][0]
+    assert stats["hits"] >= 1
+
+    model.mark_modified(["Exodus"])
+    misses = stats["misses"]
+    model.text_family_contents(oref, commentary=False)
+    stats = [r for r in model.text.text_family_cache_report() if r["params"][:3] == ["Exodus 3", 1, False]][0]
+    assert stats["misses"] == misses + 1
+
+
+def test_text_family_cache_key_follows_commentary():
+    oref = model.Ref("Exodus 3")
+    with_commentary = model.text.text_family_cache_key(oref, commentary=True)
+    without = model.text.text_family_cache_key(oref, commentary=False)
+
+    rashi = model.Version().load({"title": "Rashi on Exodus"})
+    model.modification.process_version_change_in_modifications(rashi)  # As on saving the Version
+    assert model.text.text_family_cache_key(oref, commentary=True) != with_commentary
+    assert model.text.text_family_cache_key(oref, commentary=False) == without
+
+
+def test_mark_modified_state():
+    before = model.get_modifications(["Genesis", "Exodus"])
+    model.mark_modified(["Genesis", "Exodus"], state=True)
+    after = model.get_modifications(["Genesis", "Exodus"])
+    for title in ["Genesis", "Exodus"]:
+        assert after[title]["state_revision"] == before[title]["state_revision"] + 1
+        assert after[title]["revision"] == before[title]["revision"]
+
+
+def test_validator_content_key():
+    oref = model.Ref("Exodus 3")
+    params = {"context": 1, "commentary": True, "version": None, "lang": None, "pad": True, "alts": False}
+    plain = model.text_family_validator(oref, params)
+    with_notes = model.text_family_validator(oref, dict(params, notes=True, callback="f"), uid=1)
+    assert plain[2] == with_notes[2]
+    assert plain[0] != with_notes[0]
+    assert plain[2] == model.text.text_family_cache_key(oref)
+
+
+def test_commentator_index_change():
+    before = model.get_modifications(["Rashi on Exodus"])["Rashi on Exodus"]["revision"]
+    model.modification.process_index_change_in_modifications(model.Index().load({"title": "Rashi"}))
+    assert model.get_modifications(["Rashi on Exodus"])["Rashi on Exodus"]["revision"] == before + 1
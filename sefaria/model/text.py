@@ -459,11 +459,11 @@ class CommentaryIndex(AbstractIndex):
         :param book_name:  A title variant of a book :class:Index record
         :return:
         """
-        self.c_index = Index().load({
-            "titleVariants": commentor_name,
-            "categories.0": "Commentary"
-        })
-        if not self.c_index:
+        try:
+            self.c_index = get_index(commentor_name)
+        except BookNameError:
+            self.c_index = None
+        if not self.c_index or not self.c_index.is_commentary() or getattr(self.c_index, "b_index", None):
             raise BookNameError(u"No commentor named '{}'.".format(commentor_name))
 
         self.b_index = get_index(book_name)
@@ -616,13 +616,13 @@ def get_index(bookname):
     if cached_result:
         return cached_result
 
+    requested = bookname
     bookname = (bookname[0].upper() + bookname[1:]).replace("_", " ")  #todo: factor out method
 
-    #todo: cache
     node = library.get_schema_node(bookname)
     if node:
         i = node.index
-        scache.set_index(bookname, i)
+        scache.set_index(i.title, i, [requested, bookname])
         return i
 
     # "commenter" on "book"
@@ -630,9 +630,7 @@ def get_index(bookname):
     pattern = r'(?P<commentor>.*) on (?P<book>.*)'
     m = regex.match(pattern, bookname)
     if m:
-        i = CommentaryIndex(m.group('commentor'), m.group('book'))
-        scache.set_index(bookname, i)
-        return i
+        return get_commentary_index(m.group('commentor'), m.group('book'), [requested, bookname])
 
     #simple commentary record
     c_index = Index().load({
@@ -640,11 +638,38 @@ def get_index(bookname):
             "categories.0": "Commentary"
         })
     if c_index:
+        scache.set_index(c_index.title, c_index, [requested, bookname])
         return c_index
 
     raise BookNameError(u"No book named '{}'.".format(bookname))
 
 
+def get_commentary_index(commentor_name, book_name, aliases=()):
+    """
+    Returns the :class:`CommentaryIndex` of `commentor_name` on `book_name`, which may be any of their title variants.
+    Instances are cached under "<commentator title> on <book title>", so each pair is only built once
+    however it's named.
+
+    :param aliases: other names to cache the result under
+    """
+    try:
+        c_index = get_index(commentor_name)
+    except BookNameError:
+        c_index = None
+    if not c_index or not c_index.is_commentary() or getattr(c_index, "b_index", None):
+        raise BookNameError(u"No commentor named '{}'.".format(commentor_name))
+
+    b_index = get_index(book_name)
+    key = u"{} on {}".format(c_index.title, b_index.title)
+    i = scache.get_index(key)
+    if i:
+        scache.alias_index(key, aliases)
+    else:
+        i = CommentaryIndex(c_index.title, b_index.title)
+        scache.set_index(key, i, aliases)
+    return i
+
+
 
 """
                     -------------------
@@ -1390,6 +1415,69 @@ class TextFamily(object):
         return d
 
 
+TEXT_FAMILY_CACHE_DURATION = 60 * 60 * 24
+text_family_cache = scache.namespace("text_family", local_size=200)
+text_family_cache_stats = scache.LRUCache(1000)  # request parameters -> [hits, misses], in this process
+
+
+def text_family_cache_key(oref, context=1, commentary=True, version=None, lang=None, pad=True, alts=False):
+    """
+    Returns the key of TextFamily(oref, ...).contents() in text_family_cache.  It is the content key of the validator
+    of the texts API (see :func:`sefaria.model.modification.text_family_validator`), so it changes along with
+    the revision of the book and, with `commentary`, of every book linked to it.
+    """
+    from modification import text_family_validator
+    params = {"context": context, "commentary": commentary, "version": version, "lang": lang, "pad": pad, "alts": alts}
+    return text_family_validator(oref, params)[2]
+
+
+def text_family_contents(oref, context=1, commentary=True, version=None, lang=None, pad=True, alts=False, key=None):
+    """
+    Returns TextFamily(oref, ...).contents(), from a cache keyed by text_family_cache_key().  The revisions in the key
+    are bumped whenever the Index, a Version or a Link of the book or its commentaries changes
+    (see :mod:`sefaria.model.modification`), so that entries of old revisions are never read again.
+
+    Returns a copy, which the caller may change.
+
+    :param key: the text_family_cache_key() of these arguments, if already known, e.g. from the texts API's validator
+    """
+    key = key or text_family_cache_key(oref, context, commentary, version, lang, pad, alts)
+
+    # Counted in this process only, without going to the shared cache
+    stats_key = json.dumps([oref.normal(), context, commentary, version, lang, pad, alts])
+    stats = text_family_cache_stats.get(stats_key)
+    if stats is None:
+        stats = [0, 0]
+        text_family_cache_stats.set(stats_key, stats)
+
+    contents = text_family_cache.get(key)
+    if contents is None:
+        stats[1] += 1
+        contents = text_family_cache.metrics.timed(lambda: TextFamily(oref, context=context, commentary=commentary, version=version, lang=lang, pad=pad, alts=alts).contents())
+        text_family_cache.set(key, contents, TEXT_FAMILY_CACHE_DURATION)
+    else:
+        stats[0] += 1
+
+    return copy.deepcopy(contents)
+
+
+def text_family_cache_report(limit=100):
+    """
+    :return: list of the `limit` most requested parameters of :func:`text_family_contents` in this process,
+    as dicts with "params", "hits", "misses" and "hit_rate"
+    """
+    report = []
+    for stats_key in text_family_cache_stats.keys():
+        hits, misses = text_family_cache_stats.get(stats_key)
+        report.append({
+            "params": json.loads(stats_key),
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": float(hits) / (hits + misses),
+        })
+    return sorted(report, key=lambda r: r["hits"] + r["misses"], reverse=True)[:limit]
+
+
 def process_index_title_change_in_versions(indx, **kwargs):
     VersionSet({"title": kwargs["old"]}).update({"title": kwargs["new"]})
 
@@ -1426,6 +1514,7 @@ class RefCachingType(type):
     def __init__(cls, name, parents, dct):
         super(RefCachingType, cls).__init__(name, parents, dct)
         cls.__cache = {}
+        cls.cache_metrics = scache.metrics("ref_cache", size=cls.cache_size)
 
     def cache_size(cls):
         return len(cls.__cache)
@@ -1437,9 +1526,19 @@ class RefCachingType(type):
         return cls.__cache
 
     def clear_cache(cls):
+        cls.cache_metrics.deleted(len(cls.__cache))
         cls.__cache = {}
 
+    def remove_titles_from_cache(cls, titles):
+        """
+        Removes Refs to the texts titled `titles`, and to commentaries on them, from the cache.
+        """
+        size = len(cls.__cache)
+        cls.__cache = {k: r for k, r in cls.__cache.iteritems() if not index_has_title(r.index, titles)}
+        cls.cache_metrics.deleted(size - len(cls.__cache))
+
     def __call__(cls, *args, **kwargs):
+        # Cleared, via clear_cache(), when sefaria.system.cache.check_texts_cache() finds that the library changed
         if len(args) == 1:
             tref = args[0]
         else:
@@ -1449,8 +1548,10 @@ class RefCachingType(type):
 
         if tref:
             if tref in cls.__cache:
+                cls.cache_metrics.hit()
                 return cls.__cache[tref]
             else:
+                cls.cache_metrics.miss()
                 result = super(RefCachingType, cls).__call__(*args, **kwargs)
                 if result.uid() in cls.__cache:
                     #del result  #  Do we need this to keep memory clean?
@@ -1470,6 +1571,13 @@ class RefCachingType(type):
             return super(RefCachingType, cls).__call__(*args, **kwargs)
 
 
+ORDER_KEY_BASE_DIGITS = 5        # digits of an order key that give the position of the text in the table of contents
+ORDER_KEY_SECTION_DIGITS = 4     # digits of an order key for each section
+ORDER_KEY_SECTION_DEPTH = 3      # number of sections represented in an order key.  Deeper sections are ignored.
+ORDER_KEY_WIDTH = ORDER_KEY_BASE_DIGITS + ORDER_KEY_SECTION_DIGITS * ORDER_KEY_SECTION_DEPTH  # fits in a 64 bit int
+ORDER_KEY_UNKNOWN_BASE = 10 ** ORDER_KEY_BASE_DIGITS - 1  # base for texts not in the table of contents
+
+
 class Ref(object):
     """
         A Ref is a reference to a location. A location could be to a *book*, to a specific *segment* (e.g. verse or mishnah), to a *section* (e.g chapter), or to a *range*.
@@ -2661,32 +2769,46 @@ class Ref(object):
                     break
         return ret
 
+    def order_key(self, end=False):
+        """
+        Returns an integer that establishes an ordering of references across the whole catalog.
+        It is composed of a base for the text, in the order of the table of contents, followed by
+        :data:`ORDER_KEY_SECTION_DEPTH` sections of :data:`ORDER_KEY_SECTION_DIGITS` digits each.
+        Refs to texts missing from the table of contents sort last.
+        Used to sort results from search queries, and suitable for sorting in Mongo.
+
+        The key is that of the start of a range, which it shares with the range's first section.  Sort by the key
+        with `end` next, to order a section before the ranges it starts, and those by where they end.
+
+        To compute the keys of many Refs, use :meth:`Library.order_keys`.
+
+        :param end: If True, returns the key of the end of the Ref (toSections) rather than its start
+        :return int:
+        """
+        return library.order_keys([self], end=end)[0]
+
     def order_id(self):
         """
-        Returns a unique id for this reference that establishes an ordering of references across the whole catalog.
-        This id will change as the ordering of the catalog changes, and may begin to overlap with other numbers because of those changes.
-        However, at any point in time these ids will be unique across the catalog.
-        Used to sort results from ElasticSearch queries
+        Returns a unique id which orders Refs as :meth:`order_key` and then the key of their `end` do.
+        It is the fixed-width string of :meth:`order_key`, followed for ranges by "-" and the key of their end,
+        for contexts that sort lexically.
 
         :return string:
         """
-        #Todo: handle complex texts.  Right now, all complex results are grouped under the root of the text
-        from sefaria.summaries import category_id_dict
+        oid = format(self.order_key(), "0{}d".format(ORDER_KEY_WIDTH))
+        if self.is_range():
+            oid += "-" + format(self.order_key(end=True), "0{}d".format(ORDER_KEY_WIDTH))
+        return oid
 
+    def _order_base_path(self):
+        """
+        :return string: The path of this Ref's text in :func:`sefaria.summaries.order_base_table`
+        """
+        #Todo: handle complex texts.  Right now, all complex results are grouped under the root of the text
         cats = self.index.categories[:]
         if len(cats) >= 1 and cats[0] == "Commentary":
             cats = cats[1:2] + ["Commentary"] + cats[2:]
-
-        key = "/".join(cats + [self.index.title])
-        try:
-            base = category_id_dict()[key]
-            res = reduce(lambda x, y: x + format(y, '04'), self.sections, base)
-            if self.is_range():
-                res = reduce(lambda x, y: x + format(y, '04'), self.toSections, res + "-")
-            return res
-        except Exception as e:
-            logger.warning("Failed to execute order_id for {} : {}".format(self, e))
-            return "Z"
+        return "/".join(cats + [self.index.title])
 
     """ Methods for working with Versions and VersionSets """
     def storage_address(self):
@@ -2932,6 +3054,31 @@ class Ref(object):
         return LinkSet(self)
 
 
+def index_has_title(index, titles):
+    """
+    :return bool: True if `index` is titled one of `titles`, or is a commentary on a text titled one of `titles`
+    """
+    if index is None:
+        return False
+    return index.title in titles or (getattr(index, "b_index", None) is not None and index.b_index.title in titles)
+
+
+def forget_titles(titles):
+    """
+    Drops the cached Indexes and Refs of the texts titled `titles`, and of commentaries on them, from this process.
+    Called in every process when the texts change.  See :meth:`Library.refresh_index_in_cache`.
+    """
+    if not titles:
+        return
+    removed = scache.index_cache.remove_where(lambda index: index_has_title(index, titles))
+    scache.index_cache_metrics.deleted(removed)
+    Ref.remove_titles_from_cache(titles)
+
+
+scache.texts_cache.on_invalidate(Ref.clear_cache)
+scache.texts_cache.on_change(forget_titles)
+
+
 class Library(object):
     """
     Operates as a singleton, through the instance called ``library``.
@@ -2941,7 +3088,13 @@ class Library(object):
     Perhaps in the future, there will be multiple libraries...
     """
 
-    local_cache = {}
+    @property
+    def local_cache(self):
+        """
+        A dict for values that are computed from the library and can't go in the shared cache.
+        Emptied whenever text index information changes (see :func:`sefaria.system.cache.reset_texts_cache`).
+        """
+        return scache.texts_cache.local_dict()
 
     def all_titles_regex_string(self, lang="en", commentary=False, with_terms=False, for_js=False):
         key = "all_titles_regex_string" + lang
@@ -3008,19 +3161,95 @@ class Library(object):
         :param with_terms: if True, includes shared titles ('terms')
         """
 
-        key = "full_title_list_" + lang
-        key += "_commentators" if with_commentators else ""
-        key += "_commentary" if with_commentary else ""
-        key += "_terms" if with_terms else ""
-        titles = scache.get_cache_elem(key)
-        if not titles:
+        def build():
             titles = self.get_title_node_dict(lang, with_commentary=with_commentary).keys()
             if with_terms:
                 titles += self.get_term_dict(lang).keys()
             if with_commentators:
                 titles += self.get_commentator_titles(lang, with_variants=True)
-            scache.set_cache_elem(key, titles)
-        return titles
+            return titles
+
+        key = self._full_title_list_key(lang, with_commentators, with_commentary, with_terms)
+        return scache.texts_cache.get_or_build(key, build)
+
+    # Prefixes of the keys that are built from the titles of all texts, and need rebuilding when any title changes
+    title_derived_keys = ["full_title_list_", "texts_titles_json", "all_titles_regex", "title_node_dict_", "search_text_metadata"]
+
+    def refresh_index_in_cache(self, index, old_titles=None, deleted=False):
+        """
+        Updates the cached title structures for a change to `index`, in every process,
+        without dropping the entries of other texts.
+        Removes the Index, its Refs and its entries in the title node dicts, and those of commentaries on it,
+        then adds back the entries of the current `index`, unless it was `deleted`.
+        The title lists and regexes are rebuilt from the node dicts on next use.
+
+        :param index: a (non commentator) :class:`Index`
+        :param old_titles: titles the Index had before the change
+        :param deleted: True if `index` was deleted
+        """
+        titles = list(set([index.title] + (old_titles or [])))
+        forget_titles(titles)  # So that commentaries are reloaded below with the new Index
+        trees = [] if deleted else [index.nodes]
+        commentary_trees = []
+        if not deleted:
+            for ctitle in self.get_commentary_version_titles_on_book(index.title):
+                try:
+                    commentary_trees.append(get_index(ctitle).nodes)
+                except BookNameError:
+                    pass
+        self._patch_title_node_dicts(titles, trees, trees + commentary_trees)
+        scache.texts_cache.changed(self.title_derived_keys, tags=titles)
+
+    def refresh_commentary_in_cache(self, title):
+        """
+        Adds the "X on Y" commentary `title` to the cached title structures, in every process.
+        """
+        forget_titles([title])
+        try:
+            trees = [get_index(title).nodes]
+        except BookNameError:
+            trees = []
+        self._patch_title_node_dicts([title], None, trees)
+        scache.texts_cache.changed(self.title_derived_keys, tags=[title])
+
+    def _patch_title_node_dicts(self, titles, trees, commentary_trees):
+        """
+        Replaces the entries of the texts titled `titles` in the cached title node dicts with those of `trees`,
+        and in the dicts with commentary with those of `commentary_trees`.  Dicts that aren't cached are left to be built.
+        The title lists derived from the dicts are deleted.
+
+        :param trees: list of root nodes, or None to leave the dicts without commentary untouched
+        """
+        for with_commentary, new_trees in [(False, trees), (True, commentary_trees)]:
+            if new_trees is None:
+                continue
+            for lang in ["en", "he"]:
+                key = self._title_node_dict_key(lang, with_commentary)
+                title_dict = scache.texts_cache.get(key)
+                if not title_dict:
+                    continue
+                title_dict = {t: node for t, node in title_dict.iteritems() if not index_has_title(node.index, titles)}
+                for tree in new_trees:
+                    try:
+                        title_dict.update(tree.title_dict(lang))
+                    except IndexSchemaError as e:
+                        logger.error(u"Error in generating title node dictionary: {}".format(e))
+                scache.texts_cache.set(key, title_dict)
+
+        for lang in ["en", "he"]:
+            scache.texts_cache.delete('texts_titles_json' + ("_he" if lang == "he" else ""))
+            for with_commentators in [False, True]:
+                for with_commentary in [False, True]:
+                    for with_terms in [False, True]:
+                        scache.texts_cache.delete(self._full_title_list_key(lang, with_commentators, with_commentary, with_terms))
+
+    @staticmethod
+    def _full_title_list_key(lang, with_commentators, with_commentary, with_terms):
+        key = "full_title_list_" + lang
+        key += "_commentators" if with_commentators else ""
+        key += "_commentary" if with_commentary else ""
+        key += "_terms" if with_terms else ""
+        return key
 
     def ref_list(self):
         """
@@ -3029,24 +3258,50 @@ class Library(object):
         from version_state import VersionStateSet
         return VersionStateSet().all_refs()
 
+    def order_keys(self, refs, end=False):
+        """
+        Computes :meth:`Ref.order_key` for many Refs at once, looking up the base of each text only once.
+
+        :param refs: list of :class:`Ref` objects
+        :param end: If True, computes the keys of the ends of the Refs
+        :return: list of ints, in the order of `refs`
+        """
+        from sefaria.summaries import order_base_table
+        table = order_base_table()
+        section_max = 10 ** ORDER_KEY_SECTION_DIGITS - 1
+        bases = {}
+        keys = []
+        for oref in refs:
+            base = bases.get(oref.index.title)
+            if base is None:
+                path = oref._order_base_path()
+                base = table.get(path)
+                if base is None or base >= ORDER_KEY_UNKNOWN_BASE:
+                    logger.warning(u"No order key base for {}".format(path))
+                    base = ORDER_KEY_UNKNOWN_BASE
+                bases[oref.index.title] = base
+
+            sections = oref.toSections if end else oref.sections
+            key = base
+            for i in range(ORDER_KEY_SECTION_DEPTH):
+                key = key * (section_max + 1) + (min(sections[i], section_max) if i < len(sections) else 0)
+            keys.append(key)
+        return keys
+
     def get_term_dict(self, lang="en"):
         """
         :return: dict of shared titles that have an explicit ref
         :param lang: "he" or "en"
         """
         key = "term_dict_" + lang
-        term_dict = self.local_cache.get(key)
-        if not term_dict:
-            term_dict = scache.get_cache_elem(key)
-            self.local_cache[key] = term_dict
+        term_dict = scache.texts_cache.get(key)
         if not term_dict:
             term_dict = {}
             terms = TermSet({"$and":[{"ref": {"$exists":True}},{"ref":{"$nin":["",[]]}}]})
             for term in terms:
                 for title in term.get_titles(lang):
                     term_dict[title] = term.ref
-            scache.set_cache_elem(key, term_dict)
-            self.local_cache[key] = term_dict
+            scache.texts_cache.set(key, term_dict)
         return term_dict
 
     #todo: retire me
@@ -3107,13 +3362,7 @@ class Library(object):
 
         Does not include bare commentator names, like *Rashi*.
         """
-        key = "title_node_dict_" + lang
-        key += "_commentary" if with_commentary else ""
-        title_dict = self.local_cache.get(key)
-        if not title_dict:
-            title_dict = scache.get_cache_elem(key)
-            self.local_cache[key] = title_dict
-        if not title_dict:
+        def build():
             title_dict = {}
             trees = self.get_index_forest(with_commentary=with_commentary)
             for tree in trees:
@@ -3121,9 +3370,13 @@ class Library(object):
                     title_dict.update(tree.title_dict(lang))
                 except IndexSchemaError as e:
                     logger.error(u"Error in generating title node dictionary: {}".format(e))
-            scache.set_cache_elem(key, title_dict)
-            self.local_cache[key] = title_dict
-        return title_dict
+            return title_dict
+
+        return scache.texts_cache.get_or_build(self._title_node_dict_key(lang, with_commentary), build)
+
+    @staticmethod
+    def _title_node_dict_key(lang, with_commentary):
+        return "title_node_dict_" + lang + ("_commentary" if with_commentary else "")
 
     #todo: handle maps
     def get_schema_node(self, title, lang=None, with_commentary=False):
@@ -3155,10 +3408,12 @@ class Library(object):
         :return: JSON of full texts list, (cached)
         """
         key = 'texts_titles_json' + ("_he" if lang == "he" else "")
-        if not scache.get_cache_elem(key):
-            scache.set_cache_elem(key, json.dumps(self.full_title_list(lang=lang, with_commentary=True)))
+        titles_json = scache.texts_cache.get(key)
+        if not titles_json:
+            titles_json = json.dumps(self.full_title_list(lang=lang, with_commentary=True))
+            scache.texts_cache.set(key, titles_json)
 
-        return scache.get_cache_elem(key)
+        return titles_json
 
     def get_text_categories(self):
         """
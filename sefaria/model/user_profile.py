@@ -1,5 +1,3 @@
-import hashlib
-import urllib
 import re
 import bleach
 import sys
@@ -14,7 +12,7 @@ if not hasattr(sys, '_doc_build'):
 from sefaria.model.following import FollowersSet, FolloweesSet
 from sefaria.model.notification import NotificationSet
 from sefaria.system.database import db
-from sefaria.utils.users import user_link, user_links
+from sefaria.utils.users import resolve_users, forget_user, gravatar_url
 
 
 class UserProfile(object):
@@ -73,10 +71,8 @@ class UserProfile(object):
 		self.followees = FolloweesSet(self.id)
 
 		# Gravatar
-		default_image           = "http://www.sefaria.org/static/img/profile-default.png"
-		gravatar_base           = "http://www.gravatar.com/avatar/" + hashlib.md5(self.email.lower()).hexdigest() + "?"
-		self.gravatar_url       = gravatar_base + urllib.urlencode({'d':default_image, 's':str(250)})
-		self.gravatar_url_small = gravatar_base + urllib.urlencode({'d':default_image, 's':str(80)})
+		self.gravatar_url       = gravatar_url(self.email, 250)
+		self.gravatar_url_small = gravatar_url(self.email, 80)
 
 	@property
 	def full_name(self):
@@ -111,9 +107,7 @@ class UserProfile(object):
 
 		# invalidate user links cache if needed
 		if self._name_updated or self._slug_updated:
-			global user_links
-			if self.id in user_links:
-				del user_links[self.id]
+			forget_user(self.id)
 			self._slug_updated = False
 
 		# store name changes on Django User object
@@ -258,11 +252,12 @@ def annotate_user_list(uids):
 	Returns a list of dictionaries giving details (names, profile links) 
 	for the user ids list in uids.
 	"""
+	users = resolve_users(uids)
 	annotated_list = []
 	for uid in uids:
 		annotated = {
-			"userLink": user_link(uid),
-			"imageUrl": UserProfile(id=uid).gravatar_url_small,
+			"userLink": users[uid]["link"],
+			"imageUrl": gravatar_url(users[uid]["email"], 80),
 		}
 		annotated_list.append(annotated)
 
@@ -3,7 +3,7 @@ from datetime import datetime
 from bson.objectid import ObjectId
 
 import sefaria.model as model
-from sefaria.utils.users import user_link
+from sefaria.utils.users import resolve_users
 from sefaria.utils.util import *
 from sefaria.system.database import db
 
@@ -72,10 +72,11 @@ def get_reviews(tref, lang, version):
 	reviews = []
 	tref = model.Ref(tref).normal()
 	refRe = '^%s$|^%s:' % (tref, tref)
-	cursor = db.history.find({"ref": {"$regex": refRe}, "language": lang, "version": version, "rev_type": "review"}).sort([["date", -1]])
+	cursor = list(db.history.find({"ref": {"$regex": refRe}, "language": lang, "version": version, "rev_type": "review"}).sort([["date", -1]]))
+	users = resolve_users([r["user"] for r in cursor])
 	for r in cursor:
 		r["_id"] = str(r["_id"])
-		r["userLink"] = user_link(r["user"])
+		r["userLink"] = users[r["user"]]["link"]
 		reviews.append(r)
 
 	return reviews
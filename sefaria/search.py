@@ -1,10 +1,15 @@
 # -*- coding: utf-8 -*-
 """
-search.py - full-text search for Sefaria using ElasticSearch
+search.py - full-text search for Sefaria using ElasticSearch, or the embedded engine in search_engine.py
 
-Writes to MongoDB Collection: index_queue
+Writes to MongoDB Collection: index_queue, index_checkpoint, search_doc_hashes
 """
 import os
+import json
+import hashlib
+import time
+import multiprocessing
+from bson.objectid import ObjectId
 from pprint import pprint
 from datetime import datetime, timedelta
 
@@ -14,13 +19,15 @@ os.environ['DJANGO_SETTINGS_MODULE'] = "settings"
 import logging
 logger = logging.getLogger(__name__)
 
+import requests
 from pyelasticsearch import ElasticSearch
 
 from sefaria.model import *
 from sefaria.utils.users import user_link
 from sefaria.system.database import db
+import sefaria.system.cache as scache
 from sefaria.utils.util import strip_tags
-from settings import SEARCH_ADMIN, SEARCH_INDEX_NAME
+from settings import SEARCH_ADMIN, SEARCH_INDEX_NAME, SEARCH_BULK_SIZE, SEARCH_BULK_BYTES, SEARCH_BACKEND, SEARCH_LOCAL_PATH
 from sefaria.summaries import REORDER_RULES
 from sefaria.utils.hebrew import hebrew_term
 import sefaria.model.queue as qu
@@ -29,20 +36,336 @@ import sefaria.model.queue as qu
 es = ElasticSearch(SEARCH_ADMIN)
 
 doc_count = 0
+error_count = 0
+
+
+class BulkIndexer(object):
+    """
+    Buffers documents and sends them to Elasticsearch through the _bulk endpoint.
+
+    A batch is sent when it reaches `batch_size` documents or `batch_bytes` bytes, or when flush() is called.
+    Requests that fail to connect, or that Elasticsearch rejects as overloaded (429 / 503), are retried with
+    exponential backoff, as are individual documents rejected within a batch.  While retrying, add() blocks,
+    and the batch size is halved after each rejection, so that a busy cluster slows the producer down.
+    The batch size grows back after batches that go through cleanly.
+
+    If a :class:`SearchDocHashes` is passed as `hashes`, documents whose content is unchanged since they were
+    last indexed are dropped from each batch before it is sent, and the hashes of accepted documents are recorded.
+
+    Usage:
+
+    ::
+
+        bulk = BulkIndexer()
+        for ...:
+            bulk.add("text", doc, doc_id)
+        bulk.flush()
+    """
+    retry_statuses = (429, 503)
+
+    def __init__(self, url=None, index_name=None, batch_size=None, batch_bytes=None, max_retries=5, backoff=1.0, timeout=60, hashes=None):
+        self.url = (url or SEARCH_ADMIN).rstrip("/") + "/_bulk"
+        self.index_name = index_name or SEARCH_INDEX_NAME
+        self.max_batch_size = batch_size or SEARCH_BULK_SIZE
+        self.batch_size = self.max_batch_size
+        self.batch_bytes = batch_bytes or SEARCH_BULK_BYTES
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.hashes = hashes
+
+        self.indexed = 0   # documents accepted by Elasticsearch
+        self.failed = 0    # documents given up on
+        self.rejected = set()  # ids of the documents given up on, for the caller to retry later and clear
+        self.requests = 0  # _bulk requests sent, including retries
+
+        self._buffer = []  # list of (doc_id, serialized action and document, content hash)
+        self._buffer_bytes = 0
+
+    @property
+    def skipped(self):
+        """
+        Number of documents not sent because they were unchanged
+        """
+        return self.hashes.skipped if self.hashes else 0
+
+    def add(self, doc_type, doc, doc_id):
+        """
+        Buffer `doc` for indexing as `doc_type` with `doc_id`, sending the buffer if it is full.
+        """
+        content_hash = self.hashes.hash_doc(doc) if self.hashes else None
+        action = {"index": {"_index": self.index_name, "_type": doc_type, "_id": doc_id}}
+        entry = json.dumps(action) + "\n" + json.dumps(doc) + "\n"
+
+        if self._buffer and self._buffer_bytes + len(entry) > self.batch_bytes:
+            self.flush()
+        self._buffer.append((doc_id, entry, content_hash))
+        self._buffer_bytes += len(entry)
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Send all buffered documents, retrying rejected ones until they are accepted or retries run out.
+        """
+        pending = self._buffer
+        self._buffer = []
+        self._buffer_bytes = 0
+        if self.hashes and pending:
+            unchanged = self.hashes.unchanged([(e[0], e[2]) for e in pending])
+            pending = [e for e in pending if e[0] not in unchanged]
+
+        attempt = 0
+        while pending:
+            pending = self._send(pending)
+            if not pending:
+                if attempt == 0 and self.batch_size < self.max_batch_size:
+                    self.batch_size = min(self.max_batch_size, self.batch_size * 2)
+                break
+
+            attempt += 1
+            self.batch_size = max(1, self.batch_size / 2)
+            if attempt > self.max_retries:
+                logger.error(u"Giving up on {} documents after {} retries, starting with {}".format(len(pending), self.max_retries, pending[0][0]))
+                self.failed += len(pending)
+                self.rejected.update([e[0] for e in pending])
+                break
+            time.sleep(self.backoff * 2 ** (attempt - 1))
+
+    def discard(self):
+        """
+        Drop all buffered documents without sending them.
+        """
+        self._buffer = []
+        self._buffer_bytes = 0
+
+    def _send(self, entries):
+        """
+        Make one _bulk request for `entries`.
+        :return: list of entries that should be retried
+        """
+        self.requests += 1
+        try:
+            resp = requests.post(self.url, data="".join([e[1] for e in entries]), timeout=self.timeout)
+        except requests.RequestException as e:
+            logger.warning(u"Bulk request of {} documents failed: {}".format(len(entries), e))
+            return entries
+
+        if resp.status_code in self.retry_statuses:
+            logger.warning(u"Bulk request of {} documents rejected with status {}".format(len(entries), resp.status_code))
+            return entries
+        if resp.status_code != 200:
+            logger.error(u"Bulk request of {} documents failed with status {}: {}".format(len(entries), resp.status_code, resp.text[:500]))
+            self.failed += len(entries)
+            self.rejected.update([e[0] for e in entries])
+            return []
+
+        retry = []
+        accepted = []
+        for entry, item in zip(entries, resp.json()["items"]):
+            result = item.values()[0]
+            status = result.get("status", 500)
+            if status < 300:
+                self.indexed += 1
+                accepted.append(entry)
+            elif status in self.retry_statuses:
+                retry.append(entry)
+            else:
+                logger.error(u"Error indexing {} : {}".format(entry[0], result.get("error")))
+                self.failed += 1
+                self.rejected.add(entry[0])
+
+        if self.hashes:
+            self.hashes.record([(e[0], e[2]) for e in accepted])
+        return retry
+
+
+class SearchDocHashes(object):
+    """
+    Content hashes of the documents in the search index, keyed by document id, stored in Mongo.
+    Used to skip sending documents that haven't changed since they were last indexed,
+    counting how many were `skipped` and how many `changed`.
+    """
+    def __init__(self):
+        self.skipped = 0
+        self.changed = 0
+
+    @staticmethod
+    def hash_doc(doc):
+        return hashlib.md5(json.dumps(doc, sort_keys=True)).hexdigest()
+
+    def unchanged(self, hashes):
+        """
+        Looks up the stored hashes of a batch of documents in one query.
+        :param hashes: list of (doc_id, content hash) tuples
+        :return set: ids of the documents that were last indexed with the same content hash
+        """
+        stored = {rec["_id"]: rec["hash"] for rec in
+                  db.search_doc_hashes.find({"_id": {"$in": list(set([h[0] for h in hashes]))}}, {"hash": 1})}
+        same = set([doc_id for doc_id, content_hash in hashes if stored.get(doc_id) == content_hash])
+        for doc_id, content_hash in hashes:
+            if doc_id in same:
+                self.skipped += 1
+            else:
+                self.changed += 1
+        return same
+
+    def record(self, hashes):
+        """
+        Store the hashes of documents that were indexed.
+        :param hashes: list of (doc_id, content hash) tuples
+        """
+        if not hashes:
+            return
+        op = db.search_doc_hashes.initialize_unordered_bulk_op()
+        for doc_id, content_hash in hashes:
+            op.find({"_id": doc_id}).upsert().replace_one({"_id": doc_id, "hash": content_hash})
+        op.execute()
+
+    @staticmethod
+    def clear():
+        """
+        Forget all hashes, so that every document is sent on the next run.
+        Must be called whenever the search index is deleted.
+        """
+        db.search_doc_hashes.remove({})
+
+
+class SearchBackend(object):
+    """
+    Interface to a search engine that documents are indexed in and queried from.
+    The backend in use is chosen with the SEARCH_BACKEND setting, and returned by :func:`search_backend`.
+    """
+    parallel = True  # May several processes index into this backend at once?
+
+    def indexer(self):
+        """
+        :return: an object with `add(doc_type, doc, doc_id)`, `flush()` and `discard()` methods, `indexed`,
+        `skipped` and `failed` counts and a `rejected` set of the ids of failed documents, that sends documents
+        to this backend.  `discard()` drops the documents added since the last flush.
+        """
+        raise NotImplementedError
+
+    def create_index(self):
+        """
+        Delete all documents, and set up an empty index.
+        """
+        raise NotImplementedError
+
+    def search(self, query, filters=None, lang=None, doc_type=None, page=0, size=20):
+        """
+        Find documents whose content contains all the words and quoted phrases in `query`.
+
+        :param filters: list of category paths (e.g. "Tanach/Torah").  If given, only documents in one of them match.
+        :param lang: "en" or "he", to limit results to one language
+        :param doc_type: "text" or "sheet", to limit results to one document type
+        :return: dict with "total", the number of matches, and "hits", the requested page of matching documents,
+        each as {"_id", "_type", "_source"}, sorted by their order field
+        """
+        raise NotImplementedError
+
+
+class ElasticsearchBackend(SearchBackend):
+    """
+    Search through the Elasticsearch server at SEARCH_ADMIN
+    """
+    def indexer(self):
+        return BulkIndexer(hashes=SearchDocHashes())
+
+    def create_index(self):
+        create_index()
+
+    def search(self, query, filters=None, lang=None, doc_type=None, page=0, size=20):
+        q = {"query_string": {"query": query, "default_field": "content", "default_operator": "AND"}}
+        conditions = []
+        if filters:
+            conditions.append({"or": [{"term": {"path": f}} for f in filters] + [{"prefix": {"path": f + "/"}} for f in filters]})
+        if lang:
+            conditions.append({"term": {"lang": lang}})
+        body = {
+            "query": {"filtered": {"query": q, "filter": {"and": conditions}}} if conditions else q,
+            "sort": [{"order": {}}, {"order_end": {"ignore_unmapped": True}}],
+            "from": page * size,
+            "size": size,
+        }
+        kwargs = {"index": SEARCH_INDEX_NAME}
+        if doc_type:
+            kwargs["doc_type"] = doc_type
+        res = es.search(body, **kwargs)
+        return {
+            "total": res["hits"]["total"],
+            "hits": [{"_id": h["_id"], "_type": h["_type"], "_source": h["_source"]} for h in res["hits"]["hits"]]
+        }
+
+
+class LocalSearchBackend(SearchBackend):
+    """
+    Search through the embedded engine in :mod:`sefaria.search_engine`, with its index in the file at `path`.
+    Its index is written by one process at a time.
+    """
+    parallel = False
+
+    def __init__(self, path=None):
+        self.path = path or SEARCH_LOCAL_PATH
+        self._index = None
+
+    def _local_index(self):
+        if self._index is None:
+            from sefaria.search_engine import LocalSearchIndex
+            self._index = LocalSearchIndex(self.path)
+        return self._index
+
+    def indexer(self):
+        return self._local_index()
+
+    def create_index(self):
+        self._local_index().clear()
+
+    def search(self, query, filters=None, lang=None, doc_type=None, page=0, size=20):
+        return self._local_index().search(query, filters=filters, lang=lang, doc_type=doc_type, page=page, size=size)
+
+
+_backend = None
+
+
+def search_backend():
+    """
+    :return: the :class:`SearchBackend` named by the SEARCH_BACKEND setting
+    """
+    global _backend
+    if _backend is None:
+        _backend = LocalSearchBackend() if SEARCH_BACKEND == "local" else ElasticsearchBackend()
+    return _backend
+
+
+def query(q, filters=None, lang=None, doc_type=None, page=0, size=20):
+    """
+    Search the configured backend.  See :meth:`SearchBackend.search`
+    """
+    return search_backend().search(q, filters=filters, lang=lang, doc_type=doc_type, page=page, size=size)
 
 
-def index_text(oref, version=None, lang=None, bavli_amud=True):
+def index_text(oref, version=None, lang=None, bavli_amud=True, bulk=None, order=None):
     """
     Index the text designated by ref.
     If no version and lang are given, this function will be called for each available version.
     Currently assumes ref is at section level. 
+    Documents are added to `bulk`, an indexer of the search backend, which the caller must flush.
+    If none is passed, one is made and flushed before returning.
+    `order` is the order key of `oref`, if already known.
     """
     assert isinstance(oref, Ref)
 
+    if bulk is None:
+        bulk = search_backend().indexer()
+        index_text(oref, version=version, lang=lang, bavli_amud=bavli_amud, bulk=bulk, order=order)
+        bulk.flush()
+        return
+
     # Recall this function for each specific text version, if non provided
     if not (version and lang):
         for v in oref.version_list():
-            index_text(oref, version=v["versionTitle"], lang=v["language"], bavli_amud=bavli_amud)
+            index_text(oref, version=v["versionTitle"], lang=v["language"], bavli_amud=bavli_amud, bulk=bulk, order=order)
         return
 
     # Index each segment of this document individually
@@ -52,8 +375,9 @@ def index_text(oref, version=None, lang=None, bavli_amud=True):
     elif len(padded_oref.sections) < len(padded_oref.index_node.sectionNames):
         t = TextChunk(oref, lang=lang, vtitle=version)
 
-        for ref in oref.subrefs(len(t.text)):
-            index_text(ref, version=version, lang=lang, bavli_amud=bavli_amud)
+        subrefs = oref.subrefs(len(t.text))
+        for ref, key in zip(subrefs, library.order_keys(subrefs)):
+            index_text(ref, version=version, lang=lang, bavli_amud=bavli_amud, bulk=bulk, order=key)
         return  # Returning at this level prevents indexing of full chapters
 
     '''   Can't get here after the return above
@@ -63,31 +387,36 @@ def index_text(oref, version=None, lang=None, bavli_amud=True):
     '''
 
     # Index this document as a whole
+    global doc_count, error_count
     try:
-        doc = make_text_index_document(oref.normal(), version, lang)
+        doc = make_text_index_document(oref.normal(), version, lang, order=order)
     except Exception as e:
         logger.error(u"Error making index document {} / {} / {} : {}".format(oref.normal(), version, lang, e.message))
+        error_count += 1
         return
 
     if doc:
         try:
-            global doc_count
             if doc_count % 5000 == 0:
                 logger.info(u"[{}] Indexing {} / {} / {}".format(doc_count, oref.normal(), version, lang))
-            es.index('sefaria', 'text', doc, make_text_doc_id(oref.normal(), version, lang))
+            bulk.add('text', doc, make_text_doc_id(oref.normal(), version, lang))
             doc_count += 1
         except Exception, e:
             logger.error(u"ERROR indexing {} / {} / {} : {}".format(oref.normal(), version, lang, e))
+            error_count += 1
 
 
-def make_text_index_document(tref, version, lang):
+def make_text_index_document(tref, version, lang, order=None):
     """
     Create a document for indexing from the text specified by ref/version/lang
+
+    Reads only the one version's section, and joins it with metadata precomputed per index node
+    (see :func:`text_index_metadata`), rather than building a full TextFamily.
+    `order` is the order key of the ref (see :meth:`Ref.order_key`), computed here if not given.
+    Ranges also get the key of their end as "order_end", which breaks ties in "order".
     """
     oref = Ref(tref)
-    text = TextFamily(oref, context=0, commentary=False, version=version, lang=lang).contents()
-
-    content = text["he"] if lang == 'he' else text["text"]
+    content = TextChunk(oref, lang=lang, vtitle=version).text
     if not content:
         # Don't bother indexing if there's no content
         return False
@@ -95,22 +424,24 @@ def make_text_index_document(tref, version, lang):
     if isinstance(content, list):
         content = " ".join(content)
 
-    if text["type"] == "Talmud":
-        title = text["book"] + " Daf " + text["sections"][0]
-    elif text["type"] == "Commentary" and text["commentaryCategories"][0] == "Talmud":
-        title = text["book"] + " Daf " + text["sections"][0]
+    meta = text_index_metadata(oref)
+    inode = oref.index_node
+
+    # Talmud addresses are shown as daf strings (3 -> "2a")
+    sections = [inode.address_class(i).toStr("en", n) if inode.addressTypes[i] == "Talmud" else n
+                for i, n in enumerate(oref.sections)]
+    if meta["daf_title"]:
+        title = oref.book + " Daf " + sections[0]
     else:
-        title = text["book"] + " " + " ".join([u"{} {}".format(p[0], p[1]) for p in zip(text["sectionNames"], text["sections"])])
+        title = oref.book + " " + " ".join([u"{} {}".format(p[0], p[1]) for p in zip(inode.sectionNames, sections)])
     title += u" ({})".format(version)
 
     if lang == "he":
-        title = text.get("heTitle", "") + " " + title
-
+        he_title = oref.he_normal() if meta["talmud_address"] else meta["heTitle"]
+        title = (he_title or "") + " " + title
 
-    if text["categories"][0] in REORDER_RULES:
-        categories = REORDER_RULES[text["categories"][0]] + text["categories"][1:]
-    else:
-        categories = text["categories"]
+    if order is None:
+        order = oref.order_key()
 
     return {
         "title": title, 
@@ -118,18 +449,52 @@ def make_text_index_document(tref, version, lang):
         "heRef": oref.he_normal(),
         "version": version, 
         "lang": lang,
-        "titleVariants": text["titleVariants"],
+        "titleVariants": meta["titleVariants"],
         "content": content,
         "he_content": content if (lang == "he") else "",
 #        "context_3": oref.surrounding_ref().text(lang, version).ja().flatten_to_string(),
 #        "context_7": oref.surrounding_ref(3).text(lang, version).ja().flatten_to_string(),
-        "categories": categories,
-        "order": oref.order_id(),
+        "categories": meta["categories"],
+        "order": order,
+        "order_end": oref.order_key(end=True) if oref.is_range() else order,
         # and
-        "path": "/".join(text["categories"] + [oref.index.title])
+        "path": meta["path"]
     }
 
 
+def text_index_metadata(oref):
+    """
+    Returns the parts of a text search document that are the same for every Ref in the index node of `oref`.
+    Cached per node in library.local_cache, which is cleared when indexes change.
+
+    :return dict: with keys "categories" (after REORDER_RULES), "path", "titleVariants", "heTitle",
+    "daf_title" and "talmud_address"
+    """
+    cache = library.local_cache.setdefault("search_text_metadata", {})
+    inode = oref.index_node
+    key = inode.full_title("en")
+    meta = cache.get(key)
+    if meta is None:
+        index = oref.index
+        categories = index.categories
+        if categories[0] in REORDER_RULES:
+            reordered = REORDER_RULES[categories[0]] + categories[1:]
+        else:
+            reordered = categories
+        commentary_categories = getattr(index, "commentaryCategories", None) if oref.is_commentary() else None
+
+        meta = {
+            "categories": reordered,
+            "path": "/".join(categories + [index.title]),
+            "titleVariants": inode.all_tree_titles("en"),
+            "heTitle": inode.full_title("he"),
+            "daf_title": categories[0] == "Talmud" or (categories[0] == "Commentary" and bool(commentary_categories) and commentary_categories[0] == "Talmud"),
+            "talmud_address": "Talmud" in inode.addressTypes,
+        }
+        cache[key] = meta
+    return meta
+
+
 def make_text_doc_id(ref, version, lang):
     """
     Returns a doc id string for indexing based on ref, versiona and lang.
@@ -158,9 +523,10 @@ def unicode_number(u):
     return n
 
 
-def index_sheet(id):
+def index_sheet(id, bulk=None):
     """
     Index source sheet with 'id'.
+    If an indexer of the search backend is passed as `bulk`, the document is added to it, and the caller must flush.
     """
 
     sheet = db.sheets.find_one({"id": id})
@@ -173,7 +539,12 @@ def index_sheet(id):
         "sheetId": id,
     }
     try:
-        es.index('sefaria', 'sheet', doc, id)
+        if bulk:
+            bulk.add('sheet', doc, id)
+        else:
+            bulk = search_backend().indexer()
+            bulk.add('sheet', doc, id)
+            bulk.flush()
         global doc_count
         doc_count += 1
     except Exception, e:
@@ -287,8 +658,10 @@ def put_text_mapping():
                     'index': 'not_analyzed',
                 },
                 "order": {
-                    'type': 'string',
-                    'index': 'not_analyzed'
+                    'type': 'long',
+                },
+                "order_end": {
+                    'type': 'long',
                 },
                 "he_content": {
                     'type': 'string',
@@ -321,34 +694,123 @@ def put_sheet_mapping():
     return
 
 
-def index_all_sections(skip=0):
+def index_all_sections(resume=False, processes=None):
     """
-    Step through refs of all sections of available text and index each. 
+    Index all sections of available text, partitioned by book across a pool of `processes` worker processes.
+
+    Each book that is indexed without errors is recorded in the index_checkpoint collection, along with its timing.
+    If `resume` is True, books already recorded there are skipped, so that an interrupted run can pick up where
+    it left off, and books that had errors are indexed again.  Otherwise the checkpoint is cleared first.
+
+    :param resume: Skip books recorded in the checkpoint by an earlier run
+    :param processes: Number of worker processes.  Defaults to the number of CPUs.  If 1, indexes in this process.
+    :return: dict of book title -> {"seconds", "docs", "errors"} for the books indexed in this run
     """
-    global doc_count
-    doc_count = 0
+    if not search_backend().parallel:
+        processes = 1
+    if not resume:
+        clear_index_checkpoint()
+    done = set(db.index_checkpoint.distinct("book"))
+    books = [b for b in book_titles_to_index() if b not in done]
+    print "Beginning index of %d books (%d already indexed)." % (len(books), len(done))
+
+    if processes == 1:
+        _init_index_worker(reconnect=False)
+        results = (_index_book(book) for book in books)
+    else:
+        pool = multiprocessing.Pool(processes, initializer=_init_index_worker)
+        results = pool.imap_unordered(_index_book, books)
+
+    stats = {}
+    for book, book_stats in results:
+        stats[book] = book_stats
+        if not book_stats["errors"]:
+            # Books with errors aren't recorded, so that a resumed run indexes them again
+            db.index_checkpoint.save(dict(book_stats, book=book, date=datetime.now()))
+        print "Indexed %s: %d documents (%d unchanged), %d errors in %.1fs (%d / %d books)" % (
+            book, book_stats["docs"], book_stats["skipped"], book_stats["errors"], book_stats["seconds"], len(stats), len(books))
+
+    if processes != 1:
+        pool.close()
+        pool.join()
+
+    total_docs = sum([st["docs"] for st in stats.values()])
+    total_skipped = sum([st["skipped"] for st in stats.values()])
+    total_errors = sum([st["errors"] for st in stats.values()])
+    print "Indexed %d documents with %d errors. %d changed, %d unchanged and skipped." % (
+        total_docs, total_errors, total_docs - total_skipped, total_skipped)
+    slowest = sorted(stats.items(), key=lambda x: x[1]["seconds"], reverse=True)[:10]
+    print "Slowest books: " + ", ".join([u"{} ({:.1f}s)".format(b, st["seconds"]) for b, st in slowest])
+    return stats
 
-    #refs = counts.generate_refs_list()
-    refs = library.ref_list()
-    print "Beginning index of %d refs." % len(refs)
 
+def book_titles_to_index():
+    """
+    :return: list of titles of all books with a VersionState, in the order they were created
+    """
+    return [vs["title"] for vs in db.vstate.find({}, {"title": 1}).sort("_id", 1)]
+
+
+def clear_index_checkpoint():
+    """
+    Forget which books have been indexed, so that the next run of index_all_sections() starts from the beginning.
+    """
+    db.index_checkpoint.remove({})
+
+
+_worker_bulk = None
+
+
+def _init_index_worker(reconnect=True):
+    """
+    Set up a process to index books: its own Mongo sockets and its own bulk buffer.
+    """
+    global _worker_bulk
+    if reconnect:
+        # Sockets inherited from the parent process can't be shared; new ones are opened on next use.
+        from sefaria.system.database import connection
+        connection.disconnect()
+    _worker_bulk = search_backend().indexer()
 
-    for i in range(skip, len(refs)):
-        index_text(refs[i])
-        if i % 200 == 0:
-            print "Indexed Ref #%d" % i
 
-    print "Indexed %d documents." % doc_count
+def _index_book(title):
+    """
+    Index every section of the book `title`, using this process's bulk buffer.
+    :return: tuple of (title, dict of "seconds", "docs", "errors")
+    """
+    global doc_count, error_count
+    scache.check_texts_cache()
+    doc_count = 0
+    error_count = 0
+    start = time.time()
+    failed_before = _worker_bulk.failed
+    skipped_before = _worker_bulk.skipped
+    try:
+        for oref in VersionStateSet({"title": title}).all_refs():
+            index_text(oref, bulk=_worker_bulk)
+        _worker_bulk.flush()
+    except Exception as e:
+        logger.error(u"Error indexing book {} : {}".format(title, e))
+        error_count += 1
+        _worker_bulk.discard()  # So that this book's buffered documents aren't sent with the next book
+    return title, {
+        "seconds": time.time() - start,
+        "docs": doc_count,
+        "skipped": _worker_bulk.skipped - skipped_before,
+        "errors": error_count + _worker_bulk.failed - failed_before,
+    }
 
 
-def index_public_sheets():
+def index_public_sheets(bulk=None):
     """
     Index all source sheets that are publically listed.
     """
     from sheets import LISTED_SHEETS
     ids = db.sheets.find({"status": {"$in": LISTED_SHEETS}}).distinct("id")
+    bulk = bulk or search_backend().indexer()
     for id in ids:
-        index_sheet(id)
+        index_sheet(id, bulk=bulk)
+    bulk.flush()
 
 
 def index_public_notes():
@@ -364,6 +826,7 @@ def clear_index():
     """
     Delete the search index.
     """
+    SearchDocHashes.clear()
     try:
         es.delete_index(SEARCH_INDEX_NAME)
     except Exception, e:
@@ -385,21 +848,112 @@ def add_ref_to_index_queue(ref, version, lang):
     return True
 
 
-def index_from_queue():
+QUEUE_BATCH_SIZE = 100
+QUEUE_CLAIM_TIMEOUT = timedelta(hours=1)  # claims older than this are assumed abandoned, and may be claimed again
+
+
+def claim_queue_batch(batch_size=QUEUE_BATCH_SIZE):
     """
-    Index every ref/version/lang found in the index queue.
-    Delete queue records on success.
+    Atomically claim up to `batch_size` items from the index queue for this worker.
+    Each item is claimed with a conditional update, so concurrent workers never receive the same item.
+    Items claimed by a worker that didn't finish within QUEUE_CLAIM_TIMEOUT are available again.
+
+    :return: list of raw queue records claimed
     """
-    queue = db.index_queue.find()
-    for item in queue:
+    token = ObjectId()
+    now = datetime.now()
+    claimable = {"$or": [{"claimed_by": None}, {"claimed_at": {"$lt": now - QUEUE_CLAIM_TIMEOUT}}]}
+    ids = [item["_id"] for item in db.index_queue.find(claimable, {"_id": 1}).sort("_id", 1).limit(batch_size)]
+    if not ids:
+        return []
+    db.index_queue.update({"$and": [{"_id": {"$in": ids}}, claimable]},
+                          {"$set": {"claimed_by": token, "claimed_at": now}},
+                          multi=True)
+    return list(db.index_queue.find({"claimed_by": token}))
+
+
+def queue_items_to_sections(items):
+    """
+    Collapse queue items into the distinct section level (ref, version, lang) triples that need reindexing.
+    Many edits to the segments of one section, in one version, result in one reindex of that section.
+
+    :return: tuple of (dict of (section ref string, version, lang) -> list of queue item ids, list of ids of items that failed)
+    """
+    sections = {}
+    failed = []
+    for item in items:
         try:
-            index_text(Ref(item["ref"]), version=item["version"], lang=item["lang"])
-            db.index_queue.remove(item)
+            oref = Ref(item["ref"])
+            orefs = oref.split_spanning_ref() if oref.is_spanning() else [oref]
+            for r in orefs:
+                r = r.section_ref() if r.is_segment_level() else r
+                sections.setdefault((r.normal(), item["version"], item["lang"]), []).append(item["_id"])
         except Exception, e:
-            import sys
-            reload(sys)
-            sys.setdefaultencoding("utf-8")
-            logging.error(u"Error indexing from queue ({} / {} / {}) : {}".format(item["ref"], item["version"], item["lang"], e))
+            logger.error(u"Error reading queue item ({} / {} / {}) : {}".format(item["ref"], item["version"], item["lang"], e))
+            failed.append(item["_id"])
+    return sections, failed
+
+
+def rejected_queue_items(doc_ids, sections):
+    """
+    Maps the ids of documents that the search backend rejected back to the queue items of their sections.
+
+    :param doc_ids: ids of rejected documents, as made by make_text_doc_id()
+    :param sections: dict of (section ref string, version, lang) -> list of queue item ids, from queue_items_to_sections()
+    :return: set of queue item ids
+    """
+    items = set()
+    for doc_id in doc_ids:
+        for (tref, version, lang), ids in sections.items():
+            suffix = make_text_doc_id(u"", version, lang)
+            if not doc_id.endswith(suffix):
+                continue
+            try:
+                oref = Ref(doc_id[:-len(suffix)])
+            except Exception:
+                continue
+            oref = oref.section_ref() if oref.is_segment_level() else oref
+            if oref.normal() == tref:
+                items.update(ids)
+    return items
+
+
+def index_from_queue(batch_size=QUEUE_BATCH_SIZE, continuous=False, poll_interval=10):
+    """
+    Index every ref/version/lang found in the index queue.
+    Items are claimed in batches, deduplicated and collapsed to sections, and indexed through a :class:`BulkIndexer`.
+    Processed items are deleted together once their batch is sent.
+    Items that fail, including those with documents that the backend rejected, remain claimed,
+    and are retried once their claim times out.
+
+    :param continuous: If True, keep polling the queue every `poll_interval` seconds rather than returning when it is empty
+    """
+    bulk = search_backend().indexer()
+    while True:
+        items = claim_queue_batch(batch_size)
+        if not items:
+            if not continuous:
+                return
+            time.sleep(poll_interval)
+            continue
+
+        sections, failed = queue_items_to_sections(items)
+        failed = set(failed)
+        for (tref, version, lang), ids in sections.items():
+            try:
+                index_text(Ref(tref), version=version, lang=lang, bulk=bulk)
+            except Exception, e:
+                logger.error(u"Error indexing from queue ({} / {} / {}) : {}".format(tref, version, lang, e))
+                failed.update(ids)
+        bulk.flush()
+        failed.update(rejected_queue_items(bulk.rejected, sections))
+        bulk.rejected.clear()
+
+        done = [item["_id"] for item in items if item["_id"] not in failed]
+        if done:
+            db.index_queue.remove({"_id": {"$in": done}})
+        logger.info(u"Indexed {} sections from {} queue items ({} failed). Documents indexed: {}, unchanged: {}".format(
+            len(sections), len(items), len(failed), bulk.indexed, bulk.skipped))
 
 
 def add_recent_to_queue(ndays):
@@ -420,20 +974,20 @@ def add_recent_to_queue(ndays):
         add_ref_to_index_queue(ref[0], ref[1], ref[2])
 
 
-def index_all(skip=0, clear=False):
+def index_all(clear=False, resume=False, processes=None):
     """
     Fully create the search index from scratch.
+    If `resume` is True, continues an interrupted run, skipping books that it completed.
+
+    `clear` deletes and recreates the index, with the current mappings.  It is required when a mapping changes,
+    e.g. after "order" changed from a string to a long and "order_end" was added, as Elasticsearch can't
+    change the type of a mapped field in place.
     """
     start = datetime.now()
     if clear:
-        create_index()
-    index_all_sections(skip=skip)
+        search_backend().create_index()
+        resume = False
+    index_all_sections(resume=resume, processes=processes)
     index_public_sheets()
     end = datetime.now()
     print "Elapsed time: %s" % str(end-start)
-
-
-
-
-
-
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+search_engine.py - an embedded full-text search engine, for use in place of Elasticsearch
+in development, testing and small mirrors.
+
+Documents are kept in an inverted index (term -> documents and word positions) stored in an SQLite file.
+Supports AND queries of words, quoted phrase queries, filters by category path, language and document type.
+Results are sorted by the "order" field of the documents (see Ref.order_key()), and then by "order_end".
+
+Hebrew is normalized by removing nikkud and cantillation, so that pointed and unpointed texts match.
+"""
+import os
+import re
+import json
+import sqlite3
+import hashlib
+from array import array
+
+import logging
+logger = logging.getLogger(__name__)
+
+from sefaria.utils.hebrew import strip_cantillation
+
+
+TAG_RE = re.compile(ur"<[^>]+>")
+TOKEN_RE = re.compile(ur"\w+", re.UNICODE)
+PHRASE_RE = re.compile(ur'"([^"]*)"|(\S+)', re.UNICODE)
+HEBREW_SEPARATORS_RE = re.compile(ur"[\u05be\u05c0\u05c3\u05c6]")  # maqaf, paseq, sof pasuq, nun hafukha
+HEBREW_ABBREVIATION_RE = re.compile(ur"[\u05f3\u05f4]")  # geresh, gershayim
+SQL_PARAM_LIMIT = 900  # SQLite's limit on host parameters in one statement is 999
+UNORDERED = 2 ** 63 - 1  # sort key of documents without an order, such as sheets, which sort last
+
+
+def normalize(text):
+    """
+    Returns `text` lower cased, with html tags, nikkud, cantillation and Hebrew punctuation removed.
+    Geresh and gershayim are dropped, rather than split on, so that abbreviations remain one word.
+    """
+    if not isinstance(text, unicode):
+        text = text.decode("utf-8")
+    text = TAG_RE.sub(u" ", text)
+    text = strip_cantillation(text, strip_vowels=True)
+    text = HEBREW_SEPARATORS_RE.sub(u" ", text)
+    text = HEBREW_ABBREVIATION_RE.sub(u"", text)
+    return text.lower()
+
+
+def tokenize(text):
+    """
+    :return: list of the normalized words of `text`, in order
+    """
+    return TOKEN_RE.findall(normalize(text))
+
+
+def parse_query(query):
+    """
+    Splits a query into the phrases it requires.  Quoted parts are phrases, other words are phrases of one word.
+    :return: list of lists of normalized words
+    """
+    phrases = []
+    for quoted, word in PHRASE_RE.findall(query):
+        words = tokenize(quoted or word)
+        if words:
+            phrases.append(words)
+    return phrases
+
+
+class LocalSearchIndex(object):
+    """
+    An inverted index of search documents, stored in the SQLite file at `path`.
+
+    Documents are added with the same interface as :class:`sefaria.search.BulkIndexer`:
+
+    ::
+
+        index = LocalSearchIndex("/path/to/search.db")
+        index.add("text", doc, doc_id)
+        index.flush()
+        index.search(u'"בראשית ברא" Genesis', filters=["Tanach/Torah"])
+
+    Adding a document with an existing id replaces it.  A document whose content hasn't changed is skipped,
+    so rebuilding the index from the whole library only does work for changed texts.
+    Changes are committed only on flush(), so that discard() drops all of them, e.g. those of a book that failed part way.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.indexed = 0
+        self.skipped = 0
+        self.failed = 0  # Documents that couldn't be indexed.  Always 0, as SQLite raises rather than rejecting documents.
+        self.rejected = set()  # Ids of those documents, so always empty.
+        self._pending = 0
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._conn = sqlite3.connect(path, timeout=60)
+        self._conn.text_factory = unicode
+        self._create_tables()
+
+    def _create_tables(self):
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS docs (
+                id INTEGER PRIMARY KEY,
+                doc_id TEXT UNIQUE,
+                doc_type TEXT,
+                lang TEXT,
+                path TEXT,
+                sort_key INTEGER,
+                sort_end INTEGER,
+                hash TEXT,
+                source TEXT
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT,
+                doc INTEGER,
+                positions BLOB,
+                PRIMARY KEY (term, doc)
+            );
+            CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc);
+        """)
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(docs)")]
+        if "sort_end" not in columns:  # Index files made before ties were broken by order_end
+            self._conn.execute("ALTER TABLE docs ADD COLUMN sort_end INTEGER")
+        self._conn.commit()
+
+    def add(self, doc_type, doc, doc_id):
+        """
+        Add or replace the document `doc_id`, indexing the words of its "content" field.
+        """
+        doc_id = unicode(doc_id)
+        source = json.dumps(doc, sort_keys=True)
+        content_hash = hashlib.md5(source).hexdigest()
+
+        cur = self._conn.cursor()
+        row = cur.execute("SELECT id, hash FROM docs WHERE doc_id = ?", (doc_id,)).fetchone()
+        if row and row[1] == content_hash:
+            self.skipped += 1
+            return
+        if row:
+            cur.execute("DELETE FROM postings WHERE doc = ?", (row[0],))
+            cur.execute("DELETE FROM docs WHERE id = ?", (row[0],))
+
+        sort_key = doc.get("order", UNORDERED)
+        cur.execute("INSERT INTO docs (doc_id, doc_type, lang, path, sort_key, sort_end, hash, source) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (doc_id, doc_type, doc.get("lang"), doc.get("path", u""), sort_key, doc.get("order_end", sort_key), content_hash, source))
+        rowid = cur.lastrowid
+
+        positions = {}
+        for i, term in enumerate(tokenize(doc.get("content", u""))):
+            positions.setdefault(term, array("I")).append(i)
+        cur.executemany("INSERT INTO postings (term, doc, positions) VALUES (?, ?, ?)",
+                        [(term, rowid, sqlite3.Binary(p.tostring())) for term, p in positions.iteritems()])
+
+        self.indexed += 1
+        self._pending += 1
+
+    def flush(self):
+        """
+        Commit added documents.
+        """
+        self._conn.commit()
+        self._pending = 0
+
+    def discard(self):
+        """
+        Roll back documents added since the last flush, taking them out of the `indexed` count.
+        """
+        self._conn.rollback()
+        self.indexed -= self._pending
+        self._pending = 0
+
+    def delete(self, doc_id):
+        cur = self._conn.cursor()
+        row = cur.execute("SELECT id FROM docs WHERE doc_id = ?", (unicode(doc_id),)).fetchone()
+        if row:
+            cur.execute("DELETE FROM postings WHERE doc = ?", (row[0],))
+            cur.execute("DELETE FROM docs WHERE id = ?", (row[0],))
+            self._conn.commit()
+
+    def clear(self):
+        """
+        Remove all documents.
+        """
+        self._conn.executescript("DELETE FROM postings; DELETE FROM docs;")
+        self._conn.commit()
+
+    def count(self):
+        return self._conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def close(self):
+        self.flush()
+        self._conn.close()
+
+    def _postings(self, term):
+        """
+        :return: dict of document rowid -> array of positions of `term`
+        """
+        result = {}
+        for doc, blob in self._conn.execute("SELECT doc, positions FROM postings WHERE term = ?", (term,)):
+            positions = array("I")
+            positions.fromstring(str(blob))
+            result[doc] = positions
+        return result
+
+    def _phrase_docs(self, words, candidates=None):
+        """
+        :return: set of rowids of documents containing the `words` consecutively,
+        limited to `candidates` if not None
+        """
+        postings = []
+        for word in sorted(set(words), key=lambda w: self._term_count(w)):  # rarest terms first narrow quickest
+            p = self._postings(word)
+            docs = set(p.keys()) if candidates is None else candidates & set(p.keys())
+            if not docs:
+                return set()
+            candidates = docs
+            postings.append((word, p))
+        if len(words) == 1:
+            return candidates
+
+        by_word = dict(postings)
+        matched = set()
+        for doc in candidates:
+            following = [set(by_word[w][doc]) for w in words[1:]]
+            for start in by_word[words[0]][doc]:
+                if all([(start + i + 1) in following[i] for i in range(len(following))]):
+                    matched.add(doc)
+                    break
+        return matched
+
+    def _term_count(self, term):
+        return self._conn.execute("SELECT COUNT(*) FROM postings WHERE term = ?", (term,)).fetchone()[0]
+
+    def search(self, query, filters=None, lang=None, doc_type=None, page=0, size=20):
+        """
+        Find documents containing all the words and quoted phrases of `query`.
+
+        :param filters: list of category paths (e.g. "Tanach/Torah").  If given, only documents in one of them match.
+        :param lang: "en" or "he", to limit results to one language
+        :param doc_type: "text" or "sheet", to limit results to one document type
+        :return: dict with "total", the number of matches, and "hits", the requested page of matching documents,
+        each as {"_id", "_type", "_source"}, sorted by their order and then order_end fields
+        """
+        phrases = parse_query(query)
+        if not phrases:
+            return {"total": 0, "hits": []}
+
+        candidates = None
+        for words in phrases:
+            candidates = self._phrase_docs(words, candidates)
+            if not candidates:
+                return {"total": 0, "hits": []}
+
+        rows = []
+        candidates = list(candidates)
+        for i in range(0, len(candidates), SQL_PARAM_LIMIT):
+            chunk = candidates[i:i + SQL_PARAM_LIMIT]
+            rows += self._conn.execute(
+                "SELECT id, doc_type, lang, path, sort_key, sort_end FROM docs WHERE id IN ({})".format(",".join("?" * len(chunk))),
+                chunk).fetchall()
+
+        if filters:
+            prefixes = [(f, f + u"/") for f in filters]
+            rows = [r for r in rows if any([r[3] == f or r[3].startswith(fp) for f, fp in prefixes])]
+        if lang:
+            rows = [r for r in rows if r[2] == lang]
+        if doc_type:
+            rows = [r for r in rows if r[1] == doc_type]
+
+        rows.sort(key=lambda r: (r[4], r[5]))
+        page_rows = rows[page * size:(page + 1) * size]
+        hits = []
+        for r in page_rows:
+            doc_id, source = self._conn.execute("SELECT doc_id, source FROM docs WHERE id = ?", (r[0],)).fetchone()
+            hits.append({"_id": doc_id, "_type": r[1], "_source": json.loads(source)})
+        return {"total": len(rows), "hits": hits}
@@ -102,7 +102,9 @@ MIDDLEWARE_CLASSES = (
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django_mobile.middleware.MobileDetectionMiddleware',
+    'sefaria.system.middleware.TextsCacheMiddleware',
     'sefaria.system.middleware.ProfileMiddleware',
+    'sefaria.system.middleware.CacheMetricsMiddleware',
     'django_mobile.middleware.SetFlavourMiddleware',
     #'django.middleware.cache.UpdateCacheMiddleware',
     #'django.middleware.cache.FetchFromCacheMiddleware',
@@ -250,6 +252,10 @@ LOGGING = {
     }
 }
 
+# sefaria.system.cache.CacheNamespace shares changes and build leases between processes through this cache,
+# which needs atomic add() and incr() to do so, e.g. memcached:
+#     'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache', 'LOCATION': '127.0.0.1:11211'
+# With the file based cache, every change invalidates a whole namespace, and concurrent misses are each built.
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
@@ -257,6 +263,24 @@ CACHES = {
     }
 }
 
+# Batching of documents sent to the Elasticsearch _bulk endpoint.
+# A batch is flushed when it reaches either limit.
+SEARCH_BULK_SIZE = 500
+SEARCH_BULK_BYTES = 5 * 1024 * 1024  # 5 MB
+
+# "elasticsearch", or "local" to use the embedded engine in sefaria/search_engine.py,
+# which keeps its index in the file at SEARCH_LOCAL_PATH and needs no search server.
+SEARCH_BACKEND = "elasticsearch"
+SEARCH_LOCAL_PATH = relative_to_abs_path('../data/search/search.db')
+
+# Seconds between the lines of cache metrics logged by each process
+CACHE_METRICS_LOG_INTERVAL = 600
+
+# Refs preloaded by sefaria.warmup.post_fork as each web server process starts:
+# the first WARMUP_REF_COUNT lines of the file at WARMUP_REFS_PATH, one ref per line, most requested first.
+WARMUP_REFS_PATH = None
+WARMUP_REF_COUNT = 0
+
 # Grab enviornment specific settings from a file which
 # is left out of the repo.
 try:
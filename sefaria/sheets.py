@@ -4,17 +4,26 @@ sheets.py - backend core for Sefaria Source sheets
 Writes to MongoDB Collection: sheets
 """
 import regex
+import json
+import hashlib
+import time
+import multiprocessing
+from bisect import bisect_right
 from datetime import datetime, timedelta
 
 import dateutil.parser
 
 import sefaria.model as model
 from sefaria.system.database import db
+import sefaria.system.cache as scache
+from sefaria.system.exceptions import InputError
+from sefaria.model.text import ORDER_KEY_SECTION_DIGITS, ORDER_KEY_SECTION_DEPTH
 from sefaria.model.notification import Notification, NotificationSet
 from sefaria.model.following import FollowersSet
 from sefaria.model.user_profile import annotate_user_list
-from sefaria.utils.util import strip_tags, string_overlap
-from sefaria.utils.users import user_link
+from sefaria.utils.util import strip_tags, string_overlap, prefix_table
+from sefaria.search_engine import normalize
+from sefaria.utils.users import resolve_users
 from history import record_sheet_publication, delete_sheet_publication
 from settings import SEARCH_INDEX_ON_SAVE
 import search
@@ -35,6 +44,15 @@ GROUP_SHEETS       = (GROUP_SHEET, PUBLIC_GROUP_SHEET)
 
 # Simple cache of the last updated time for sheets
 last_updated = {}
+last_updated_metrics = scache.metrics("sheets_last_updated", size=lambda: len(last_updated))
+
+# Directory of public sheets by tag, built by make_sheet_list_by_tag()
+sheet_tag_cache = scache.namespace("sheet_tags", local_size=10)
+SHEET_TAG_CACHE_DURATION = 60 * 60  # Sheets' views, which order the directory, change without invalidating it
+SHEET_TAG_PAGE_SIZE = 50
+
+# Number of Hebrew section text matchers each process of update_included_refs() keeps for refining refs
+SECTION_MATCHER_CACHE_SIZE = 2000
 
 
 def get_sheet(id=None):
@@ -97,8 +115,10 @@ def save_sheet(sheet, user_id):
 	"""
 	sheet["dateModified"] = datetime.now().isoformat()
 	status_changed = False
+	old_directory_entry = None
 	if "id" in sheet:
 		existing = db.sheets.find_one({"id": sheet["id"]})
+		old_directory_entry = _tag_directory_entry(existing)
 
 		if sheet["lastModified"] != existing["dateModified"]:
 			# Don't allow saving if the sheet has been modified since the time
@@ -142,6 +162,9 @@ def save_sheet(sheet, user_id):
 
 	db.sheets.update({"id": sheet["id"]}, sheet, True, False)
 
+	if _tag_directory_entry(sheet) != old_directory_entry:
+		invalidate_sheet_tag_cache()
+
 	if sheet["status"] in LISTED_SHEETS and SEARCH_INDEX_ON_SAVE:
 		search.index_sheet(sheet["id"])
 
@@ -198,65 +221,132 @@ def add_ref_to_sheet(id, ref):
 	return {"status": "ok", "id": id, "ref": ref}
 
 
-def refs_in_sources(sources):
+def refs_in_sources(sources, section_matchers=None):
 	"""
 	Recurisve function that returns a list of refs found anywhere in sources.
+	'section_matchers' is passed on to refine_ref_by_text().
 	"""
 	refs = []
 	for source in sources:
 		if "ref" in source:
 			text = source.get("text", {}).get("he", None)
-			ref  = refine_ref_by_text(source["ref"], text) if text else source["ref"]
+			ref  = refine_ref_by_text(source["ref"], text, section_matchers) if text else source["ref"]
 			refs.append(ref)
 		if "subsources" in source:
-			refs = refs + refs_in_sources(source["subsources"])
+			refs = refs + refs_in_sources(source["subsources"], section_matchers)
 
 	return refs
 
 
-def refine_ref_by_text(ref, text):
+WHITESPACE_RE = regex.compile(ur"\s+")
+
+
+def normalize_snippet(text):
+	"""
+	Returns 'text' as compared by SectionMatcher: without tags, nikkud or cantillation, and with runs of whitespace
+	made single spaces.
+	"""
+	return WHITESPACE_RE.sub(u" ", normalize(text)).strip()
+
+
+class SectionMatcher(object):
+	"""
+	An index of the segments of a section of text, which finds the segments that a quoted snippet comes from.
+
+	The normalized segments are joined into one string, with the offset each starts at, so that a snippet
+	within a segment, or running across several, is found with one substring search.
+	"""
+	def __init__(self, segments):
+		# Sections with nested segments, like spanning refs such as "Shabbat 3a-3b", can't be matched.
+		self.matchable = all([isinstance(seg, basestring) for seg in segments])
+		self.segments  = [normalize_snippet(seg) for seg in segments] if self.matchable else []
+		self.offsets   = []
+		offset = 0
+		for seg in self.segments:
+			self.offsets.append(offset)
+			offset += len(seg) + 1
+		self.joined = u" ".join(self.segments)
+
+	def segment_at(self, position):
+		"""
+		Returns the index of the segment containing 'position' in the joined text.
+		"""
+		return bisect_right(self.offsets, position) - 1
+
+	def find(self, snippet):
+		"""
+		Returns a tuple of the (1-based) first and last segments that 'snippet' comes from, or None if not found.
+
+		If the whole snippet isn't in the text, as when it was edited or abridged, it is taken to start at the first
+		segment whose end overlaps its beginning, and to end at the next segment whose beginning overlaps its end.
+		"""
+		needle = normalize_snippet(snippet)
+		if not self.matchable or not needle:
+			return None
+
+		position = self.joined.find(needle)
+		if position != -1:
+			return self.segment_at(position) + 1, self.segment_at(position + len(needle) - 1) + 1
+
+		needle_table = prefix_table(needle)
+		start = None
+		for n, seg in enumerate(self.segments):
+			if not start:
+				if string_overlap(seg, needle, needle_table):
+					start = n + 1
+			elif string_overlap(needle, seg):
+				return start, n + 1
+		return None
+
+
+def section_matcher(oref, section_matchers=None):
+	"""
+	Returns a SectionMatcher of the Hebrew text of the section 'oref'.
+	If 'section_matchers' (an LRUCache) is given, the matcher is looked up in and added to it,
+	so that sheets quoting the same sections don't load and index them again.
+	"""
+	key     = oref.normal()
+	matcher = section_matchers.get(key) if section_matchers is not None else None
+	if matcher is None:
+		matcher = SectionMatcher(model.TextChunk(oref, lang="he").text)
+		if section_matchers is not None:
+			section_matchers.set(key, matcher)
+	return matcher
+
+
+def refine_ref_by_text(ref, text, section_matchers=None):
 	"""
 	Returns a ref (string) which refines 'ref' (string) by comparing 'text' (string),
 	to the hebrew text stored in the Library.
+	'section_matchers' is passed on to section_matcher().
 	"""
 	try:
 		oref   = model.Ref(ref).section_ref()
 	except:
 		return ref
-	needle = strip_tags(text).strip().replace("\n", "")
-	hay    = model.TextChunk(oref, lang="he").text
-
-	start, end = None, None
-	for n in range(len(hay)):
-		if not isinstance(hay[n], basestring):
-			# TODO handle this case
-			# happens with spanning ref like "Shabbat 3a-3b"
-			return ref
-
-		if needle in hay[n]:
-			start, end = n+1, n+1
-			break
-
-		if not start and string_overlap(hay[n], needle):
-			start = n+1
-		elif string_overlap(needle, hay[n]):
-			end = n+1
-			break
-
-	if start and end:
+
+	found = section_matcher(oref, section_matchers).find(text)
+	if found:
+		start, end = found
 		if start == end:
-			refined = "%s:%d" % (oref.normal(), start)
+			ref = "%s:%d" % (oref.normal(), start)
 		else:
-			refined = "%s:%d-%d" % (oref.normal(), start, end)
-		ref = refined
+			ref = "%s:%d-%d" % (oref.normal(), start, end)
 
 	return ref
 
 
-def update_included_refs(hours=1):
+def update_included_refs(hours=1, processes=None, batch_size=500, force=False):
 	"""
 	Rebuild included_refs index on all sheets that have been modified
 	in the last 'hours' or all sheets if hours is 0.
+
+	Sheets whose sources are unchanged since they were last indexed, according to the hash
+	stored in included_refs_hash, are skipped unless 'force' is set.  So refs that couldn't be
+	resolved before, e.g. to texts added to the Library since, are only resolved again with 'force'.  The rest are sent in
+	batches of 'batch_size' to a pool of 'processes' worker processes (defaulting to the number
+	of CPUs, or this process alone if 1), and their updates written with unordered bulk operations.
+	Returns a dict of counts of sheets "updated" and "skipped".
 	"""
 	if hours == 0:
 		query = {}
@@ -265,13 +355,156 @@ def update_included_refs(hours=1):
 		query = { "dateModified": { "$gt": cutoff.isoformat() } }
 
 	db.sheets.ensure_index("included_refs")
+	ensure_ref_range_index()
+
+	counts = {"updated": 0, "skipped": 0}
+	batches = _changed_sheet_batches(query, batch_size, force, counts)
+	pool = None
+	if processes == 1:
+		_init_refs_worker(reconnect=False)
+		results = (_sheet_refs(batch) for batch in batches)
+	else:
+		pool = multiprocessing.Pool(processes, initializer=_init_refs_worker)
+		results = pool.imap_unordered(_sheet_refs, batches)
 
-	sheets = db.sheets.find(query)
+	try:
+		for updates in results:
+			op = db.sheets.initialize_unordered_bulk_op()
+			for sheet_id, refs, ranges, new_hash in updates:
+				op.find({"_id": sheet_id}).update_one({"$set": {
+					"included_refs": refs,
+					"included_ref_ranges": ranges,
+					"included_refs_hash": new_hash,
+				}})
+			op.execute()
+			counts["updated"] += len(updates)
+	except:
+		if pool:
+			pool.terminate()
+		raise
+	finally:
+		if pool:
+			pool.close()
+			pool.join()
 
-	for sheet in sheets:
+	return counts
+
+
+def sources_hash(sources):
+	"""
+	Returns a hash of 'sources', which changes whenever the refs included in them may have.
+	"""
+	return hashlib.md5(json.dumps(sources, sort_keys=True, default=unicode)).hexdigest()
+
+
+def _changed_sheet_batches(query, batch_size, force, counts):
+	"""
+	Generates lists of at most 'batch_size' (sheet _id, sources, hash of sources) for the sheets matching 'query'
+	whose sources have changed since their included refs were last updated, or all of them if 'force'.
+	Unchanged sheets are counted in counts["skipped"].
+	"""
+	batch = []
+	for sheet in db.sheets.find(query, {"sources": 1, "included_refs_hash": 1}):
 		sources = sheet.get("sources", [])
-		refs = refs_in_sources(sources)
-		db.sheets.update({"_id": sheet["_id"]}, {"$set": {"included_refs": refs}})
+		new_hash = sources_hash(sources)
+		if not force and sheet.get("included_refs_hash") == new_hash:
+			counts["skipped"] += 1
+			continue
+		batch.append((sheet["_id"], sources, new_hash))
+		if len(batch) >= batch_size:
+			yield batch
+			batch = []
+	if batch:
+		yield batch
+
+
+_worker_section_matchers = None
+
+
+def _init_refs_worker(reconnect=True):
+	"""
+	Set up a process to find the refs in sheets: its own Mongo sockets and its own cache of section matchers.
+	"""
+	global _worker_section_matchers
+	if reconnect:
+		# Sockets inherited from the parent process can't be shared; new ones are opened on next use.
+		from sefaria.system.database import connection
+		connection.disconnect()
+	_worker_section_matchers = scache.LRUCache(SECTION_MATCHER_CACHE_SIZE)
+
+
+def _sheet_refs(batch):
+	"""
+	Returns a list of (sheet _id, included refs, their ref_ranges(), hash of sources) for each sheet in 'batch',
+	as generated by _changed_sheet_batches().
+	"""
+	scache.check_texts_cache()
+	results = []
+	for sheet_id, sources, new_hash in batch:
+		refs = refs_in_sources(sources, _worker_section_matchers)
+		results.append((sheet_id, refs, ref_ranges(refs), new_hash))
+	return results
+
+
+SECTION_KEY_MAX = 10 ** ORDER_KEY_SECTION_DIGITS - 1
+
+
+def section_key(sections, fill=0):
+	"""
+	Returns an int which orders the position 'sections' within a text, like the section part of Ref.order_key().
+	Levels missing from 'sections' are given the value 'fill'.
+	"""
+	key = 0
+	for i in range(ORDER_KEY_SECTION_DEPTH):
+		key = key * (SECTION_KEY_MAX + 1) + (min(sections[i], SECTION_KEY_MAX) if i < len(sections) else fill)
+	return key
+
+
+def ref_ranges(trefs):
+	"""
+	Returns the structured form of the refs in 'trefs', as stored in the included_ref_ranges field of sheets
+	and queried by get_sheets_for_ref(): a list of {"ref", "book", "start", "end", "anchorVerse"},
+	where "start" and "end" are the section_key()s of the first and last sections of the ref.
+	Refs that can't be parsed are left out.
+	"""
+	ranges = []
+	for tref in trefs:
+		try:
+			oref = model.Ref(tref)
+		except InputError:
+			continue
+		ranges.append({
+			"ref":         oref.normal(),
+			"book":        oref.book,
+			"start":       section_key(oref.sections),
+			"end":         section_key(oref.toSections, SECTION_KEY_MAX),
+			"anchorVerse": oref.sections[-1] if oref.sections else None,
+		})
+	return ranges
+
+
+def ensure_ref_range_index():
+	db.sheets.ensure_index([("included_ref_ranges.book", 1), ("included_ref_ranges.start", 1)])
+
+
+def backfill_ref_ranges(batch_size=500):
+	"""
+	Sets included_ref_ranges on sheets that have included_refs but no included_ref_ranges.
+	Returns the number of sheets updated.
+
+	get_sheets_for_ref() only finds sheets by their included_ref_ranges, so this must be run
+	(with scripts/update_sheet_ref_index.py --backfill) before deploying code that reads them.
+	"""
+	ensure_ref_range_index()
+	count = 0
+	while True:
+		sheets = list(db.sheets.find({"included_refs": {"$exists": True}, "included_ref_ranges": {"$exists": False}},
+										{"included_refs": 1}).limit(batch_size))
+		if not sheets:
+			return count
+		for sheet in sheets:
+			db.sheets.update({"_id": sheet["_id"]}, {"$set": {"included_ref_ranges": ref_ranges(sheet["included_refs"])}})
+		count += len(sheets)
 
 
 def get_sheets_for_ref(tref, pad=True, context=1):
@@ -288,24 +521,25 @@ def get_sheets_for_ref(tref, pad=True, context=1):
 	if context:
 		oref = oref.context_ref(context)
 
-	ref_re = oref.regex()
-
+	condition, matches_range = ref_range_query(oref)
 	results = []
-	sheets = db.sheets.find({"included_refs": {"$regex": ref_re}, "status": {"$in": LISTED_SHEETS}},
-								{"id": 1, "title": 1, "owner": 1, "included_refs": 1})
+	sheets = list(db.sheets.find({"included_ref_ranges": {"$elemMatch": condition}, "status": {"$in": LISTED_SHEETS}},
+								{"id": 1, "title": 1, "owner": 1, "included_ref_ranges": 1}))
+
+	owners = resolve_users([sheet["owner"] for sheet in sheets])
 	for sheet in sheets:
 		# Check for multiple matching refs within this sheet
-		matched_orefs = [model.Ref(r) for r in sheet["included_refs"] if regex.match(ref_re, r)]
-		for match in matched_orefs:
+		matches = [r for r in sheet["included_ref_ranges"] if matches_range(r)]
+		for match in matches:
 			com                = {}
 			com["category"]    = "Sheets"
 			com["type"]        = "sheet"
 			com["owner"]       = sheet["owner"]
 			com["_id"]         = str(sheet["_id"])
-			com["anchorRef"]   = match.normal()
-			com["anchorVerse"] = match.sections[-1]
+			com["anchorRef"]   = match["ref"]
+			com["anchorVerse"] = match["anchorVerse"]
 			com["public"]      = True
-			com["commentator"] = user_link(sheet["owner"])
+			com["commentator"] = owners[sheet["owner"]]["link"]
 			com["text"]        = "<a class='sheetLink' href='/sheets/%d'>%s</a>" % (sheet["id"], strip_tags(sheet["title"]))
 
 			results.append(com)
@@ -313,12 +547,36 @@ def get_sheets_for_ref(tref, pad=True, context=1):
 	return results
 
 
+def ref_range_query(oref):
+	"""
+	Returns a tuple of a query for an element of included_ref_ranges, and a function testing one, that match
+	the refs which start within 'oref'.  Refs to nodes within a complex text match a ref to the text or
+	to a node containing them, as with oref.regex().
+	"""
+	start = section_key(oref.sections)
+	end   = section_key(oref.toSections, SECTION_KEY_MAX)
+	if oref.index_node.has_titled_continuation():
+		separators = u"|".join([regex.escape(sep) for sep in oref.index_node.title_separators])
+		book_re    = u"^{}($|{})".format(regex.escape(oref.book), separators)
+		book       = {"$regex": book_re}
+		book_match = lambda b: regex.match(book_re, b) is not None
+	else:
+		book       = oref.book
+		book_match = lambda b: b == oref.book
+
+	query = {"book": book, "start": {"$gte": start, "$lte": end}}
+	return query, lambda r: book_match(r["book"]) and start <= r["start"] <= end
+
+
 def update_sheet_tags(sheet_id, tags):
 	"""
 	Sets the tag list for sheet_id to those listed in list 'tags'.
 	"""
 	tags = list(set(tags)) 	# tags list should be unique
+	existing = db.sheets.find_one({"id": sheet_id}, {"title": 1, "status": 1, "tags": 1})
 	db.sheets.update({"id": sheet_id}, {"$set": {"tags": tags}})
+	if existing and _tag_directory_entry(existing) != _tag_directory_entry(dict(existing, tags=tags)):
+		invalidate_sheet_tag_cache()
 
 	return {"status": "ok"}
 
@@ -328,7 +586,9 @@ def get_last_updated_time(sheet_id):
 	Returns a timestamp of the last modified date for sheet_id.
 	"""
 	if sheet_id in last_updated:
+		last_updated_metrics.hit()
 		return last_updated[sheet_id]
+	last_updated_metrics.miss()
 
 	sheet = db.sheets.find_one({"id": sheet_id}, {"dateModified": 1})
 
@@ -342,26 +602,92 @@ def get_last_updated_time(sheet_id):
 def make_sheet_list_by_tag():
 	"""
 	Returns an alphabetized list of tags and sheets included in each tag.
-	"""
-	tags = {}
+	Each tag is a dict of "tag", "count" and "sheets", a list of {"id", "title", "views"} sorted by most viewed.
+	"""
+	query = {"status": {"$in": LISTED_SHEETS}, "tags.0": {"$exists": True}}
+	# Only ids are grouped, to keep the aggregation's result, which is one document, small
+	tag_ids = db.sheets.aggregate([
+		{"$match": query},
+		{"$project": {"_id": 0, "id": 1, "tags": 1}},
+		{"$unwind": "$tags"},
+		{"$group": {"_id": "$tags", "ids": {"$push": "$id"}}},
+		{"$sort": {"_id": 1}},
+	])["result"]
+
+	sheets = {}
+	for sheet in db.sheets.find(query, {"_id": 0, "id": 1, "title": 1, "views": 1}):
+		sheets[sheet["id"]] = {"id": sheet["id"], "title": strip_tags(sheet["title"]), "views": sheet.get("views", 0)}
+
 	results = []
+	for tag in tag_ids:
+		tag_sheets = sorted([sheets[id] for id in tag["ids"] if id in sheets], key=lambda x: -x["views"])
+		results.append({"tag": tag["_id"], "count": len(tag_sheets), "sheets": tag_sheets})
 
-	sheet_list = db.sheets.find({"status": {"$in": LISTED_SHEETS }})
-	for sheet in sheet_list:
-		sheet_tags = sheet.get("tags", [])
-		for tag in sheet_tags:
-			if tag not in tags:
-				tags[tag] = {"tag": tag, "count": 0, "sheets": []}
-			tags[tag]["sheets"].append({"title": strip_tags(sheet["title"]), "id": sheet["id"], "views": sheet["views"]})
-			tags[tag]["count"] += 1
+	return results
 
-	for tag in tags.values():
-		tag["sheets"] = sorted(tag["sheets"], key=lambda x: -x["views"] )
-		results.append(tag)
 
-	results = sorted(results, key=lambda x: x["tag"])
+def _sheet_tag_directory():
+	"""
+	Returns {"built": time, "tags": make_sheet_list_by_tag()} from the cache, rebuilding it once it is older
+	than SHEET_TAG_CACHE_DURATION.
+	"""
+	build = lambda: {"built": time.time(), "tags": make_sheet_list_by_tag()}
+	directory = sheet_tag_cache.get_or_build("directory", build, SHEET_TAG_CACHE_DURATION)
+	if time.time() - directory["built"] > SHEET_TAG_CACHE_DURATION:
+		# The shared copy has expired or been replaced, but this process's local copy doesn't expire on its own
+		sheet_tag_cache.drop_local("directory")
+		directory = sheet_tag_cache.get_or_build("directory", build, SHEET_TAG_CACHE_DURATION)
+	return directory
 
-	return results
+
+def get_sheet_list_by_tag():
+	"""
+	Returns the list of make_sheet_list_by_tag(), from the cache if it's there.
+	"""
+	return _sheet_tag_directory()["tags"]
+
+
+def get_tag_sheets_page(tag, page=0, size=SHEET_TAG_PAGE_SIZE):
+	"""
+	Returns the 'page'th page of 'size' public sheets tagged with 'tag', as listed by get_sheet_list_by_tag(),
+	in a dict of "tag", "count" (of all sheets with the tag), "page", "size" and "sheets".
+	Returns None if no public sheet has the tag.
+	"""
+	directory = _sheet_tag_directory()
+	local     = sheet_tag_cache.local_dict()
+	built, by_tag = local.get("by_tag", (None, None))
+	if built != directory["built"]:  # Index the directory by tag once each time it is rebuilt
+		by_tag = {t["tag"]: t for t in directory["tags"]}
+		local["by_tag"] = (directory["built"], by_tag)
+
+	entry = by_tag.get(tag)
+	if not entry:
+		return None
+	return {
+		"tag":    tag,
+		"count":  entry["count"],
+		"page":   page,
+		"size":   size,
+		"sheets": entry["sheets"][page * size:(page + 1) * size],
+	}
+
+
+def invalidate_sheet_tag_cache():
+	"""
+	Drops the cached directory of sheets by tag, in every process.
+	Called whenever a sheet's entry in it (see _tag_directory_entry()) changes.
+	"""
+	sheet_tag_cache.invalidate()
+
+
+def _tag_directory_entry(sheet):
+	"""
+	Returns what the directory of sheets by tag shows of 'sheet': its tags and title, or None if it isn't listed there.
+	(Views, which order the directory, are left to expire with SHEET_TAG_CACHE_DURATION.)
+	"""
+	if not sheet or sheet.get("status") not in LISTED_SHEETS or not sheet.get("tags"):
+		return None
+	return sorted(sheet["tags"]), sheet.get("title")
 
 
 def get_sheets_by_tag(tag, public=True, uid=None, group=None):
@@ -438,6 +764,7 @@ def make_sheet_from_text(text, sources=None, uid=1, generatedBy=None, title=None
 
 	i     = oref.index
 	leafs = i.nodes.get_leaf_nodes()
+	link_filter = model.LinkFilter(sources) if sources else None
 	for leaf in leafs:
 		refs = []
 		if leaf.first_section_ref() != leaf.last_section_ref():
@@ -450,7 +777,7 @@ def make_sheet_from_text(text, sources=None, uid=1, generatedBy=None, title=None
 			ref_dict = { "ref": ref.normal() }
 			if sources:
 				ref_dict["subsources"] = []
-				subsources = ref.linkset().filter(sources)
+				subsources = model.LinkSet({"$and": [{"refs": {"$regex": ref.regex()}}, link_filter.query()]})
 				for sub in subsources:
 					subref = sub.refs[1] if regex.match(ref.regex(), sub.refs[0]) else sub.refs[0]
 					ref_dict["subsources"].append({"ref": subref})
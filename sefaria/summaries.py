@@ -3,6 +3,11 @@
 summaries.py - create and manage Table of Contents document for all texts
 
 Writes to MongoDB Collection: summaries
+
+The TOC is stored as a document named "toc", holding the whole tree and a list of patches,
+each recording a change to one text (see :func:`apply_toc_patch`).  A change to one text only appends its patch.
+Readers apply the patches to the tree as they load it, and the tree is rewritten whole, with its patches removed,
+once TOC_PATCH_LIMIT of them have accumulated.
 """
 import json
 from datetime import datetime
@@ -114,79 +119,192 @@ REORDER_RULES = {
     #"Targum":      ["Tanach", "Targum"]
 }
 
+TOC_PATCH_LIMIT = 200  # patches stored before the TOC document is rewritten whole
+
 
 def get_toc():
     """
     Returns table of contents object from cache,
     DB or by generating it, as needed.
+    Only one process loads it at a time.
     """
-    toc_cache = scache.get_cache_elem('toc_cache')
-    if toc_cache:
-        return toc_cache
-
-    toc = get_toc_from_db()
-    if toc:
-        save_toc(toc)
-        return toc
+    def load():
+        toc = get_toc_from_db()
+        if toc:
+            save_toc(toc)
+            return toc
+        return update_table_of_contents()
 
-    return update_table_of_contents()
+    return scache.texts_cache.get_or_build('toc_cache', load, store=False)
 
 
 def get_toc_json():
     """
     Returns JSON representation of TOC.
     """
-    toc_json = scache.get_cache_elem('toc_json_cache')
+    toc_json = scache.texts_cache.get('toc_json_cache')
     if toc_json:
         return toc_json
     toc = get_toc()
     toc_json = json.dumps(toc)
-    scache.set_cache_elem('toc_json_cache', toc_json, 600000)
+    scache.texts_cache.set('toc_json_cache', toc_json, 600000)
     return toc_json
 
 
+def get_toc_payload():
+    """
+    Returns the TOC JSON with its gzip compressed form and ETag, as made by make_payload(),
+    for serving by the table of contents API without serializing or compressing per request.
+    """
+    from sefaria.client.util import make_payload
+    return scache.texts_cache.get_or_build('toc_payload_cache', lambda: make_payload(get_toc_json()), 600000)
+
+
 def save_toc(toc):
     """
     Saves the table of contents object to in-memory cache,
-    invalidtes texts_list cache.
+    invalidtes texts_list cache and the values derived from the TOC, in every process.
     """
-    scache.set_cache_elem('toc_cache', toc, 600000)
+    scache.texts_cache.set('toc_cache', toc, 600000)
+    scache.texts_cache.delete('toc_json_cache')
+    scache.texts_cache.delete('toc_payload_cache')
     scache.delete_template_cache("texts_list")
     scache.delete_template_cache("texts_dashboard")
-    library.local_cache.pop("category_id_dict", None)
+    scache.texts_cache.changed(["toc_cache", "toc_json_cache", "toc_payload_cache", "category_id_dict", "order_base_table"])
 
 
 def get_toc_from_db():
     """
-    Retrieves the table of contents stored in MongoDB.
+    Retrieves the table of contents stored in MongoDB, with the patches saved since it was last written whole.
     """
     toc = db.summaries.find_one({"name": "toc"})
-    return toc["contents"] if toc else None
+    if not toc:
+        return None
+    return _patched_toc(toc)
 
 
-def save_toc_to_db():
-    """
-    Saves table of contents to MongoDB.
-    (This write can be slow.)
-    """
-    db.summaries.remove()
-    toc_doc = {
+def _patched_toc(toc_doc):
+    contents = toc_doc["contents"]
+    for patch in toc_doc.get("patch_list", []):
+        contents = apply_toc_patch(contents, patch)
+    return contents
+
+
+def _toc_doc(contents, version):
+    return {
         "name": "toc",
-        "contents": scache.get_cache_elem('toc_cache'),
+        "contents": contents,
+        "version": version,
+        "patches": 0,
+        "patch_list": [],
         "dateSaved": datetime.now(),
     }
-    db.summaries.save(toc_doc)
+
+
+def save_toc_to_db(toc=None):
+    """
+    Saves the whole table of contents to MongoDB, replacing the stored tree and its patches.
+    (This write can be slow.)
+
+    :param toc: the table of contents to save. Defaults to the cached one, or else the stored one, or a new build.
+    """
+    if toc is None:
+        toc = scache.texts_cache.get('toc_cache') or get_toc_from_db() or build_toc_tree()
+    old = db.summaries.find_one({"name": "toc"}, {"version": 1})
+    version = old.get("version", 0) + 1 if old else 1
+    db.summaries.update({"name": "toc"}, _toc_doc(toc, version), upsert=True)
+
+
+def compact_toc_in_db(attempts=3):
+    """
+    Rewrites the stored table of contents with its patches applied, and empties its list of patches.
+    The rewrite only replaces the document as it was read, so a patch saved meanwhile is never dropped;
+    the rewrite is tried again on the newer document instead.
+    """
+    for i in range(attempts):
+        doc = db.summaries.find_one({"name": "toc"})
+        if not doc:
+            return
+        version = doc.get("version", 0)
+        condition = {"name": "toc", "version": version, "patches": doc.get("patches", 0)}
+        if db.summaries.find_and_modify(condition, _toc_doc(_patched_toc(doc), version + 1), fields={"_id": 1}):
+            return
+
+
+def save_toc_patch_to_db(patch):
+    """
+    Saves a change to one text of the table of contents, made with apply_toc_patch(), to MongoDB.
+    The patch is appended to the stored document and counted in one atomic update.
+    Rewrites the whole table of contents once TOC_PATCH_LIMIT patches have accumulated.
+    """
+    state = db.summaries.find_and_modify({"name": "toc"}, {"$inc": {"patches": 1}, "$push": {"patch_list": patch}},
+                                         fields={"patches": 1}, new=True)
+    if not state:
+        save_toc_to_db()
+        return
+    if state["patches"] >= TOC_PATCH_LIMIT:
+        compact_toc_in_db()
+
+
+def apply_toc_patch(toc, patch):
+    """
+    Applies to `toc` a change to one text, and returns it.  `patch` is one of:
+
+    * {"op": "delete", "title": title} - removes the text `title`
+    * {"op": "set", "categories": categories, "text": text, "old_title": title or None, "resort_other": bool} -
+      replaces the text `old_title` (or titled like `text`) in the category `categories` with `text`, or adds it.
+      If `resort_other`, a new category may have been added to "Other", which is sorted again.
+    """
+    if patch["op"] == "delete":
+        return recur_delete_element_from_toc(patch["title"], toc)
+
+    node = get_or_make_summary_node(toc, patch["categories"])
+    text = patch["text"]
+    test_title = patch.get("old_title") or text["title"]
+    for item in node:
+        if item.get("title") == test_title:
+            item.update(text)
+            break
+    else:
+        node.append(text)
+        node[:] = sort_toc_node(node)
+
+    if patch.get("resort_other"):
+        toc[-1]["contents"] = sort_toc_node(toc[-1]["contents"])
+    return toc
 
 
 def update_table_of_contents():
+    """
+    Rebuilds the table of contents from the database, and saves it.
+    Always rebuilds, even if another process is rebuilding it, since that rebuild may have started before
+    the change that this one is for.  Concurrent readers are kept to one build by get_toc().
+    """
+    toc = build_toc_tree()
+    save_toc(toc)
+    save_toc_to_db(toc)
+
+    return toc
+
+
+def build_toc_tree(preload=True):
+    """
+    Builds the table of contents from the database.
+
+    :param preload: if True, loads all Index records and the state of every text in two queries up front,
+    rather than text by text.  (False is the old way, kept for comparison in scripts/profile_toc.py)
+    """
     toc = []
+    states = load_version_state_contents() if preload else None
 
     # Add an entry for every text we know about
     indices = IndexSet()
     for i in indices:
-        print i.categories
         if i.is_commentary():
             # Special case commentary below
+            if preload:
+                # Cache the commentator, so that "X on Y" titles below resolve without loading it
+                scache.set_index(i.title, i, getattr(i, "titleVariants", []))
             continue
         if i.categories[0] in REORDER_RULES:
             i.categories = REORDER_RULES[i.categories[0]] + i.categories[1:]
@@ -196,7 +314,7 @@ def update_table_of_contents():
             i.categories.insert(0, "Other")
 
         node = get_or_make_summary_node(toc, i.categories)
-        text = add_counts_to_index(i.toc_contents())
+        text = add_counts_to_index(i.toc_contents(), states)
         node.append(text)
 
     # Special handling to list available commentary texts which do not have
@@ -215,17 +333,12 @@ def update_table_of_contents():
             cats = i.categories[0:1] + ["Commentary"] + i.categories[1:]
 
         node = get_or_make_summary_node(toc, cats)
-        text = add_counts_to_index(i.toc_contents())
+        text = add_counts_to_index(i.toc_contents(), states)
         node.append(text)
 
 
     # Recursively sort categories and texts
-    toc = sort_toc_node(toc, recur=True)
-
-    save_toc(toc)
-    save_toc_to_db()
-
-    return toc
+    return sort_toc_node(toc, recur=True)
 
 
 def update_summaries_on_delete(ref, toc = None):
@@ -233,9 +346,10 @@ def update_summaries_on_delete(ref, toc = None):
     Deletes a title from the ToC
     :param ref: really the title of a book in the ToC
     """
-    toc = recur_delete_element_from_toc(ref, get_toc())
+    patch = {"op": "delete", "title": ref}
+    toc = apply_toc_patch(get_toc(), patch)
     save_toc(toc)
-    save_toc_to_db()
+    save_toc_patch_to_db(patch)
 
 
 def recur_delete_element_from_toc(ref, toc):
@@ -283,7 +397,6 @@ def update_summaries_on_change(bookname, old_ref=None, recount=True):
     if recount:
         #counts.update_full_text_count(bookname)
         VersionState(bookname).refresh()
-    toc = get_toc()
     resort_other = False
 
     if indx_dict["categories"][0] in REORDER_RULES:
@@ -292,31 +405,16 @@ def update_summaries_on_change(bookname, old_ref=None, recount=True):
     if indx_dict["categories"][0] != "Commentary":
         if indx_dict["categories"][0] not in ORDER:
             indx_dict["categories"].insert(0, "Other")
-            resort_other = True
-        node = get_or_make_summary_node(toc, indx_dict["categories"])
-        text = add_counts_to_index(indx_dict)
+            resort_other = True  # A new category may have been added to other
+        cats = indx_dict["categories"]
     else:
         cats = indx_dict["categories"][1:2] + ["Commentary"] + indx_dict["categories"][2:]
-        node = get_or_make_summary_node(toc, cats)
-        text = add_counts_to_index(indx_dict)
-
-    found = False
-    test_title = old_ref or text["title"]
-    for item in node:
-        if item.get("title") == test_title:
-            item.update(text)
-            found = True
-            break
-    if not found:
-        node.append(text)
-        node[:] = sort_toc_node(node)
-
-    # If a new category may have been added to other, resort the cateogries
-    if resort_other:
-        toc[-1]["contents"] = sort_toc_node(toc[-1]["contents"])
+    text = add_counts_to_index(indx_dict)
 
+    patch = {"op": "set", "categories": cats, "text": text, "old_title": old_ref, "resort_other": resort_other}
+    toc = apply_toc_patch(get_toc(), patch)
     save_toc(toc)
-    save_toc_to_db()
+    save_toc_patch_to_db(patch)
 
 
 def update_summaries():
@@ -327,6 +425,21 @@ def update_summaries():
     scache.reset_texts_cache()
 
 
+def find_summary_node(summary, nodes):
+    """
+    Returns the contents of the node in 'summary' that is named by the list of categories in 'nodes',
+    or None if there is no such node.  Unlike get_or_make_summary_node(), doesn't change 'summary'.
+    """
+    for category in nodes:
+        for node in summary:
+            if node.get("category") == category:
+                summary = node["contents"]
+                break
+        else:
+            return None
+    return summary
+
+
 def get_or_make_summary_node(summary, nodes):
     """
     Returns the node in 'summary' that is named by the list of categories in 'nodes',
@@ -350,12 +463,31 @@ def get_or_make_summary_node(summary, nodes):
     return get_or_make_summary_node(summary[-1]["contents"], nodes[1:])
 
 
-def add_counts_to_index(indx_dict):
+def load_version_state_contents():
+    """
+    Returns a dict of Index title -> the content of its VersionState, for every text, loaded in one query.
+    """
+    return {vs["title"]: vs["content"] for vs in db.vstate.find({}, {"title": 1, "content": 1})}
+
+
+def add_counts_to_index(indx_dict, states=None):
     """
     Returns a dictionary representing a text which includes index info,
     and text counts.
+
+    :param states: dict from load_version_state_contents().  Texts not in it have their state loaded on their own.
     """
-    vs = StateNode(indx_dict["title"])
+    vs = None
+    if states is not None:
+        snode = library.get_schema_node(indx_dict["title"]) or library.get_schema_node(indx_dict["title"], with_commentary=True)
+        content = states.get(snode.index.title) if snode else None
+        if content is not None:
+            try:
+                vs = StateNode(_obj=reduce(lambda d, k: d[k], snode.version_address(), content))
+            except KeyError:
+                vs = None
+    if vs is None:
+        vs = StateNode(indx_dict["title"])
     indx_dict["sparseness"] = max(vs.get_sparseness("he"), vs.get_sparseness("en"))
     return indx_dict
 
@@ -544,3 +676,15 @@ def category_id_dict(toc=None, cat_head="", code_head=""):
 
     return d
 
+
+def order_base_table():
+    """
+    Returns a dict mapping the paths of the categories and texts in the TOC, as in category_id_dict(),
+    to integers that order them as they appear in the TOC.  Used as the base of Ref.order_key().
+    """
+    d = library.local_cache.get("order_base_table")
+    if not d:
+        ids = category_id_dict()
+        d = {key: i for i, key in enumerate(sorted(ids, key=ids.get))}
+        library.local_cache["order_base_table"] = d
+    return d
@@ -1,87 +1,775 @@
-
 import hashlib
 import sys
+import time
+import uuid
+import threading
+from collections import OrderedDict
+
+import logging
+logger = logging.getLogger(__name__)
 
 if not hasattr(sys, '_doc_build'):
     from django.core.cache import cache
 
-# Simple caches for indices, parsed refs, table of contents and texts list
-index_cache = {}
+
+GENERATION_DURATION = 60 * 60 * 24 * 30  # the longest relative timeout memcached accepts
+
+# Cache backends whose add() and incr() are atomic across processes.  Django's file based and database
+# caches read and then write, so two processes can both succeed at add(), or get the same number from incr().
+ATOMIC_BACKENDS = ("MemcachedCache", "PyLibMCCache", "RedisCache", "LocalCacheBackend")
+
+
+def is_atomic(backend):
+    """
+    :return bool: True if the add() and incr() of the cache backend `backend` are atomic (see ATOMIC_BACKENDS)
+    """
+    return type(backend).__name__ in ATOMIC_BACKENDS
+
+
+class CacheMetrics(object):
+    """
+    Counters of the use of one cache, in this process: hits, misses, evictions (items dropped to make room,
+    or expired), deletes (items dropped on request, e.g. on a change or invalidation), and the number and duration
+    of builds of missing values.  `size` is a function that returns the number of items in the cache, if known.
+    Other counters can be kept with count().
+    """
+    def __init__(self, name, size=None):
+        self.name = name
+        self.size = size
+        self.reset()
+
+    def reset(self):
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0, "deletes": 0}
+        self.builds = 0
+        self.build_seconds = 0.0
+        self.max_build_seconds = 0.0
+
+    def count(self, counter, n=1):
+        self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def hit(self):
+        self.counters["hits"] += 1
+
+    def miss(self):
+        self.counters["misses"] += 1
+
+    def evicted(self, n=1):
+        self.counters["evictions"] += n
+
+    def deleted(self, n=1):
+        self.counters["deletes"] += n
+
+    def built(self, seconds):
+        self.builds += 1
+        self.build_seconds += seconds
+        self.max_build_seconds = max(self.max_build_seconds, seconds)
+
+    def timed(self, build, *args, **kwargs):
+        """
+        Returns `build(*args, **kwargs)`, recording the time it took as a build.
+        """
+        start = time.time()
+        try:
+            return build(*args, **kwargs)
+        finally:
+            self.built(time.time() - start)
+
+    def report(self):
+        requests = self.counters["hits"] + self.counters["misses"]
+        report = dict(self.counters)
+        report.update({
+            "hit_rate": round(float(self.counters["hits"]) / requests, 4) if requests else None,
+            "size": self.size() if self.size else None,
+            "builds": self.builds,
+            "build_seconds": round(self.build_seconds, 3),
+            "max_build_seconds": round(self.max_build_seconds, 3),
+        })
+        return report
+
+
+cache_metrics = OrderedDict()
+METRICS_LOG_INTERVAL = 600  # seconds between lines logged by maybe_log_metrics()
+_metrics_logged_at = time.time()
+
+
+def metrics(name, size=None):
+    """
+    :return: the :class:`CacheMetrics` called `name`, registering it if it doesn't exist yet
+    """
+    if name not in cache_metrics:
+        cache_metrics[name] = CacheMetrics(name, size)
+    elif size:
+        cache_metrics[name].size = size
+    return cache_metrics[name]
+
+
+def metrics_report():
+    """
+    :return: dict of cache name -> report of its counters, for every cache with metrics
+    """
+    return OrderedDict((name, m.report()) for name, m in cache_metrics.iteritems())
+
+
+def log_metrics():
+    parts = []
+    for name, r in metrics_report().iteritems():
+        parts.append(u"{} hits={} misses={} hit_rate={} size={} evictions={} builds={} build_seconds={}".format(
+            name, r["hits"], r["misses"], r["hit_rate"], r["size"], r["evictions"], r["builds"], r["build_seconds"]))
+    logger.info(u"Cache metrics: " + u"; ".join(parts))
+
+
+def maybe_log_metrics(interval=None):
+    """
+    Logs a line of cache metrics, if none was logged by this process in the last `interval` seconds.
+    """
+    global _metrics_logged_at
+    now = time.time()
+    if now - _metrics_logged_at >= (interval or METRICS_LOG_INTERVAL):
+        _metrics_logged_at = now
+        log_metrics()
+
+
+class MeteredDict(dict):
+    """
+    A dict that counts the hits and misses of get() in `metrics`.
+    """
+    def __init__(self, metrics, *args, **kwargs):
+        super(MeteredDict, self).__init__(*args, **kwargs)
+        self.metrics = metrics
+
+    def get(self, key, default=None):
+        if key in self:
+            self.metrics.hit()
+            return self[key]
+        self.metrics.miss()
+        return default
+
+
+class LRUCache(object):
+    """
+    A dict of at most `max_size` items, which drops the least recently used item when full.
+    Evictions are counted in `metrics`, if given.
+    """
+    def __init__(self, max_size=1000, metrics=None):
+        self.max_size = max_size
+        self.metrics = metrics
+        self._items = OrderedDict()
+
+    def get(self, key, default=None):
+        try:
+            value = self._items.pop(key)
+        except KeyError:
+            return default
+        self._items[key] = value
+        return value
+
+    def set(self, key, value):
+        self._items.pop(key, None)
+        self._items[key] = value
+        if len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+            if self.metrics:
+                self.metrics.evicted()
+
+    def delete(self, key):
+        self._items.pop(key, None)
+
+    def keys(self):
+        return self._items.keys()
+
+    def clear(self):
+        self._items.clear()
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+
+class LocalCacheBackend(object):
+    """
+    An in-process stand-in for the shared cache, with the parts of the Django cache API that
+    :class:`CacheNamespace` uses.  For tests, and for running a single process without a cache server.
+    """
+    def __init__(self):
+        self._items = {}  # key -> (value, expiry time or None)
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        item = self._items.get(key)
+        if item and item[1] is not None and item[1] <= time.time():
+            del self._items[key]
+            return None
+        return item
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._get(key)
+        return item[0] if item else default
+
+    def get_many(self, keys):
+        with self._lock:
+            items = [(key, self._get(key)) for key in keys]
+        return {key: item[0] for key, item in items if item}
+
+    def set(self, key, value, timeout=None):
+        with self._lock:
+            self._items[key] = (value, time.time() + timeout if timeout else None)
+
+    def add(self, key, value, timeout=None):
+        with self._lock:
+            if self._get(key):
+                return False
+            self._items[key] = (value, time.time() + timeout if timeout else None)
+            return True
+
+    def incr(self, key, delta=1):
+        with self._lock:
+            item = self._get(key)
+            if not item:
+                raise ValueError("Key '{}' not found".format(key))
+            self._items[key] = (item[0] + delta, item[1])
+            return item[0] + delta
+
+    def delete(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+class CacheNamespace(object):
+    """
+    A named group of cache keys, with a per-process LRU in front of the shared cache.
+
+    Keys are stored in the shared cache under the namespace's current generation, a counter
+    which is itself kept in the shared cache.  invalidate() bumps the generation, so that every
+    key in the namespace is dropped at once, in every process, without enumerating the keys.
+    Entries of old generations are never read again, and expire from the shared cache on their own.
+
+    Each process rereads the generation at most every `check_interval` seconds, so other workers
+    see an invalidation within that time.  When a process sees a new generation, it empties its
+    local tier and calls the functions registered with on_invalidate().
+
+    Values that can't be stored in the shared cache (e.g. compiled regular expressions) can be kept in
+    local_dict(), a plain dict that lasts for one generation in this process.
+
+    For changes that touch only part of the namespace, changed() drops the given keys instead,
+    and passes its `tags` (e.g. the titles of changed texts) to the functions registered with on_change(),
+    in every process.  Changes are kept in a numbered log in the shared cache, which each process reads
+    when it rereads the generation.  A process that finds part of the log missing drops everything it holds locally.
+
+    Expensive values should be filled with get_or_build(), so that after a miss only one process builds
+    the value, while the others serve the value they held before it was dropped, or wait for it.
+
+    The change log and build leases rely on the shared cache's add() and incr() being atomic.  With a backend
+    where they aren't (see is_atomic(), or pass `atomic`), changed() invalidates the whole namespace instead,
+    and every process that misses builds the value itself.
+    """
+    def __init__(self, name, local_size=1000, duration=600000, check_interval=1, backend=None,
+                 lease_timeout=120, lease_wait=30, lease_poll=0.1, atomic=None):
+        self.name = name
+        self.atomic = atomic
+        self.duration = duration
+        self.check_interval = check_interval
+        self.backend = backend
+        self.lease_timeout = lease_timeout
+        self.lease_wait = lease_wait
+        self.lease_poll = lease_poll
+        self.metrics = metrics("namespace:" + name, size=lambda: len(self.local))
+        self.local_dict_metrics = metrics("namespace:" + name + ":local_dict", size=lambda: len(self._local_dict))
+        self.local = LRUCache(local_size, metrics=self.metrics)
+        # Values dropped from the local tier, served by get_or_build() while another process rebuilds them.
+        # Each is dropped when a new value is read or built.
+        self._stale = LRUCache(local_size)
+        self._local_dict = MeteredDict(self.local_dict_metrics)
+        self._listeners = []
+        self._change_listeners = []
+        self._generation = None
+        self._change_seen = 0
+        self._checked_at = 0
+
+    def _backend(self):
+        return self.backend or cache
+
+    def _atomic(self):
+        return self.atomic if self.atomic is not None else is_atomic(self._backend())
+
+    def _generation_key(self):
+        return "ns:{}:generation".format(self.name)
+
+    def _shared_key(self, key):
+        return "ns:{}:{}:{}".format(self.name, self.generation(), key)
+
+    def _change_count_key(self):
+        return "ns:{}:{}:changes".format(self.name, self._generation)
+
+    def _change_key(self, num):
+        return "ns:{}:{}:change:{}".format(self.name, self._generation, num)
+
+    def generation(self):
+        """
+        :return: the current generation of this namespace, rereading it from the shared cache if it is
+        more than `check_interval` seconds old
+        """
+        now = time.time()
+        if self._generation is None or now - self._checked_at >= self.check_interval:
+            backend = self._backend()
+            gen = backend.get(self._generation_key())
+            if gen is None:
+                # Start from the time, rather than 1, so that a generation counter that was evicted
+                # doesn't restart at a number whose entries are still in the cache.
+                gen = int(now * 1000)
+                if not backend.add(self._generation_key(), gen, GENERATION_DURATION):
+                    gen = backend.get(self._generation_key()) or gen
+            self._checked_at = now
+            if gen != self._generation:
+                changed = self._generation is not None
+                self._generation = gen
+                self._change_seen = backend.get(self._change_count_key()) or 0
+                self._clear_local(changed)
+            else:
+                self._read_changes()
+        return self._generation
+
+    def _clear_local(self, notify=True):
+        self.metrics.deleted(len(self.local))
+        self.local_dict_metrics.deleted(len(self._local_dict))
+        if notify:
+            self.metrics.count("invalidations")
+        for key in self.local.keys():
+            self._stale.set(key, self.local.get(key))
+        self.local.clear()
+        self._local_dict = MeteredDict(self.local_dict_metrics)
+        if notify:
+            for listener in self._listeners:
+                listener()
+
+    def _read_changes(self):
+        """
+        Apply the changes logged by other processes since this process last looked.
+        """
+        backend = self._backend()
+        count = backend.get(self._change_count_key()) or 0
+        if count <= self._change_seen:
+            return
+        keys = [self._change_key(num) for num in range(self._change_seen + 1, count + 1)]
+        changes = backend.get_many(keys)
+        self._change_seen = count
+        if len(changes) < len(keys):
+            logger.warning(u"Missing changes in cache namespace {}.  Clearing local cache.".format(self.name))
+            self._clear_local()
+            return
+        for key in keys:
+            self.apply_change(*changes[key])
+
+    def get(self, key):
+        self.generation()
+        value = self.local.get(key)
+        if value is not None:
+            self.metrics.hit()
+            self.metrics.count("local_hits")
+            return value
+        value = self._backend().get(self._shared_key(key))
+        if value is not None:
+            self.metrics.hit()
+            self.metrics.count("shared_hits")
+            self.local.set(key, value)
+            self._stale.delete(key)
+        else:
+            self.metrics.miss()
+        return value
+
+    def set(self, key, value, duration=None):
+        self.generation()
+        self.local.set(key, value)
+        self._stale.delete(key)
+        self._backend().set(self._shared_key(key), value, duration or self.duration)
+
+    def delete(self, key):
+        self.metrics.deleted()
+        self.local.delete(key)
+        self._backend().delete(self._shared_key(key))
+
+    def drop_local(self, key):
+        """
+        Drop `key` from this process's local tier only, so that the next get() reads the shared cache.
+        For a value known to be out of date here, e.g. one that has expired from the shared cache.
+        """
+        self.local.delete(key)
+
+    def get_or_build(self, key, build, duration=None, store=True):
+        """
+        Returns the value of `key`, building it with `build()` if it is missing.
+        Only one process builds at a time (see single_flight()).
+        Processes that find a build in progress return their last value of `key`, if they held one.
+
+        :param store: If False, `build` stores the value itself
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        def build_and_store():
+            built = self._backend().get(self._shared_key(key))  # Stored by a build that finished as we took the lease
+            if built is None:
+                built = self.metrics.timed(build)
+                if store and built is not None:
+                    self.set(key, built, duration)
+            return built
+
+        try:
+            return self.single_flight(key, build_and_store, result_key=key, stale=True)
+        finally:
+            self._stale.delete(key)  # Only needed while a build is in progress
+
+    def single_flight(self, name, build, result_key=None, stale=False):
+        """
+        Runs `build()` in only one process at a time, while holding a lease called `name` in the shared cache.
+        A process that finds the lease taken returns its stale value of `result_key` if `stale` is True and there is one.
+        Otherwise it waits up to `lease_wait` seconds for the build to finish and returns the value of `result_key`.
+        If there's no value to return, it runs `build()` itself.
+        Without an atomic shared cache, two processes could both take the lease, so `build()` is run directly.
+        """
+        if not self._atomic():
+            return build()
+        backend = self._backend()
+        lease_key = self._shared_key("lease:" + name)
+        token = uuid.uuid4().hex
+        if backend.add(lease_key, token, self.lease_timeout):
+            try:
+                return build()
+            finally:
+                if backend.get(lease_key) == token:
+                    backend.delete(lease_key)
+
+        if stale and result_key is not None:
+            value = self._stale.get(result_key)
+            if value is not None:
+                self.metrics.count("stale_served")
+                return value
+
+        self.metrics.count("lease_waits")
+        deadline = time.time() + self.lease_wait
+        while backend.get(lease_key) is not None and time.time() < deadline:
+            time.sleep(self.lease_poll)
+        if result_key is not None:
+            value = self.get(result_key)
+            if value is not None:
+                return value
+        logger.warning(u"Building {} in cache namespace {} without the lease".format(name, self.name))
+        return build()
+
+    def local_dict(self):
+        """
+        :return: a dict, local to this process, which is emptied when the namespace is invalidated
+        """
+        self.generation()
+        return self._local_dict
+
+    def invalidate(self):
+        """
+        Drop every key in the namespace, in every process.
+        """
+        backend = self._backend()
+        try:
+            backend.incr(self._generation_key())
+        except ValueError:  # No generation stored
+            backend.set(self._generation_key(), int(time.time() * 1000), GENERATION_DURATION)
+        self._checked_at = 0
+        self.generation()
+
+    def on_invalidate(self, listener):
+        """
+        Call `listener` whenever this process sees that the namespace was invalidated.
+        """
+        self._listeners.append(listener)
+
+    def changed(self, prefixes, tags=None):
+        """
+        Drop the keys that start with any of `prefixes` from the local tier and local_dict() of every process,
+        and call the functions registered with on_change() with `tags`.
+        Keys that were replaced or deleted in the shared cache should be passed here, so that no process
+        keeps an old value.
+        Without an atomic shared cache, where two changes could get the same number in the log, this invalidates
+        the whole namespace instead.
+        """
+        if not self._atomic():
+            self.invalidate()
+            return
+        self.generation()
+        backend = self._backend()
+        backend.add(self._change_count_key(), 0, self.duration)
+        try:
+            num = backend.incr(self._change_count_key())
+        except ValueError:  # Count expired between add() and incr()
+            self.invalidate()
+            return
+        backend.set(self._change_key(num), (prefixes, tags), self.duration)
+        if num == self._change_seen + 1:
+            self._change_seen = num
+        self.apply_change(prefixes, tags)
+
+    def apply_change(self, prefixes, tags=None):
+        """
+        Apply a change, as described in changed(), in this process only.
+        """
+        prefixes = tuple(prefixes)
+        if prefixes:
+            for key in self.local.keys():
+                if isinstance(key, basestring) and key.startswith(prefixes):
+                    self._stale.set(key, self.local.get(key))
+                    self.local.delete(key)
+                    self.metrics.deleted()
+            for key in self._local_dict.keys():
+                if isinstance(key, basestring) and key.startswith(prefixes):
+                    del self._local_dict[key]
+                    self.local_dict_metrics.deleted()
+        for listener in self._change_listeners:
+            listener(tags)
+
+    def on_change(self, listener):
+        """
+        Call `listener` with the `tags` of each change made with changed(), in this process.
+        """
+        self._change_listeners.append(listener)
+
+
+namespaces = {}
+
+
+def namespace(name, **kwargs):
+    """
+    :return: the :class:`CacheNamespace` called `name`, creating it with `kwargs` if it doesn't exist yet
+    """
+    if name not in namespaces:
+        namespaces[name] = CacheNamespace(name, **kwargs)
+    return namespaces[name]
+
+
+# Caches that only update when text index information changes: indices, parsed refs, table of contents and texts list
+texts_cache = namespace("texts")
+INDEX_CACHE_SIZE = 5000
+
+
+def deep_sizeof(obj, seen=None):
+    """
+    :return: the approximate number of bytes used by `obj` and the containers and instance dicts it refers to.
+    Objects in the set of ids `seen` are not counted again, so a set shared across calls counts shared objects once.
+    """
+    seen = set() if seen is None else seen
+    size = 0
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        if id(o) in seen or isinstance(o, (type, type(sys), type(deep_sizeof))):
+            continue
+        seen.add(id(o))
+        size += sys.getsizeof(o)
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset)):
+            stack.extend(o)
+        elif hasattr(o, "__dict__"):
+            stack.append(o.__dict__)
+    return size
+
+
+class IndexCache(object):
+    """
+    A cache of Index and CommentaryIndex objects, holding at most `max_size` of them.
+    Each is stored under its canonical title ("Rashi on Genesis" for a CommentaryIndex), and found by that
+    or by any alias it was requested under.  The least recently used object is dropped, with its aliases, when full.
+    """
+    def __init__(self, max_size=INDEX_CACHE_SIZE, metrics=None):
+        self.max_size = max_size
+        self.metrics = metrics
+        self._items = OrderedDict()  # canonical title -> instance
+        self._aliases = {}           # alias -> canonical title
+        self._alias_lists = {}       # canonical title -> aliases
+
+    def get(self, name):
+        key = self._aliases.get(name, name)
+        try:
+            instance = self._items.pop(key)
+        except KeyError:
+            return None
+        self._items[key] = instance
+        return instance
+
+    def set(self, key, instance, aliases=()):
+        self.remove(key)
+        self._items[key] = instance
+        self._alias_lists[key] = []
+        self.alias(key, aliases)
+        while len(self._items) > self.max_size:
+            self.remove(next(iter(self._items)))
+            if self.metrics:
+                self.metrics.evicted()
+
+    def alias(self, key, aliases):
+        """
+        Makes each of `aliases` find the object cached as `key`.
+        """
+        if key not in self._items:
+            return
+        for alias in aliases:
+            if alias != key and alias not in self._aliases:
+                self._aliases[alias] = key
+                self._alias_lists[key].append(alias)
+
+    def remove(self, key):
+        if self._items.pop(key, None) is None:
+            return False
+        for alias in self._alias_lists.pop(key, []):
+            del self._aliases[alias]
+        return True
+
+    def remove_where(self, test):
+        """
+        Removes the objects for which `test(instance)` is true.
+        :return: the number removed
+        """
+        keys = [key for key, instance in self._items.items() if test(instance)]
+        for key in keys:
+            self.remove(key)
+        return len(keys)
+
+    def items(self):
+        """
+        :return: list of (name, instance) for every canonical title and alias
+        """
+        return self._items.items() + [(alias, self._items[key]) for alias, key in self._aliases.items()]
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def clear(self):
+        self._items.clear()
+        self._aliases.clear()
+        self._alias_lists.clear()
+
+    def __contains__(self, name):
+        return self._aliases.get(name, name) in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def report(self):
+        """
+        :return: dict of the number of objects, commentaries and aliases cached, and their approximate size in bytes
+        """
+        return {
+            "size": len(self._items),
+            "max_size": self.max_size,
+            "commentaries": len([i for i in self._items.values() if getattr(i, "b_index", None) is not None]),
+            "aliases": len(self._aliases),
+            "bytes": deep_sizeof(self._items),
+        }
+
+
+index_cache_metrics = metrics("index_cache")
+index_cache = IndexCache(metrics=index_cache_metrics)
+index_cache_metrics.size = lambda: len(index_cache)
+django_cache_metrics = metrics("django_cache")
+
+
+def clear_index_cache():
+    index_cache_metrics.deleted(len(index_cache))
+    index_cache.clear()
+
+texts_cache.on_invalidate(clear_index_cache)
+
+
+def check_texts_cache():
+    """
+    Clears this process's caches of texts, Indexes and Refs, if another process changed the library
+    (see texts_cache).  Called at the start of each request and batch of work, rather than on every lookup,
+    which would be on the hottest paths.
+    """
+    texts_cache.generation()
 
 
 def get_index(bookname):
     res = index_cache.get(bookname)
     if res:
+        index_cache_metrics.hit()
         return res
+    index_cache_metrics.miss()
     return None
 
 
-def set_index(bookname, instance):
-    index_cache[bookname] = instance
+def set_index(key, instance, aliases=()):
+    """
+    Caches the Index or CommentaryIndex `instance` under its canonical title `key`, to be found also by `aliases`.
+    """
+    index_cache.set(key, instance, aliases)
+
+
+def alias_index(key, aliases):
+    """
+    Makes `aliases` find the Index cached under `key`.
+    """
+    index_cache.alias(key, aliases)
 
 
 def reset_texts_cache():
     """
     Resets caches that only update when text index information changes.
     """
-    import sefaria.model as model
-    global index_cache
-    index_cache = {}
-    keys = [
-        'toc_cache',
-        'toc_json_cache',
-        'texts_titles_json',
-        'texts_titles_json_he',
-        'all_titles_regex_en',
-        'all_titles_regex_he',
-        'all_titles_regex_en_commentary',
-        'all_titles_regex_he_commentary',
-        'all_titles_regex_en_terms',
-        'all_titles_regex_he_terms',
-        'all_titles_regex_en_commentary_terms',
-        'all_titles_regex_he_commentary_terms',
-        'full_title_list_en',
-        'full_title_list_he',
-        'full_title_list_en_commentary',
-        'full_title_list_he_commentary',
-        'full_title_list_en_commentators',
-        'full_title_list_he_commentators',
-        'full_title_list_en_commentators_commentary',
-        'full_title_list_he_commentators_commentary',
-        'full_title_list_en_terms',
-        'full_title_list_he_terms',
-        'full_title_list_en_commentary_terms',
-        'full_title_list_he_commentary_terms',
-        'full_title_list_en_commentators_terms',
-        'full_title_list_he_commentators_terms',
-        'full_title_list_en_commentators_commentary_terms',
-        'full_title_list_he_commentators_commentary_terms',
-        'title_node_dict_en',
-        'title_node_dict_he',
-        'title_node_dict_en_commentary',
-        'title_node_dict_he_commentary',
-        'term_dict_en',
-        'term_dict_he'
-    ]
-    for key in keys:
-        delete_cache_elem(key)
+    texts_cache.invalidate()
 
     delete_template_cache('texts_list')
     delete_template_cache('leaderboards')
-    model.Ref.clear_cache()
-    model.library.local_cache = {}
 
 
 def process_index_change_in_cache(indx, **kwargs):
-    reset_texts_cache()
+    """
+    Updates the cached title structures for a saved or renamed Index, leaving other texts' entries in place.
+    A change to a commentator touches every "X on Y" title, so resets the whole texts cache.
+    """
+    if indx.is_commentary():
+        reset_texts_cache()
+        return
+    import sefaria.model as model
+    old_titles = [kwargs.get("old") or kwargs.get("orig_vals", {}).get("title")]
+    model.library.refresh_index_in_cache(indx, old_titles=[t for t in old_titles if t])
+
+
+def process_index_delete_in_cache(indx, **kwargs):
+    if indx.is_commentary():
+        reset_texts_cache()
+        return
+    import sefaria.model as model
+    model.library.refresh_index_in_cache(indx, deleted=True)
 
 
 def process_new_commentary_version_in_cache(ver, **kwargs):
     if " on " in ver.title:
-        reset_texts_cache()
+        import sefaria.model as model
+        model.library.refresh_commentary_in_cache(ver.title)
 
 def get_cache_elem(key):
-    return cache.get(key)
+    value = cache.get(key)
+    if value is None:
+        django_cache_metrics.miss()
+    else:
+        django_cache_metrics.hit()
+    return value
+
+
+def get_cache_elems(keys):
+    """
+    :return: dict of the values of those `keys` that are in the cache
+    """
+    values = cache.get_many(keys)
+    django_cache_metrics.count("hits", len(values))
+    django_cache_metrics.count("misses", len(keys) - len(values))
+    return values
 
 
 def set_cache_elem(key, value, duration = 600000):
@@ -89,6 +777,7 @@ def set_cache_elem(key, value, duration = 600000):
 
 
 def delete_cache_elem(key):
+    django_cache_metrics.deleted()
     return cache.delete(key)
 
 
@@ -43,4 +43,25 @@ class ProfileMiddleware(object):
             if response and response.content and stats_str:
                 response.content = "<pre>" + stats_str + "</pre>"
 
-        return response
\ No newline at end of file
+        return response
+
+
+class TextsCacheMiddleware(object):
+    """
+    Drops this process's cached texts, Indexes and Refs at the start of a request,
+    if another process changed the library (see sefaria.system.cache.check_texts_cache).
+    """
+    def process_request(self, request):
+        from sefaria.system.cache import check_texts_cache
+        check_texts_cache()
+
+
+class CacheMetricsMiddleware(object):
+    """
+    Logs a line of cache metrics (see sefaria.system.cache.metrics_report) from each process,
+    at most every CACHE_METRICS_LOG_INTERVAL seconds.
+    """
+    def process_response(self, request, response):
+        from sefaria.system.cache import maybe_log_metrics
+        maybe_log_metrics(getattr(settings, "CACHE_METRICS_LOG_INTERVAL", None))
+        return response
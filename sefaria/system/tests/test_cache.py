@@ -0,0 +1,260 @@
+import threading
+import time
+
+import pytest
+
+from sefaria.system.cache import LRUCache, CacheNamespace, LocalCacheBackend, CacheMetrics, metrics_report, IndexCache, deep_sizeof
+
+
+@pytest.fixture
+def shared():
+    return LocalCacheBackend()
+
+
+def test_lru():
+    lru = LRUCache(2)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    assert lru.get("a") == 1
+    lru.set("c", 3)  # "b" is least recently used
+    assert "b" not in lru
+    assert lru.get("a") == 1
+    assert lru.get("c") == 3
+    assert len(lru) == 2
+
+
+def test_two_tiers(shared):
+    ns = CacheNamespace("test", backend=shared)
+    ns.set("k", [1, 2])
+    assert ns.get("k") == [1, 2]
+
+    other_worker = CacheNamespace("test", backend=shared)
+    assert other_worker.get("k") == [1, 2]  # from the shared cache
+
+    ns.local.clear()
+    shared.clear()
+    assert ns.get("k") is None
+
+
+def test_invalidate_other_workers(shared):
+    ns = CacheNamespace("test", backend=shared, check_interval=0)
+    other_worker = CacheNamespace("test", backend=shared, check_interval=0)
+    cleared = []
+    other_worker.on_invalidate(lambda: cleared.append(True))
+
+    ns.set("k", "v")
+    assert other_worker.get("k") == "v"
+    other_worker.local_dict()["regex"] = object()
+
+    ns.invalidate()
+    assert ns.get("k") is None
+    assert other_worker.get("k") is None
+    assert other_worker.local_dict() == {}
+    assert cleared == [True]
+
+
+def test_drop_local(shared):
+    ns = CacheNamespace("test", backend=shared)
+    other_worker = CacheNamespace("test", backend=shared)
+    ns.set("k", "old")
+    other_worker.set("k", "new")
+    assert ns.get("k") == "old"
+    ns.drop_local("k")
+    assert ns.get("k") == "new"
+
+
+def test_namespaces_are_separate(shared):
+    a = CacheNamespace("a", backend=shared, check_interval=0)
+    b = CacheNamespace("b", backend=shared, check_interval=0)
+    a.set("k", 1)
+    b.set("k", 2)
+    a.invalidate()
+    assert a.get("k") is None
+    assert b.get("k") == 2
+
+
+def test_changed(shared):
+    ns = CacheNamespace("test", backend=shared, check_interval=0)
+    other_worker = CacheNamespace("test", backend=shared, check_interval=0)
+    tags = []
+    other_worker.on_change(tags.append)
+
+    ns.set("title_list", ["Genesis"])
+    ns.set("toc", "toc")
+    other_worker.get("title_list")
+    other_worker.get("toc")
+    other_worker.local_dict()["title_regex"] = object()
+    other_worker.local_dict()["other"] = 1
+
+    ns.set("title_list", ["Genesis", "Exodus"])
+    ns.changed(["title_"], tags=["Exodus"])
+    assert other_worker.get("title_list") == ["Genesis", "Exodus"]
+    assert other_worker.local_dict() == {"other": 1}
+    assert other_worker.get("toc") == "toc"
+    assert tags == [["Exodus"]]
+
+
+def test_missing_change_clears_local(shared):
+    ns = CacheNamespace("test", backend=shared, check_interval=0)
+    other_worker = CacheNamespace("test", backend=shared, check_interval=0)
+    other_worker.local_dict()["k"] = 1
+    ns.changed(["x"])
+    shared.delete("ns:test:{}:change:1".format(ns.generation()))
+    assert other_worker.local_dict() == {}
+
+
+def test_non_atomic_backend(shared):
+    ns = CacheNamespace("test", backend=shared, check_interval=0, atomic=False)
+    other_worker = CacheNamespace("test", backend=shared, check_interval=0, atomic=False)
+    cleared = []
+    other_worker.on_invalidate(lambda: cleared.append(True))
+    ns.set("toc", "old")
+    other_worker.get("toc")
+
+    ns.changed(["x"])  # No change log to rely on, so everything goes
+    assert other_worker.get("toc") is None
+    assert cleared == [True]
+
+    shared.add("ns:test:{}:lease:toc".format(ns.generation()), "builder", 60)
+    assert ns.get_or_build("toc", lambda: "new") == "new"  # Doesn't trust the lease
+
+
+def test_local_backend_expiry():
+    backend = LocalCacheBackend()
+    backend.set("k", 1, 0.05)
+    assert backend.add("k", 2) is False
+    time.sleep(0.1)
+    assert backend.get("k") is None
+    assert backend.add("k", 2) is True
+    with pytest.raises(ValueError):
+        backend.incr("missing")
+
+
+def test_single_flight(shared):
+    builds = []
+    started = threading.Event()
+
+    def slow_build():
+        builds.append(1)
+        started.set()
+        time.sleep(0.2)
+        return "toc"
+
+    workers = [CacheNamespace("test", backend=shared, lease_poll=0.01) for i in range(4)]
+    results = []
+    first = threading.Thread(target=lambda: results.append(workers[0].get_or_build("toc", slow_build)))
+    first.start()
+    started.wait()
+    others = [threading.Thread(target=lambda w=w: results.append(w.get_or_build("toc", slow_build))) for w in workers[1:]]
+    for t in others:
+        t.start()
+    for t in [first] + others:
+        t.join()
+    assert len(builds) == 1
+    assert results == ["toc"] * 4
+
+
+def test_serves_stale_while_building(shared):
+    ns = CacheNamespace("test", backend=shared, check_interval=0)
+    other_worker = CacheNamespace("test", backend=shared, check_interval=0)
+    ns.set("toc", "old")
+    assert other_worker.get("toc") == "old"
+    ns.invalidate()
+
+    assert other_worker.get("toc") is None
+    lease = "ns:test:{}:lease:toc".format(ns.generation())
+    shared.add(lease, "builder", 60)  # Another process is building
+    assert other_worker.get_or_build("toc", lambda: "new") == "old"
+    shared.delete(lease)
+    assert other_worker.get_or_build("toc", lambda: "new") == "new"
+    assert ns.get("toc") == "new"
+
+
+def test_stale_dropped_once_rebuilt(shared):
+    ns = CacheNamespace("test", backend=shared, check_interval=0)
+    other_worker = CacheNamespace("test", backend=shared, check_interval=0)
+    ns.set("toc", "old")
+    other_worker.get("toc")
+    ns.invalidate()
+    assert other_worker.get("toc") is None
+    assert "toc" in other_worker._stale
+
+    ns.set("toc", "new")
+    assert other_worker.get("toc") == "new"
+    assert "toc" not in other_worker._stale
+    ns.invalidate()
+    assert other_worker.get_or_build("toc", lambda: "newer") == "newer"
+    assert len(other_worker._stale) == 0
+
+
+def test_waits_without_stale(shared):
+    ns = CacheNamespace("test", backend=shared, lease_wait=0.05, lease_poll=0.01)
+    shared.add("ns:test:{}:lease:toc".format(ns.generation()), "builder", 60)
+    assert ns.get_or_build("toc", lambda: "built anyway") == "built anyway"
+
+
+def test_metrics(shared):
+    ns = CacheNamespace("metered", local_size=1, backend=shared, check_interval=0)
+    ns.metrics.reset()
+    assert ns.get_or_build("a", lambda: 1) == 1
+    assert ns.get("a") == 1
+    ns.set("b", 2)  # evicts "a" from the local tier
+    assert ns.get("a") == 1  # from the shared cache, evicting "b"
+    ns.invalidate()  # deletes "a"
+    assert ns.get("b") is None
+
+    report = metrics_report()["namespace:metered"]
+    assert report["hits"] == 2
+    assert report["local_hits"] == 1
+    assert report["shared_hits"] == 1
+    assert report["misses"] == 2
+    assert report["evictions"] == 2
+    assert report["deletes"] == 1
+    assert report["invalidations"] == 1
+    assert report["builds"] == 1
+    assert report["hit_rate"] == 0.5
+
+
+def test_lru_metrics():
+    m = CacheMetrics("lru")
+    lru = LRUCache(1, metrics=m)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    assert m.report()["evictions"] == 1
+    assert m.timed(lambda x: x * 2, 2) == 4
+    assert m.report()["builds"] == 1
+
+
+class Indexed(object):
+    def __init__(self, title, b_index=None):
+        self.title = title
+        self.b_index = b_index
+
+
+def test_index_cache():
+    m = CacheMetrics("index")
+    cache = IndexCache(max_size=2, metrics=m)
+    genesis = Indexed("Genesis")
+    cache.set("Genesis", genesis, ["Bereishit", "genesis"])
+    assert cache.get("Bereishit") is genesis
+    assert cache.get("Exodus") is None
+
+    rashi = Indexed("Rashi", b_index=genesis)
+    cache.set("Rashi on Genesis", rashi, ["Rashi on Bereishit"])
+    cache.alias("Rashi on Genesis", ["Rashi on Gen."])
+    assert cache.get("Rashi on Gen.") is rashi
+    assert len(cache.items()) == 6
+    report = cache.report()
+    assert report["commentaries"] == 1
+    assert report["aliases"] == 4
+    assert report["bytes"] >= deep_sizeof(rashi)
+
+    cache.get("Genesis")
+    cache.set("Exodus", Indexed("Exodus"), ["Shemot"])  # drops "Rashi on Genesis" and its aliases
+    assert "Rashi on Bereishit" not in cache
+    assert "Bereishit" in cache
+    assert m.report()["evictions"] == 1
+
+    assert cache.remove_where(lambda i: i.title == "Genesis") == 1
+    assert cache.get("genesis") is None
+    assert len(cache) == 1
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import pytest
+import regex as re
 
 from sefaria.client.wrapper import get_links
 from sefaria.model import *
@@ -22,4 +23,37 @@ class Test_links_from_get_text():
         t1 = TextFamily(Ref("Exodus ")).contents()
         t2 = TextFamily(Ref("Exodus 1")).contents()
 
-        assert len(t1["commentary"]) == len(t2["commentary"])
\ No newline at end of file
+        assert len(t1["commentary"]) == len(t2["commentary"])
+
+class Test_LinkFilter():
+
+    def test_filter_matches_regex_filter(self):
+        links = LinkSet(Ref("Genesis 1"))
+        sources = ["Rashi on Genesis", "Midrash", "Exodus 2"]
+        regexes = [Ref(s).regex() for s in sources if s != "Midrash"] + \
+                  [Ref(s).regex() for s in library.get_indexes_in_category("Midrash")]
+        expected = [l for l in links if any([re.match(r, ref) for r in regexes for ref in l.refs])]
+        assert [l.refs for l in links.filter(sources)] == [l.refs for l in expected]
+
+    def test_matches_ref(self):
+        f = LinkFilter(["Genesis", "Exodus 2"])
+        assert f.matches_ref("Genesis 1:1")
+        assert f.matches_ref("Genesis")
+        assert not f.matches_ref("Genesis Rabbah 1:1")
+        assert f.matches_ref("Exodus 2:3")
+        assert not f.matches_ref("Exodus 3:2")
+        assert not f.matches_ref("Exodus 20:1")
+
+    def test_matches_complex_node(self):
+        f = LinkFilter(["Pesach Haggadah, Kadesh", "Pesach Haggadah, Magid, The Four Sons 1"])
+        assert "Pesach Haggadah" not in f.books
+        assert f.matches_ref("Pesach Haggadah, Kadesh 2")
+        assert not f.matches_ref("Pesach Haggadah, Karpas 1")
+        assert f.matches_ref("Pesach Haggadah, Magid, The Four Sons 1")
+        assert not f.matches_ref("Pesach Haggadah, Magid, The Four Sons 2")
+
+    def test_query_pushdown(self):
+        f = LinkFilter(["Rashi on Genesis"])
+        oref = Ref("Genesis 1")
+        pushed = LinkSet({"$and": [{"refs": {"$regex": oref.regex()}}, f.query()]})
+        assert sorted([l.refs for l in pushed]) == sorted([l.refs for l in LinkSet(oref).filter(f)])
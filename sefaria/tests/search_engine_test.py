@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from sefaria.search_engine import LocalSearchIndex, normalize, tokenize, parse_query
+
+
+def text_doc(ref, content, lang="en", path="Tanach/Torah/Genesis", order=1, order_end=None):
+    doc = {"ref": ref, "content": content, "lang": lang, "path": path, "order": order}
+    if order_end is not None:
+        doc["order_end"] = order_end
+    return doc
+
+
+@pytest.fixture
+def index(tmpdir):
+    idx = LocalSearchIndex(str(tmpdir.join("search.db")))
+    idx.add("text", text_doc("Genesis 1:2", u"And the earth was without form, and void", order=100010002), "g2")
+    idx.add("text", text_doc("Genesis 1:1", u"In the beginning God created the heaven and the earth.", order=100010001), "g1")
+    idx.add("text", text_doc("Genesis 1:1", u"בְּרֵאשִׁ֖ית בָּרָ֣א אֱלֹהִ֑ים אֵ֥ת הַשָּׁמַ֖יִם וְאֵ֥ת הָאָֽרֶץ׃", lang="he", order=100010001), "g1he")
+    idx.add("text", text_doc("Shabbat 2a:1", u"<b>The earth</b> is mentioned", path="Talmud/Bavli/Seder Moed/Shabbat", order=200000030001), "s1")
+    idx.flush()
+    yield idx
+    idx.close()
+
+
+class Test_normalize(object):
+
+    def test_strips_nikkud_and_cantillation(self):
+        assert normalize(u"בְּרֵאשִׁ֖ית") == u"בראשית"
+
+    def test_tokenize(self):
+        assert tokenize(u"<i>In</i> the Beginning, God") == [u"in", u"the", u"beginning", u"god"]
+        assert tokenize(u"הָאָֽרֶץ׃ וְהָאָ֗רֶץ") == [u"הארץ", u"והארץ"]
+        assert tokenize(u"רש״י") == [u"רשי"]
+
+    def test_parse_query(self):
+        assert parse_query(u'"the earth" god') == [[u"the", u"earth"], [u"god"]]
+
+
+class Test_LocalSearchIndex(object):
+
+    def test_words(self, index):
+        res = index.search(u"earth")
+        assert res["total"] == 3
+        assert [h["_id"] for h in res["hits"]] == ["g1", "g2", "s1"]  # sorted by order
+
+    def test_and(self, index):
+        assert [h["_id"] for h in index.search(u"earth God")["hits"]] == ["g1"]
+
+    def test_phrase(self, index):
+        assert [h["_id"] for h in index.search(u'"the earth"')["hits"]] == ["g1", "g2", "s1"]
+        assert [h["_id"] for h in index.search(u'"earth was"')["hits"]] == ["g2"]
+        assert index.search(u'"was earth"')["total"] == 0
+
+    def test_hebrew(self, index):
+        res = index.search(u'"בראשית ברא"')
+        assert [h["_id"] for h in res["hits"]] == ["g1he"]
+        assert res["hits"][0]["_source"]["ref"] == "Genesis 1:1"
+        assert index.search(u"הארץ", lang="he")["total"] == 1
+        assert index.search(u"הארץ", lang="en")["total"] == 0
+
+    def test_filters(self, index):
+        assert [h["_id"] for h in index.search(u"earth", filters=["Talmud"])["hits"]] == ["s1"]
+        assert index.search(u"earth", filters=["Tanach/Torah"])["total"] == 2
+        assert index.search(u"earth", filters=["Tanach/Tor"])["total"] == 0
+
+    def test_paging(self, index):
+        res = index.search(u"earth", page=1, size=2)
+        assert res["total"] == 3
+        assert [h["_id"] for h in res["hits"]] == ["s1"]
+
+    def test_incremental(self, index):
+        index.add("text", text_doc("Genesis 1:2", u"And the earth was without form, and void", order=100010002), "g2")
+        assert index.skipped == 1
+        index.add("text", text_doc("Genesis 1:2", u"Now the land was unformed and void", order=100010002), "g2")
+        index.flush()
+        assert index.count() == 4
+        assert index.search(u"earth")["total"] == 2
+        assert [h["_id"] for h in index.search(u"unformed")["hits"]] == ["g2"]
+
+    def test_delete(self, index):
+        index.delete("g1")
+        assert index.search(u"God")["total"] == 0
+        assert index.count() == 3
+
+    def test_discard(self, index):
+        indexed = index.indexed
+        for i in range(3):
+            index.add("text", text_doc("Genesis 1:3", u"And God said, Let there be light", order=100010003), "g3-{}".format(i))
+        index.discard()
+        assert index.search(u"light")["total"] == 0
+        assert index.count() == 4
+        assert index.indexed == indexed
+
+    def test_ties_broken_by_end(self, index):
+        index.add("text", text_doc("Genesis 1:1-2:4", u"firmament", order=100010001, order_end=100020004), "r2")
+        index.add("text", text_doc("Genesis 1:1-3", u"firmament", order=100010001, order_end=100010003), "r1")
+        index.add("text", text_doc("Genesis 1:1", u"firmament", order=100010001), "s1")
+        index.flush()
+        assert [h["_id"] for h in index.search(u"firmament")["hits"]] == ["s1", "r1", "r2"]
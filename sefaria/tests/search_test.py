@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+import json
+import threading
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from sefaria.model import *
+from sefaria.system.database import db
+import sefaria.search as search
+from sefaria.search import BulkIndexer, SearchDocHashes, LocalSearchBackend, make_text_index_document
+
+
+class StandInElasticsearch(object):
+    """
+    An in-process HTTP server that answers _bulk requests like Elasticsearch.
+    `responses` is a list of (http status, list of item statuses or None) consumed one per request.
+    When it runs out, every document is accepted, except those whose ids are in `reject`.
+    """
+    def __init__(self):
+        self.requests = []
+        self.responses = []
+        self.reject = set()
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                lines = body.strip("\n").split("\n")
+                stand_in.requests.append((self.path, lines))
+                status, item_statuses = stand_in.responses.pop(0) if stand_in.responses else (200, None)
+                if item_statuses is None:
+                    item_statuses = [400 if json.loads(lines[2 * i])["index"]["_id"] in stand_in.reject else 201 for i in range(len(lines) / 2)]
+                payload = json.dumps({
+                    "errors": any([s >= 300 for s in item_statuses]),
+                    "items": [{"index": {"_id": json.loads(lines[2 * i])["index"]["_id"], "status": s}} for i, s in enumerate(item_statuses)]
+                })
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = HTTPServer(("127.0.0.1", 0), Handler)
+        self.url = "http://127.0.0.1:{}".format(self.server.server_port)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def ids_sent(self, request_num):
+        lines = self.requests[request_num][1]
+        return [json.loads(lines[i])["index"]["_id"] for i in range(0, len(lines), 2)]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def hashes():
+    db.search_doc_hashes.remove({"_id": {"$regex": "^test_hashes:"}})
+    yield SearchDocHashes()
+    db.search_doc_hashes.remove({"_id": {"$regex": "^test_hashes:"}})
+
+
+@pytest.fixture
+def stand_in():
+    es = StandInElasticsearch()
+    yield es
+    es.close()
+
+
+class Test_BulkIndexer(object):
+
+    def test_batches_by_count(self, stand_in):
+        bulk = BulkIndexer(url=stand_in.url, index_name="test", batch_size=3, backoff=0)
+        for i in range(7):
+            bulk.add("text", {"content": u"doc {}".format(i)}, "doc{}".format(i))
+        assert len(stand_in.requests) == 2
+        bulk.flush()
+        assert len(stand_in.requests) == 3
+        assert stand_in.requests[0][0] == "/_bulk"
+        assert stand_in.ids_sent(0) == ["doc0", "doc1", "doc2"]
+        assert stand_in.ids_sent(2) == ["doc6"]
+        assert bulk.indexed == 7
+        assert bulk.failed == 0
+
+    def test_discard(self, stand_in):
+        bulk = BulkIndexer(url=stand_in.url, index_name="test", batch_size=10, backoff=0)
+        bulk.add("text", {"content": u"from a failed book"}, "doc0")
+        bulk.discard()
+        bulk.add("text", {"content": u"from the next book"}, "doc1")
+        bulk.flush()
+        assert stand_in.ids_sent(0) == ["doc1"]
+
+    def test_batches_by_bytes(self, stand_in):
+        bulk = BulkIndexer(url=stand_in.url, index_name="test", batch_size=100, batch_bytes=250, backoff=0)
+        for i in range(4):
+            bulk.add("text", {"content": "x" * 40}, "doc{}".format(i))
+        bulk.flush()
+        assert len(stand_in.requests) == 2
+        assert bulk.indexed == 4
+
+    def test_hebrew_content(self, stand_in):
+        bulk = BulkIndexer(url=stand_in.url, index_name="test", backoff=0)
+        bulk.add("text", {"content": u"בראשית ברא"}, "he1")
+        bulk.flush()
+        assert json.loads(stand_in.requests[0][1][1])["content"] == u"בראשית ברא"
+
+    def test_retries_rejected_items(self, stand_in):
+        stand_in.responses = [(200, [201, 429, 201])]
+        bulk = BulkIndexer(url=stand_in.url, index_name="test", batch_size=10, backoff=0)
+        for i in range(3):
+            bulk.add("text", {"content": "c"}, "doc{}".format(i))
+        bulk.flush()
+        assert len(stand_in.requests) == 2
+        assert stand_in.ids_sent(1) == ["doc1"]
+        assert bulk.indexed == 3
+        assert bulk.batch_size == 5  # backed off after the rejection
+
+    def test_retries_overloaded_cluster(self, stand_in):
+        stand_in.responses = [(503, []), (429, [])]
+        bulk = BulkIndexer(url=stand_in.url, index_name="test", backoff=0)
+        bulk.add("text", {"content": "c"}, "doc0")
+        bulk.flush()
+        assert len(stand_in.requests) == 3
+        assert bulk.indexed == 1
+
+    def test_gives_up(self, stand_in):
+        stand_in.responses = [(200, [400, 429])] + [(429, [])] * 3
+        bulk = BulkIndexer(url=stand_in.url, index_name="test", max_retries=2, backoff=0)
+        bulk.add("text", {"content": "c"}, "bad")
+        bulk.add("text", {"content": "c"}, "busy")
+        bulk.flush()
+        assert len(stand_in.requests) == 3
+        assert bulk.indexed == 0
+        assert bulk.failed == 2
+
+    def test_records_rejected_ids(self, stand_in):
+        stand_in.responses = [(200, [201, 400]), (500, [])]
+        bulk = BulkIndexer(url=stand_in.url, index_name="test", backoff=0)
+        bulk.add("text", {"content": "c"}, "doc0")
+        bulk.add("text", {"content": "c"}, "bad")
+        bulk.flush()
+        bulk.add("text", {"content": "c"}, "lost")
+        bulk.flush()
+        assert bulk.rejected == set(["bad", "lost"])
+
+    def test_skips_unchanged_documents(self, stand_in, hashes):
+        stand_in.responses = [(200, [201, 429])]
+        bulk = BulkIndexer(url=stand_in.url, index_name="test", backoff=0, hashes=hashes)
+        bulk.add("text", {"content": "a"}, "test_hashes:doc0")
+        bulk.add("text", {"content": "b"}, "test_hashes:doc1")
+        bulk.flush()
+        stored = db.search_doc_hashes.find({"_id": {"$regex": "^test_hashes:"}}).distinct("_id")
+        assert sorted(stored) == ["test_hashes:doc0", "test_hashes:doc1"]  # doc1 recorded only once accepted on retry
+
+        bulk.add("text", {"content": "a"}, "test_hashes:doc0")
+        bulk.add("text", {"content": "changed"}, "test_hashes:doc1")
+        bulk.flush()
+        assert stand_in.ids_sent(2) == ["test_hashes:doc1"]
+        assert hashes.skipped == 1
+        assert hashes.changed == 3
+
+    def test_unchanged(self, hashes):
+        hashes.record([("test_hashes:a", "1"), ("test_hashes:b", "2")])
+        assert hashes.unchanged([("test_hashes:a", "1"), ("test_hashes:b", "3"), ("test_hashes:c", "4")]) == set(["test_hashes:a"])
+        assert (hashes.skipped, hashes.changed) == (1, 2)
+
+
+class Test_index_from_queue(object):
+
+    def test_rejected_items_stay_queued(self, stand_in, monkeypatch):
+        class StandInBackend(search.ElasticsearchBackend):
+            def indexer(self):
+                return BulkIndexer(url=stand_in.url, index_name="test", backoff=0)
+
+        version = Ref("Ruth 1").version_list()[0]
+        vtitle, lang = version["versionTitle"], version["language"]
+        stand_in.reject = set([search.make_text_doc_id("Ruth 2:3", vtitle, lang)])
+        ids = [db.index_queue.insert({"ref": tref, "version": vtitle, "lang": lang, "type": "ref", "test_queue": True})
+               for tref in ("Ruth 1:1", "Ruth 2:3")]
+        batches = [list(db.index_queue.find({"_id": {"$in": ids}}))]
+        monkeypatch.setattr(search, "_backend", StandInBackend())
+        monkeypatch.setattr(search, "claim_queue_batch", lambda batch_size: batches.pop(0) if batches else [])
+        try:
+            search.index_from_queue()
+            remaining = [item["ref"] for item in db.index_queue.find({"test_queue": True})]
+        finally:
+            db.index_queue.remove({"test_queue": True})
+        assert remaining == ["Ruth 2:3"]
+
+
+class Test_make_text_index_document(object):
+
+    def test_text_document(self):
+        oref = Ref("Genesis 1:1")
+        for v in oref.version_list():
+            doc = make_text_index_document(oref.normal(), v["versionTitle"], v["language"])
+            assert doc["ref"] == "Genesis 1:1"
+            assert doc["content"] == TextChunk(oref, v["language"], v["versionTitle"]).text
+            assert doc["title"].endswith(u"Genesis Chapter 1 Verse 1 ({})".format(v["versionTitle"]))
+            assert doc["categories"] == ["Tanach", "Torah"]
+            assert doc["path"] == "Tanach/Torah/Genesis"
+            assert doc["order"] == oref.order_key()
+            assert doc["he_content"] == (doc["content"] if v["language"] == "he" else "")
+
+    def test_talmud_document(self):
+        oref = Ref("Shabbat 2a")
+        v = oref.version_list()[0]
+        doc = make_text_index_document(oref.normal(), v["versionTitle"], v["language"])
+        assert u"Shabbat Daf 2a ({})".format(v["versionTitle"]) in doc["title"]
+        assert doc["order"] == oref.order_key()
+
+    def test_empty_document(self):
+        assert make_text_index_document("Genesis 1:1", "No Such Version", "en") is False
+
+
+class Test_local_backend(object):
+
+    def test_index_book(self, tmpdir, monkeypatch):
+        monkeypatch.setattr(search, "_backend", LocalSearchBackend(str(tmpdir.join("search.db"))))
+        search._init_index_worker(reconnect=False)
+        title, stats = search._index_book("Ruth")
+        assert title == "Ruth"
+        assert stats["errors"] == 0
+        assert stats["docs"] > 0
+        assert search.query(u"Boaz", filters=["Tanach"])["total"] > 0
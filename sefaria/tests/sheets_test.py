@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+import time
+import regex
+
+from sefaria.model import Ref
+from sefaria.system.cache import LRUCache
+from sefaria.system.database import db
+from sefaria.sheets import ref_ranges, ref_range_query, section_key, SECTION_KEY_MAX, refine_ref_by_text, refs_in_sources, sources_hash, \
+    SectionMatcher, LISTED_SHEETS, make_sheet_list_by_tag, get_tag_sheets_page, sheet_tag_cache, invalidate_sheet_tag_cache
+
+
+def test_section_key():
+    assert section_key([1, 3]) < section_key([1, 30]) < section_key([2])
+    assert section_key([1], SECTION_KEY_MAX) > section_key([1, 999, 5])
+
+
+def test_ref_ranges_match_like_regex():
+    included = ["Genesis 1", "Genesis 1:3", "Genesis 1:30", "Genesis 1:3-2:4", "Genesis 2:1", "Genesis 1-2",
+                "Exodus 1:3", "Shabbat 2a:5", "Shabbat 2b", "Not A Real Book 3"]
+    ranges = ref_ranges(included)
+    assert len(ranges) == len(included) - 1
+    assert ranges[0] == {"ref": "Genesis 1", "book": "Genesis", "start": section_key([1]),
+                         "end": section_key([1], SECTION_KEY_MAX), "anchorVerse": 1}
+
+    def matches(tref):
+        query, matches_range = ref_range_query(Ref(tref))
+        return [r["ref"] for r in ranges if matches_range(r)]
+
+    for tref in ["Genesis 1", "Genesis 1:3", "Genesis 1:2-5", "Genesis 1-2", "Genesis", "Shabbat 2a"]:
+        oref = Ref(tref)
+        by_regex = [r["ref"] for r in ranges if regex.match(oref.regex(), r["ref"])]
+        assert set(by_regex) <= set(matches(tref)), tref
+
+    # Unlike the regex, ranges that start within the ref match too
+    assert matches("Genesis 1:3") == ["Genesis 1:3", "Genesis 1:3-2:4"]
+    assert "Genesis 1-2" in matches("Genesis 1")
+
+
+def test_section_matcher():
+    matcher = SectionMatcher([u"בְּרֵאשִׁ֖ית בָּרָ֣א", u"<b>אֱלֹהִ֑ים</b> אֵ֥ת הַשָּׁמַ֖יִם", u"וְאֵ֥ת הָאָֽרֶץ׃"])
+    assert matcher.find(u"ברא") == (1, 1)
+    assert matcher.find(u"אלהים\nאת") == (2, 2)
+    assert matcher.find(u"ברא אלהים") == (1, 2)
+    assert matcher.find(u"ברא ... ואת הארץ") == (1, 3)  # abridged
+    assert matcher.find(u"לא נמצא") is None
+    assert SectionMatcher([[u"א"], [u"ב"]]).find(u"א") is None
+
+
+def test_ref_ranges_in_complex_texts():
+    ranges = ref_ranges(["Pesach Haggadah, Kadesh 2", "Pesach Haggadah, Magid, The Four Sons 1"])
+
+    def matches(tref):
+        query, matches_range = ref_range_query(Ref(tref))
+        return [r["ref"] for r in ranges if matches_range(r)]
+
+    assert matches("Pesach Haggadah") == ["Pesach Haggadah, Kadesh 2", "Pesach Haggadah, Magid, The Four Sons 1"]
+    assert matches("Pesach Haggadah, Magid") == ["Pesach Haggadah, Magid, The Four Sons 1"]
+    assert matches("Pesach Haggadah, Kadesh") == ["Pesach Haggadah, Kadesh 2"]
+    assert matches("Pesach Haggadah, Kadesh 1") == []
+
+
+def test_refine_ref_with_cached_matchers():
+    matchers = LRUCache(10)
+    matchers.set("Genesis 1", SectionMatcher([u"אבג", u"דהו זח", u"טי"]))  # Stands in for the stored text
+    assert refine_ref_by_text("Genesis 1", u"<b>דהו</b>", matchers) == "Genesis 1:2"
+    assert refine_ref_by_text("Genesis 1:5", u"זח טי", matchers) == "Genesis 1:2-3"
+    sources = [{"ref": "Genesis 1", "text": {"he": u"טי"}, "subsources": [{"ref": "Exodus 2"}]}]
+    assert refs_in_sources(sources, matchers) == ["Genesis 1:3", "Exodus 2"]
+
+
+def test_sources_hash():
+    sources = [{"ref": "Genesis 1", "text": {"he": u"א", "en": u"a"}}]
+    assert sources_hash(sources) == sources_hash([{"text": {"en": u"a", "he": u"א"}, "ref": "Genesis 1"}])
+    assert sources_hash(sources) != sources_hash(sources + [{"ref": "Genesis 2"}])
+
+
+def test_sheet_list_by_tag():
+    counts = {}
+    for sheet in db.sheets.find({"status": {"$in": LISTED_SHEETS}}, {"tags": 1}):
+        for tag in sheet.get("tags", []):
+            counts[tag] = counts.get(tag, 0) + 1
+
+    tags = make_sheet_list_by_tag()
+    assert [t["tag"] for t in tags] == sorted(counts.keys())
+    for tag in tags:
+        assert tag["count"] == counts[tag["tag"]] == len(tag["sheets"])
+        views = [sheet["views"] for sheet in tag["sheets"]]
+        assert views == sorted(views, reverse=True)
+
+
+def test_tag_sheets_page():
+    invalidate_sheet_tag_cache()
+    sheets = [{"id": i, "title": "Sheet %d" % i, "views": 10 - i} for i in range(5)]
+    sheet_tag_cache.set("directory", {"built": time.time(), "tags": [{"tag": "Shabbat", "count": 5, "sheets": sheets}]})
+
+    page = get_tag_sheets_page("Shabbat", page=1, size=2)
+    assert page["count"] == 5
+    assert [sheet["id"] for sheet in page["sheets"]] == [2, 3]
+    assert get_tag_sheets_page("Shabbat", page=3, size=2)["sheets"] == []
+    assert get_tag_sheets_page("No Such Tag") is None
+
+    # A rebuilt directory is indexed again
+    sheet_tag_cache.set("directory", {"built": time.time() + 1, "tags": [{"tag": "Pesach", "count": 0, "sheets": []}]})
+    assert get_tag_sheets_page("Shabbat") is None
+    assert get_tag_sheets_page("Pesach")["count"] == 0
+
+    invalidate_sheet_tag_cache()
+    assert sheet_tag_cache.get("directory") is None
+    assert "by_tag" not in sheet_tag_cache.local_dict()
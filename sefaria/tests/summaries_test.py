@@ -3,6 +3,7 @@ import pytest
 import sefaria.summaries as s
 import sefaria.model as model
 import sefaria.system.cache as scache
+from sefaria.system.database import db
 from sefaria.utils.testing_utils import *
 
 #create, update, delete, change categories
@@ -15,7 +16,7 @@ from sefaria.utils.testing_utils import *
 
 text_titles = model.VersionSet({}).distinct('title')
 s.update_table_of_contents()
-scache.delete_cache_elem('toc_cache')
+scache.texts_cache.delete('toc_cache')
 
 
 """ THE TESTS """
@@ -115,6 +116,33 @@ class Test_Toc(object):
     def test_text_change(self):
         pass
 
+    def test_preloaded_toc(self):
+        # The preloaded rebuild must build the same TOC as the text by text one, which scripts/profile_toc.py times
+        scache.clear_index_cache()
+        text_by_text = s.build_toc_tree(preload=False)
+        scache.clear_index_cache()
+        assert s.build_toc_tree(preload=True) == text_by_text
+
+    def test_toc_patches(self):
+        s.update_table_of_contents()
+        assert db.summaries.find_one({"name": "toc"})["patch_list"] == []
+
+        s.update_summaries_on_change("Genesis", recount=False)
+        doc = db.summaries.find_one({"name": "toc"})
+        assert doc["patches"] == 1
+        assert doc["patch_list"][0]["text"]["title"] == "Genesis"
+        assert s.get_toc_from_db() == s.get_toc()
+
+        s.compact_toc_in_db()
+        compacted = db.summaries.find_one({"name": "toc"})
+        assert compacted["patch_list"] == []
+        assert compacted["version"] == doc["version"] + 1
+        assert s.get_toc_from_db() == s.get_toc()
+
+        scache.texts_cache.delete('toc_cache')
+        s.save_toc_to_db()  # Falls back to the stored TOC, rather than saving None
+        assert s.get_toc_from_db() == s.get_toc()
+
     @pytest.mark.deep
     def test_index_title_change(self):
         old_title = 'Likutei Moharan'
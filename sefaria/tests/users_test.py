@@ -0,0 +1,26 @@
+from sefaria.utils import users
+from sefaria.utils.users import resolve_users, user_link, user_name, forget_user
+
+
+def test_resolve_unknown_users():
+    resolved = resolve_users([-7, "-8", None])
+    assert resolved[-7]["name"] == "User -7"
+    assert resolved[-7]["found"] is False
+    assert resolved[-7]["full_name"] == "User -7"
+    assert resolved["-8"]["link"] == "<a href='#' class='userLink'>User -8</a>"
+    assert resolved[None]["name"] == "User None"
+    assert user_name(-7) == "User -7"
+    assert user_link(-7) == resolved[-7]["link"]
+
+
+def test_user_cache_expiry():
+    resolve_users([-9])
+    assert -9 in users.user_cache
+    expiry, record = users.user_cache[-9]
+    users.user_cache[-9] = (0, dict(record, name="Stale"))
+    counters = dict(users.user_cache_metrics.counters)
+    assert user_name(-9) == "User -9"
+    assert users.user_cache_metrics.counters["evictions"] == counters["evictions"] + 1
+    forget_user(-9)
+    assert -9 not in users.user_cache
+    assert users.user_cache_metrics.counters["deletes"] == counters["deletes"] + 1
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+import sefaria.system.cache as scache
+from sefaria.model import library, Ref
+from sefaria.warmup import warm_caches, read_refs, WARMUP_STAGES
+
+
+def test_warm_caches(tmpdir):
+    refs_file = tmpdir.join("refs.txt")
+    refs_file.write("Genesis 1:1\n\nNot A Book 3\nExodus 2\nLeviticus 4\n")
+    refs = read_refs(str(refs_file), 3)
+    assert refs == [u"Genesis 1:1", u"Not A Book 3", u"Exodus 2"]
+
+    scache.reset_texts_cache()
+    timings = warm_caches(refs)
+    assert timings.keys() == WARMUP_STAGES.keys() + ["refs"]
+    assert "all_titles_regex_en_terms" in library.local_cache
+    assert "category_id_dict" in library.local_cache
+    assert scache.texts_cache.get("toc_json_cache")
+    assert "Exodus 2" in Ref._raw_cache()
@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+
+from sefaria.utils.util import string_overlap, prefix_table
+
+
+def test_prefix_table():
+    assert prefix_table(u"abab") == [0, 0, 1, 2]
+    assert prefix_table(u"aaa") == [0, 1, 2]
+
+
+def test_string_overlap():
+    assert string_overlap(u"abcdef", u"defgh") == 3
+    assert string_overlap(u"abab", u"ababab") == 4
+    assert string_overlap(u"abc", u"xyz") == 0
+    assert string_overlap(u"", u"abc") == 0
+    assert string_overlap(u"xaaa", u"aab", prefix_table(u"aab")) == 2
+    assert string_overlap(u"a" * 5000 + u"b", u"a" * 5000 + u"b") == 5001
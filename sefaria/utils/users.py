@@ -4,41 +4,108 @@ users.py - dealing with Sefaria users and user settings
 Writes to MongoDB Collection: profiles
 """
 import sys
+import time
+import hashlib
+import urllib
+
 from sefaria.system.database import db
+import sefaria.system.cache as scache
 
 if not hasattr(sys, '_doc_build'):
 	from django.contrib.auth.models import User
 
 
-def user_name(uid):
-	"""Returns a string of a user's full name"""
-	try:
-		uid  = int(uid)
-		user = User.objects.get(id=uid)
-		name = user.first_name + " " + user.last_name
-		name = "Anonymous" if name == " " else name
-	except:
+USER_CACHE_TTL = 60 * 10  # seconds a user's name and profile slug are kept before being read again
+USER_CACHE_SIZE = 10000  # users held before expired entries are swept out
+
+# uid -> (expiry time, user record).  See resolve_users().
+user_cache = {}
+user_cache_metrics = scache.metrics("users", size=lambda: len(user_cache))
+
+
+def gravatar_url(email, size=80):
+	"""Returns the url of the gravatar image of `email`, `size` pixels square"""
+	default_image = "http://www.sefaria.org/static/img/profile-default.png"
+	return "http://www.gravatar.com/avatar/" + hashlib.md5(email.lower()).hexdigest() + "?" + urllib.urlencode({'d': default_image, 's': str(size)})
+
+
+def _user_record(uid, user, profile):
+	if user:
+		full_name = user.first_name + " " + user.last_name
+		name = "Anonymous" if full_name == " " else full_name
+	else:
 		# Don't choke on unknown users, just leave a placeholder
 		# (so that testing on history can happen without needing the user DB)
-		name = "User {}".format(uid)
-	return name
+		name = full_name = "User {}".format(uid)
+	slug = profile.get("slug", None) if profile else None
+	url  = "/profile/" + slug if slug else "#"
+	return {
+		"found": user is not None,
+		"name":  name,
+		"full_name": full_name,
+		"email": user.email if user else "test@sefaria.org",
+		"slug":  slug,
+		"link":  "<a href='" + url + "' class='userLink'>" + name + "</a>",
+	}
+
+
+def resolve_users(uids):
+	"""
+	Returns a dict of uid -> {"found", "name", "full_name", "email", "slug", "link"} for each of `uids`.
+	"full_name" is the user's first and last names as stored, where "name" shows "Anonymous" if both are blank.
+	Users not read in the last USER_CACHE_TTL seconds are loaded together, with one query for
+	their names and one for their profiles.
+	"""
+	now = time.time()
+	keys = {}
+	missing = set()
+	for uid in set(uids):
+		try:
+			keys[uid] = int(uid)
+		except (TypeError, ValueError):
+			keys[uid] = None
+			continue
+		cached = user_cache.get(keys[uid])
+		if cached and cached[0] > now:
+			user_cache_metrics.hit()
+		else:
+			if cached:
+				user_cache_metrics.evicted()  # Expired, and replaced below
+			user_cache_metrics.miss()
+			missing.add(keys[uid])
+
+	if missing:
+		missing = list(missing)
+		try:
+			users = {user.id: user for user in User.objects.filter(id__in=missing)}
+		except:
+			users = {}
+		profiles = {p["id"]: p for p in db.profiles.find({"id": {"$in": missing}}, {"id": 1, "slug": 1})}
+		for key in missing:
+			user_cache[key] = (now + USER_CACHE_TTL, _user_record(key, users.get(key), profiles.get(key)))
+		if len(user_cache) > USER_CACHE_SIZE:
+			expired = [key for key, cached in user_cache.iteritems() if cached[0] <= now]
+			for key in expired:
+				del user_cache[key]
+			user_cache_metrics.evicted(len(expired))
+
+	return {uid: user_cache[key][1] if key is not None else _user_record(uid, None, None) for uid, key in keys.iteritems()}
+
+
+def forget_user(uid):
+	"""Drops `uid` from the cache of resolve_users(), after a change to their name or profile"""
+	if user_cache.pop(int(uid), None):
+		user_cache_metrics.deleted()
+
+
+def user_name(uid):
+	"""Returns a string of a user's full name"""
+	return resolve_users([uid])[uid]["name"]
 
 
-# Simple Cache for user links
-user_links = {}
 def user_link(uid):
 	"""Returns a string with an <a> tag linking to a users profile"""
-	if uid in user_links:
-		return user_links[uid]
-	
-	name    = user_name(uid)
-	profile = db.profiles.find_one({"id": uid})
-	slug    = profile.get("slug", None) if profile else None
-	url     = "/profile/" + slug if slug else "#"
-
-	link = "<a href='" + url + "' class='userLink'>" + name + "</a>"
-	user_links[uid] = link
-	return link
+	return resolve_users([uid])[uid]["link"]
 
 
 def is_user_staff(uid):
@@ -105,39 +105,41 @@ def text_preview(en, he):
         return [text_preview(x[0], x[1]) for x in zipped]
 
 
-def string_overlap(text1, text2):
+def prefix_table(pattern):
+    """
+    Returns the Knuth-Morris-Pratt table of `pattern`: for each i, the length of the longest proper
+    prefix of pattern[:i+1] that is also a suffix of it.
+    """
+    table = [0] * len(pattern)
+    k = 0
+    for i in range(1, len(pattern)):
+        while k and pattern[i] != pattern[k]:
+            k = table[k - 1]
+        if pattern[i] == pattern[k]:
+            k += 1
+        table[i] = k
+    return table
+
+
+def string_overlap(text1, text2, table=None):
     """
     Returns the number of characters that the end of text1 overlaps the beginning of text2.
-    https://neil.fraser.name/news/2010/11/04/
+    Runs in time linear in the length of the texts, by matching the end of text1 against
+    the prefix_table() of text2, which may be passed as `table` if already computed.
     """
-    # Cache the text lengths to prevent multiple calls.
-    text1_length = len(text1)
-    text2_length = len(text2)
-    # Eliminate the null case.
-    if text1_length == 0 or text2_length == 0:
+    if not text1 or not text2:
         return 0
-    # Truncate the longer string.
-    if text1_length > text2_length:
-        text1 = text1[-text2_length:]
-    elif text1_length < text2_length:
-        text2 = text2[:text1_length]
-    # Quick check for the worst case.
-    if text1 == text2:
-        return min(text1_length, text2_length)
- 
-    # Start by looking for a single character match
-    # and increase length until no match is found.
-    best = 0
-    length = 1
-    while True:
-        pattern = text1[-length:]
-        found = text2.find(pattern)
-        if found == -1:
-            return best
-        length += found
-        if text1[-length:] == text2[:length]:
-            best = length
-            length += 1
+    # Only as much of each text as the other is long can overlap.
+    text1 = text1[-len(text2):]
+    text2 = text2[:len(text1)]
+    table = table or prefix_table(text2)
+    k = 0
+    for c in text1:
+        while k and (k == len(text2) or text2[k] != c):
+            k = table[k - 1]
+        if text2[k] == c:
+            k += 1
+    return k
 
 
 def td_format(td_object):
@@ -34,7 +34,7 @@ from sefaria.export import export_all as start_export_all
 from sefaria.datatype.jagged_array import JaggedTextArray
 
 # noinspection PyUnresolvedReferences
-from sefaria.utils.users import user_links
+from sefaria.utils.users import user_cache
 from sefaria.system.exceptions import InputError
 from sefaria.system.database import db
 from sefaria.utils.hebrew import is_hebrew
@@ -231,8 +231,7 @@ def bulktext_api(request, refs):
 @staff_member_required
 def reset_cache(request):
     scache.reset_texts_cache()
-    global user_links
-    user_links = {}
+    user_cache.clear()
     return HttpResponseRedirect("/?m=Cache-Reset")
 
 """@staff_member_required
@@ -294,7 +293,10 @@ def delete_citation_links(request, title):
 @staff_member_required
 def cache_stats(request):
     resp = {
-        'ref_cache_size': model.Ref.cache_size()
+        'ref_cache_size': model.Ref.cache_size(),
+        'caches': scache.metrics_report(),
+        'index_cache': scache.index_cache.report(),
+        'text_family_cache': model.text.text_family_cache_report(),
     }
     return jsonResponse(resp)
 
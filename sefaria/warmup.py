@@ -0,0 +1,126 @@
+"""
+warmup.py - populates the caches that are otherwise built by the first requests after a deploy or a cache reset.
+
+Run it with ``python manage.py warm_caches``, or from each web server process as it starts with :func:`post_fork`.
+Values already in the shared cache are only loaded into the process, so warming many processes at once
+builds each value once (see :meth:`sefaria.system.cache.CacheNamespace.get_or_build`).
+"""
+import time
+from collections import OrderedDict
+
+import logging
+logger = logging.getLogger(__name__)
+
+import sefaria.system.cache as scache
+from sefaria.model import library, Ref
+from sefaria.summaries import get_toc, get_toc_json, category_id_dict, order_base_table
+from sefaria.system.exceptions import InputError
+from sefaria.settings import WARMUP_REFS_PATH, WARMUP_REF_COUNT
+
+LANGS = ["en", "he"]
+
+
+def warm_title_structures():
+    for lang in LANGS:
+        library.get_term_dict(lang)
+        library.get_title_node_dict(lang)
+        library.get_title_node_dict(lang, with_commentary=True)
+
+
+def warm_title_lists():
+    for lang in LANGS:
+        library.full_title_list(lang)
+        library.full_title_list(lang, with_commentary=True, with_commentators=False)
+        library.get_text_titles_json(lang)
+
+
+def warm_title_regexes():
+    for lang in LANGS:
+        library.all_titles_regex(lang)
+        library.all_titles_regex(lang, with_terms=True)
+    library.all_titles_regex("en", commentary=True)  # There is no Hebrew commentary regex
+
+
+def warm_toc():
+    get_toc()
+    get_toc_json()
+    category_id_dict()
+    order_base_table()
+
+
+def warm_template_fragments():
+    from django.template.loader import render_to_string
+    render_to_string("elements/texts_list.html", {"toc": get_toc()})
+
+
+# In dependency order: title lists are made from the title structures, and regexes from the title lists.
+WARMUP_STAGES = OrderedDict([
+    ("title_structures", warm_title_structures),
+    ("title_lists", warm_title_lists),
+    ("title_regexes", warm_title_regexes),
+    ("toc", warm_toc),
+    ("template_fragments", warm_template_fragments),
+])
+
+
+def read_refs(path, count):
+    """
+    :return: list of the first `count` refs in the file at `path`, which has one ref per line, most requested first
+    """
+    refs = []
+    with open(path) as f:
+        for line in f:
+            tref = line.strip().decode("utf-8")
+            if tref:
+                refs.append(tref)
+            if len(refs) >= count:
+                break
+    return refs
+
+
+def preload_refs(trefs):
+    """
+    Loads `trefs` into the Ref cache.
+    :return: the number of refs loaded
+    """
+    loaded = 0
+    for tref in trefs:
+        try:
+            Ref(tref)
+            loaded += 1
+        except InputError:
+            logger.warning(u"Can't preload unknown ref {}".format(tref))
+    return loaded
+
+
+def warm_caches(refs=None):
+    """
+    Runs each stage of WARMUP_STAGES, then preloads `refs`, if given.
+    :param refs: list of refs to load into the Ref cache
+    :return: OrderedDict of stage name -> seconds it took
+    """
+    stages = WARMUP_STAGES.items()
+    if refs:
+        stages.append(("refs", lambda: preload_refs(refs)))
+
+    scache.check_texts_cache()
+    timings = OrderedDict()
+    for name, warm in stages:
+        start = time.time()
+        warm()
+        timings[name] = time.time() - start
+        logger.info(u"Warmed {} in {:.2f}s".format(name, timings[name]))
+    return timings
+
+
+def post_fork(server=None, worker=None):
+    """
+    Warms the caches of a newly started web server process, preloading the first WARMUP_REF_COUNT refs
+    listed in WARMUP_REFS_PATH.  Can serve directly as gunicorn's post_fork hook.
+    Errors are logged rather than raised, so that a failed warm-up doesn't keep the process from serving.
+    """
+    try:
+        refs = read_refs(WARMUP_REFS_PATH, WARMUP_REF_COUNT) if WARMUP_REFS_PATH and WARMUP_REF_COUNT else None
+        warm_caches(refs)
+    except Exception:
+        logger.exception(u"Cache warm-up failed")
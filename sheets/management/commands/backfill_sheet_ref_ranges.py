@@ -0,0 +1,17 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from sefaria.sheets import backfill_ref_ranges
+
+
+class Command(BaseCommand):
+    help = "Adds included_ref_ranges, the indexed form of included_refs, to sheets that don't have it yet."
+    option_list = BaseCommand.option_list + (
+        make_option("--batch-size", dest="batch_size", type="int", default=500,
+                    help="Number of sheets read at a time"),
+    )
+
+    def handle(self, *args, **options):
+        count = backfill_ref_ranges(batch_size=options["batch_size"])
+        self.stdout.write("Updated {} sheets\n".format(count))
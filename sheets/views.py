@@ -22,7 +22,7 @@ from sefaria.client.util import jsonResponse, HttpResponse
 from sefaria.sheets import *
 from sefaria.model.user_profile import *
 from sefaria.model.group import Group, GroupSet
-from sefaria.utils.users import user_link
+from sefaria.utils.users import resolve_users
 from sefaria.system.exceptions import InputError
 
 # sefaria.model.dependencies makes sure that model listeners are loaded.
@@ -30,19 +30,34 @@ from sefaria.system.exceptions import InputError
 import sefaria.model.dependencies
 
 
-def annotate_user_links(sources):
+def annotate_user_links(sources, users=None):
 	"""
 	Search a sheet for any addedBy fields (containg a UID) and add corresponding user links.
 	"""
+	if users is None:
+		users = resolve_users(added_by(sources))
 	for source in sources:
 		if "addedBy" in source:
-			source["userLink"] = user_link(source["addedBy"])
+			source["userLink"] = users[source["addedBy"]]["link"]
 		if "subsources" in source:
-			source["subsources"] = annotate_user_links(source["subsources"])
+			source["subsources"] = annotate_user_links(source["subsources"], users)
 
 	return sources
 
 
+def added_by(sources):
+	"""
+	Returns the set of uids in the addedBy fields of sources and their subsources.
+	"""
+	uids = set()
+	for source in sources:
+		if "addedBy" in source:
+			uids.add(source["addedBy"])
+		if "subsources" in source:
+			uids |= added_by(source["subsources"])
+	return uids
+
+
 @ensure_csrf_cookie
 def new_sheet(request):
 	"""
@@ -179,6 +194,8 @@ def delete_sheet_api(request, sheet_id):
 		return jsonResponse({"error": "Only the sheet owner may delete a sheet."})
 
 	db.sheets.remove({"id": id})
+	if sheet["status"] in LISTED_SHEETS and sheet.get("tags"):
+		invalidate_sheet_tag_cache()
 
 	return jsonResponse({"status": "ok"})
 
@@ -359,7 +376,7 @@ def sheets_tags_list(request):
 	"""
 	View public sheets organied by tags.
 	"""
-	tags_list = make_sheet_list_by_tag()
+	tags_list = get_sheet_list_by_tag()
 	return render_to_response('sheet_tags.html', {"tags_list": tags_list, }, RequestContext(request))	
 
 
@@ -521,6 +538,25 @@ def update_sheet_tags_api(request, sheet_id):
 	return jsonResponse(update_sheet_tags(int(sheet_id), tags))
 
 
+def tag_sheets_api(request, tag):
+	"""
+	API to get a page of the public sheets tagged with 'tag', most viewed first.
+	Takes "page" (from 0) and "size" parameters.
+	"""
+	try:
+		page = int(request.GET.get("page", 0))
+		size = min(int(request.GET.get("size", SHEET_TAG_PAGE_SIZE)), 500)
+	except ValueError:
+		return jsonResponse({"error": "page and size must be numbers."})
+	if page < 0 or size < 1:
+		return jsonResponse({"error": "page and size must be positive."})
+
+	result = get_tag_sheets_page(tag, page=page, size=size)
+	if not result:
+		return jsonResponse({"error": "No public sheets are tagged %s." % tag})
+	return jsonResponse(result)
+
+
 def like_sheet_api(request, sheet_id):
 	"""
 	API to like sheet_id.